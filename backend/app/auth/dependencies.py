@@ -1,25 +1,30 @@
 import base64
-import json
+import hashlib
 import logging
 import os
 import threading
 import time
 import uuid
+from collections import OrderedDict
 from datetime import datetime
 from urllib.parse import urlparse
-from urllib.request import Request as UrlRequest
-from urllib.request import urlopen
 
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
 from jose.exceptions import JWTClaimsError
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 from dotenv import load_dotenv
 
+from app.auth.jwks import JwksCache
+from app.auth.user_cache import claims_digest, get_cached_user, remember_user
 from app.db.models.user import User
-from app.db.session import get_db
-from app.subscriptions.service import ensure_starter_subscription
+from app.db.session import get_async_db, get_db
+from app.subscriptions.entitlements import entitlements
+from app.subscriptions.service import build_starter_subscription, ensure_starter_subscription
 
 load_dotenv()
 
@@ -28,8 +33,9 @@ SUPABASE_PROJECT_REF = os.getenv("SUPABASE_PROJECT_REF", "")
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_DATABASE_URL = os.getenv("SUPABASE_DATABASE_URL", "")
 SUPABASE_JWT_SECRET = os.getenv("SUPABASE_JWT_SECRET", "")
-SUPABASE_JWKS_TTL_SECONDS = int(os.getenv("SUPABASE_JWKS_TTL_SECONDS", "3600"))
+SUPABASE_JWKS_URL = os.getenv("SUPABASE_JWKS_URL", "")
 JWT_ALGORITHMS = ["ES256", "HS256"]
+JWT_CLAIMS_CACHE_SIZE = int(os.getenv("JWT_CLAIMS_CACHE_SIZE", "10000"))
 DEBUG_AUTH = os.getenv("DEBUG_AUTH", "").lower() in {"1", "true", "yes"} or os.getenv("ENV", "local").lower() == "local"
 
 logger = logging.getLogger("app.auth")
@@ -37,8 +43,9 @@ logger = logging.getLogger("app.auth")
 bearer_scheme = HTTPBearer(auto_error=False)
 
 
-_jwks_cache: dict = {"keys": [], "expires_at": 0.0}
-_jwks_lock = threading.Lock()
+# Verified claims by token hash, dropped once the token expires.
+_claims_cache: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+_claims_lock = threading.Lock()
 
 
 def _extract_project_ref_from_url(url: str) -> str:
@@ -71,7 +78,77 @@ def _get_supabase_project_ref() -> str:
 	return _extract_project_ref_from_db_url(SUPABASE_DATABASE_URL)
 
 
+def _secret_candidates(secret: str) -> list[bytes | str]:
+	if not secret:
+		return []
+	candidates: list[bytes | str] = [secret]
+	try:
+		candidates.append(base64.b64decode(secret))
+	except Exception:
+		pass
+	try:
+		padded = secret + "=" * (-len(secret) % 4)
+		candidates.append(base64.urlsafe_b64decode(padded))
+	except Exception:
+		pass
+	unique: list[bytes | str] = []
+	for candidate in candidates:
+		if candidate and candidate not in unique:
+			unique.append(candidate)
+	return unique
+
+
+def _issuer_candidates() -> list[str]:
+	base_issuer = f"https://{_get_supabase_project_ref()}.supabase.co"
+	return [f"{base_issuer}/auth/v1", base_issuer]
+
+
+_AUDIENCE_VALUES = [value.strip() for value in SUPABASE_JWT_AUDIENCE.split(",") if value.strip()]
+_AUDIENCE = _AUDIENCE_VALUES[0] if len(_AUDIENCE_VALUES) == 1 else None
+_DECODE_OPTIONS = {"verify_aud": bool(_AUDIENCE), "verify_iss": True}
+_ISSUERS = _issuer_candidates()
+_HS256_CANDIDATES = [(secret, issuer) for secret in _secret_candidates(SUPABASE_JWT_SECRET) for issuer in _ISSUERS]
+# Index of the candidate that verified the last token, tried first next time.
+_preferred_candidate = {"HS256": 0, "ES256": 0}
+
+
+def _ordered(alg: str, candidates: list) -> list[tuple[int, object]]:
+	preferred = _preferred_candidate[alg]
+	indexed = list(enumerate(candidates))
+	if 0 < preferred < len(indexed):
+		indexed.insert(0, indexed.pop(preferred))
+	return indexed
+
+
+def _cached_claims(cache_key: str) -> dict | None:
+	with _claims_lock:
+		entry = _claims_cache.get(cache_key)
+		if entry is None:
+			return None
+		if entry[0] <= time.time():
+			del _claims_cache[cache_key]
+			return None
+		_claims_cache.move_to_end(cache_key)
+		return entry[1]
+
+
+def _remember_claims(cache_key: str, claims: dict) -> None:
+	try:
+		expires_at = float(claims["exp"])
+	except (KeyError, TypeError, ValueError):
+		return
+	if JWT_CLAIMS_CACHE_SIZE <= 0:
+		return
+	with _claims_lock:
+		_claims_cache[cache_key] = (expires_at, claims)
+		_claims_cache.move_to_end(cache_key)
+		while len(_claims_cache) > JWT_CLAIMS_CACHE_SIZE:
+			_claims_cache.popitem(last=False)
+
+
 def _jwks_url() -> str:
+	if SUPABASE_JWKS_URL:
+		return SUPABASE_JWKS_URL
 	project_ref = _get_supabase_project_ref()
 	if not project_ref:
 		raise HTTPException(
@@ -81,42 +158,15 @@ def _jwks_url() -> str:
 	return f"https://{project_ref}.supabase.co/auth/v1/.well-known/jwks.json"
 
 
-def _fetch_jwks() -> list[dict]:
-	request = UrlRequest(_jwks_url(), headers={"Accept": "application/json"})
-	with urlopen(request, timeout=5) as response:
-		payload = response.read()
-	data = json.loads(payload.decode("utf-8"))
-	keys = data.get("keys", []) if isinstance(data, dict) else []
-	if not isinstance(keys, list):
-		return []
-	if DEBUG_AUTH:
-		logger.info("Loaded JWKS keys: %s", [key.get("kid") for key in keys if isinstance(key, dict)])
-	return keys
-
-
-def _get_jwks(force_refresh: bool = False) -> list[dict]:
-	now = time.time()
-	with _jwks_lock:
-		if not force_refresh and _jwks_cache["keys"] and now < _jwks_cache["expires_at"]:
-			return _jwks_cache["keys"]
-		keys = _fetch_jwks()
-		ttl = max(SUPABASE_JWKS_TTL_SECONDS, 60)
-		_jwks_cache.update({"keys": keys, "expires_at": now + ttl})
-		return keys
-
-
-def _get_signing_key(kid: str) -> dict:
-	keys = _get_jwks()
-	for key in keys:
-		if key.get("kid") == kid:
-			return key
+_jwks = JwksCache(_jwks_url)
+
+
+def _get_signing_key(kid: str):
+	key = _jwks.get(kid)
+	if key is not None:
+		return key
 	if DEBUG_AUTH:
-		logger.warning("Supabase JWKS kid not found: %s", kid)
-	# Key rotation: refresh once and retry
-	keys = _get_jwks(force_refresh=True)
-	for key in keys:
-		if key.get("kid") == kid:
-			return key
+		logger.warning("Supabase JWKS kid not found: %s (known: %s)", kid, _jwks.kids())
 	raise HTTPException(
 		status_code=status.HTTP_401_UNAUTHORIZED,
 		detail="Invalid or expired Supabase token",
@@ -125,6 +175,24 @@ def _get_signing_key(kid: str) -> dict:
 
 
 def _decode_supabase_token(token: str) -> dict:
+	cache_key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+	claims = _cached_claims(cache_key)
+	if claims is None:
+		claims = _verify_supabase_token(token)
+		_remember_claims(cache_key, claims)
+	return claims
+
+
+async def _decode_supabase_token_async(token: str) -> dict:
+	# Cache hits are a dict lookup; a full verification may fetch JWKS, so
+	# it runs off the event loop.
+	claims = _cached_claims(hashlib.sha256(token.encode("utf-8")).hexdigest())
+	if claims is not None:
+		return claims
+	return await run_in_threadpool(_decode_supabase_token, token)
+
+
+def _verify_supabase_token(token: str) -> dict:
 	try:
 		header = jwt.get_unverified_header(token)
 	except JWTError as exc:
@@ -146,46 +214,28 @@ def _decode_supabase_token(token: str) -> dict:
 			headers={"WWW-Authenticate": "Bearer"},
 		)
 
-	audience_values = [value.strip() for value in SUPABASE_JWT_AUDIENCE.split(",") if value.strip()]
-	audience = audience_values[0] if len(audience_values) == 1 else None
-	base_issuer = f"https://{_get_supabase_project_ref()}.supabase.co"
-	issuer_candidates = [f"{base_issuer}/auth/v1", base_issuer]
-	options = {"verify_aud": bool(audience), "verify_iss": True}
-
 	try:
 		if alg == "HS256":
-			if not SUPABASE_JWT_SECRET:
+			if not _HS256_CANDIDATES:
 				raise HTTPException(
 					status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
 					detail="Supabase JWT secret is not configured",
 				)
 
-			secret_candidates: list[bytes | str] = [SUPABASE_JWT_SECRET]
-			try:
-				secret_candidates.append(base64.b64decode(SUPABASE_JWT_SECRET))
-			except Exception:
-				pass
-			try:
-				padded = SUPABASE_JWT_SECRET + "=" * (-len(SUPABASE_JWT_SECRET) % 4)
-				secret_candidates.append(base64.urlsafe_b64decode(padded))
-			except Exception:
-				pass
-
-			for secret in secret_candidates:
-				for issuer in issuer_candidates:
-					try:
-						return jwt.decode(
-							token,
-							secret,
-							algorithms=["HS256"],
-							audience=audience,
-							issuer=issuer,
-							options=options,
-						)
-					except JWTClaimsError:
-						pass
-					except JWTError:
-						pass
+			for index, (secret, issuer) in _ordered("HS256", _HS256_CANDIDATES):
+				try:
+					claims = jwt.decode(
+						token,
+						secret,
+						algorithms=["HS256"],
+						audience=_AUDIENCE,
+						issuer=issuer,
+						options=_DECODE_OPTIONS,
+					)
+				except JWTError:
+					continue
+				_preferred_candidate["HS256"] = index
+				return claims
 			raise JWTClaimsError("Invalid issuer")
 
 		kid = header.get("kid")
@@ -197,18 +247,20 @@ def _decode_supabase_token(token: str) -> dict:
 			)
 
 		signing_key = _get_signing_key(kid)
-		for issuer in issuer_candidates:
+		for index, issuer in _ordered("ES256", _ISSUERS):
 			try:
-				return jwt.decode(
+				claims = jwt.decode(
 					token,
 					signing_key,
 					algorithms=["ES256"],
-					audience=audience,
+					audience=_AUDIENCE,
 					issuer=issuer,
-					options=options,
+					options=_DECODE_OPTIONS,
 				)
 			except JWTClaimsError:
-				pass
+				continue
+			_preferred_candidate["ES256"] = index
+			return claims
 		raise JWTClaimsError("Invalid issuer")
 	except JWTClaimsError as exc:
 		if DEBUG_AUTH:
@@ -271,19 +323,51 @@ def _extract_user_id(payload: dict) -> uuid.UUID:
 		) from exc
 
 
-def _sync_user(db: Session, user_id: uuid.UUID, payload: dict) -> User:
+def _ensure_subscription(db: Session, user: User, request: Request | None) -> None:
+	# The entitlement lookup is cached and reused by usage accounting, so the
+	# starter check costs no query for users that already have a plan.
+	if entitlements.get(db, user.id, request).has_subscription:
+		return
+	ensure_starter_subscription(db, user)
+	entitlements.invalidate(user.id, request)
+
+
+def _create_user(db: Session, user_id: uuid.UUID, email: str | None, full_name: str | None) -> User:
+	"""First login: insert the user and its starter subscription in one transaction."""
+	now = datetime.utcnow()
+	try:
+		inserted = db.execute(
+			pg_insert(User)
+			.values(id=user_id, email=email, full_name=full_name, created_at=now, updated_at=now)
+			.on_conflict_do_nothing(index_elements=[User.id])
+			.returning(User.id)
+		).scalar_one_or_none()
+		# A concurrent first request may have created the row already; it
+		# also created the subscription.
+		if inserted is not None:
+			db.add(build_starter_subscription(db, user_id, now))
+		db.commit()
+	except BaseException:
+		db.rollback()
+		raise
+	entitlements.invalidate(user_id)
+	return db.get(User, user_id)
+
+
+def _sync_user(db: Session, user_id: uuid.UUID, payload: dict, request: Request | None = None) -> User:
 	email = payload.get("email")
 	metadata = payload.get("user_metadata") or {}
 	full_name = metadata.get("full_name") or metadata.get("name")
-	now = datetime.utcnow()
+	digest = claims_digest(email, full_name)
+
+	cached = get_cached_user(db, user_id, digest)
+	if cached is not None:
+		return cached
 
 	user = db.get(User, user_id)
 	if not user:
-		user = User(id=user_id, email=email, full_name=full_name)
-		db.add(user)
-		db.commit()
-		db.refresh(user)
-		ensure_starter_subscription(db, user)
+		user = _create_user(db, user_id, email, full_name)
+		remember_user(user, digest)
 		return user
 
 	updated = False
@@ -294,16 +378,18 @@ def _sync_user(db: Session, user_id: uuid.UUID, payload: dict) -> User:
 		user.full_name = full_name
 		updated = True
 	if updated:
-		user.touch(now)
+		user.touch(datetime.utcnow())
 		db.add(user)
 		db.commit()
 		db.refresh(user)
 
-	ensure_starter_subscription(db, user)
+	_ensure_subscription(db, user, request)
+	remember_user(user, digest)
 	return user
 
 
 def get_current_user(
+	request: Request,
 	credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
 	db: Session = Depends(get_db),
 ) -> User:
@@ -317,7 +403,7 @@ def get_current_user(
 		)
 	payload = _decode_supabase_token(credentials.credentials)
 	user_id = _extract_user_id(payload)
-	return _sync_user(db, user_id, payload)
+	return _sync_user(db, user_id, payload, request)
 
 
 def get_current_claims(
@@ -338,6 +424,7 @@ def get_current_claims(
 
 
 def get_optional_user(
+	request: Request,
 	credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
 	db: Session = Depends(get_db),
 ) -> User | None:
@@ -346,11 +433,52 @@ def get_optional_user(
 	try:
 		payload = _decode_supabase_token(credentials.credentials)
 		user_id = _extract_user_id(payload)
-		return _sync_user(db, user_id, payload)
+		return _sync_user(db, user_id, payload, request)
+	except HTTPException as exc:
+		if exc.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN):
+			return None
+		raise
+
+
+async def get_current_user_async(
+	request: Request,
+	credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
+	db: AsyncSession = Depends(get_async_db),
+) -> User:
+	if not credentials:
+		if DEBUG_AUTH:
+			logger.warning("Missing authorization token")
+		raise HTTPException(
+			status_code=status.HTTP_401_UNAUTHORIZED,
+			detail="Missing authorization token",
+			headers={"WWW-Authenticate": "Bearer"},
+		)
+	payload = await _decode_supabase_token_async(credentials.credentials)
+	user_id = _extract_user_id(payload)
+	return await db.run_sync(_sync_user, user_id, payload, request)
+
+
+async def get_optional_user_async(
+	request: Request,
+	credentials: HTTPAuthorizationCredentials | None = Depends(bearer_scheme),
+	db: AsyncSession = Depends(get_async_db),
+) -> User | None:
+	if not credentials:
+		return None
+	try:
+		payload = await _decode_supabase_token_async(credentials.credentials)
+		user_id = _extract_user_id(payload)
+		return await db.run_sync(_sync_user, user_id, payload, request)
 	except HTTPException as exc:
 		if exc.status_code in (status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN):
 			return None
 		raise
 
 
-__all__ = ["get_current_user", "get_optional_user", "get_current_claims"]
+__all__ = [
+	"get_current_user",
+	"get_current_user_async",
+	"get_optional_user",
+	"get_optional_user_async",
+	"get_current_claims",
+]
@@ -0,0 +1,165 @@
+"""Supabase JWKS cache with stale-while-revalidate refresh.
+
+Keys are parsed into ``jose`` key objects once per fetch. Requests never
+wait on the network while usable keys are cached: once a key set is older
+than JWKS_REFRESH_AHEAD of its TTL a background thread refetches it, and
+the old keys keep being served until that succeeds, however long it takes. Only
+a cold start, or an unknown ``kid`` after JWKS_MIN_REFRESH_SECONDS have
+passed since the last fetch, fetches inline, and then a single request does
+the fetch while concurrent ones wait for its result. Unknown kids are
+remembered for JWKS_UNKNOWN_KID_TTL_SECONDS so a flood of forged kids
+cannot turn into a flood of fetches; at most JWKS_UNKNOWN_KID_MAX of them
+are kept, least recently seen dropped first. A kid dropped early can at
+worst cause one more fetch, and fetches stay spaced by
+JWKS_MIN_REFRESH_SECONDS.
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable
+from urllib.request import Request as UrlRequest
+from urllib.request import urlopen
+
+from jose import jwk
+from jose.backends.base import Key
+
+SUPABASE_JWKS_TTL_SECONDS = int(os.getenv("SUPABASE_JWKS_TTL_SECONDS", "3600"))
+JWKS_REFRESH_AHEAD = float(os.getenv("JWKS_REFRESH_AHEAD", "0.8"))
+JWKS_MIN_REFRESH_SECONDS = float(os.getenv("JWKS_MIN_REFRESH_SECONDS", "30"))
+JWKS_UNKNOWN_KID_TTL_SECONDS = float(os.getenv("JWKS_UNKNOWN_KID_TTL_SECONDS", "300"))
+JWKS_UNKNOWN_KID_MAX = int(os.getenv("JWKS_UNKNOWN_KID_MAX", "1024"))
+JWKS_FETCH_TIMEOUT_SECONDS = float(os.getenv("JWKS_FETCH_TIMEOUT_SECONDS", "5"))
+
+logger = logging.getLogger("app.auth")
+
+
+def fetch_jwks(url: str, timeout: float = JWKS_FETCH_TIMEOUT_SECONDS) -> list[dict]:
+	request = UrlRequest(url, headers={"Accept": "application/json"})
+	with urlopen(request, timeout=timeout) as response:
+		payload = response.read()
+	data = json.loads(payload.decode("utf-8"))
+	keys = data.get("keys", []) if isinstance(data, dict) else []
+	if not isinstance(keys, list):
+		return []
+	return [key for key in keys if isinstance(key, dict)]
+
+
+def parse_jwks(keys: list[dict]) -> dict[str, Key]:
+	parsed: dict[str, Key] = {}
+	for key in keys:
+		kid = key.get("kid")
+		if not kid:
+			continue
+		try:
+			parsed[kid] = jwk.construct(key, key.get("alg") or "ES256")
+		except Exception:
+			logger.warning("Skipping unusable JWKS key %s", kid)
+	return parsed
+
+
+class JwksCache:
+	def __init__(
+		self,
+		url: Callable[[], str],
+		ttl_seconds: float = SUPABASE_JWKS_TTL_SECONDS,
+		refresh_ahead: float = JWKS_REFRESH_AHEAD,
+		min_refresh_seconds: float = JWKS_MIN_REFRESH_SECONDS,
+		unknown_kid_ttl_seconds: float = JWKS_UNKNOWN_KID_TTL_SECONDS,
+		unknown_kid_max: int = JWKS_UNKNOWN_KID_MAX,
+		fetch: Callable[[str], list[dict]] = fetch_jwks,
+	) -> None:
+		self.url = url
+		self.ttl_seconds = max(ttl_seconds, 60)
+		self.refresh_ahead = refresh_ahead
+		self.min_refresh_seconds = min_refresh_seconds
+		self.unknown_kid_ttl_seconds = unknown_kid_ttl_seconds
+		self.unknown_kid_max = max(1, unknown_kid_max)
+		self._fetch = fetch
+		self._keys: dict[str, Key] = {}
+		self._fetched_at = 0.0
+		self._attempted_at = float("-inf")
+		self._unknown: OrderedDict[str, float] = OrderedDict()
+		self._lock = threading.Lock()
+		self._fetch_lock = threading.Lock()
+		self._refreshing = False
+
+	def _refresh(self, requested_at: float) -> None:
+		"""Fetch the key set unless a fetch was attempted after ``requested_at``.
+
+		Callers queue on the fetch lock, so concurrent requests share one
+		fetch (and one failure) instead of each making their own.
+		"""
+		with self._fetch_lock:
+			if self._attempted_at >= requested_at:
+				return
+			self._attempted_at = time.monotonic()
+			try:
+				keys = parse_jwks(self._fetch(self.url()))
+			except Exception:
+				logger.exception("JWKS refresh failed; serving cached keys")
+				return
+			with self._lock:
+				self._keys = keys
+				self._fetched_at = time.monotonic()
+				self._unknown = OrderedDict((kid, until) for kid, until in self._unknown.items() if kid not in keys)
+			logger.info("Loaded JWKS keys: %s", sorted(keys))
+
+	def _refresh_in_background(self, requested_at: float) -> None:
+		def run() -> None:
+			try:
+				self._refresh(requested_at)
+			finally:
+				with self._lock:
+					self._refreshing = False
+
+		with self._lock:
+			if self._refreshing:
+				return
+			self._refreshing = True
+		threading.Thread(target=run, name="jwks-refresh", daemon=True).start()
+
+	def get(self, kid: str) -> Key | None:
+		requested_at = time.monotonic()
+		with self._lock:
+			has_keys = bool(self._keys)
+			age = requested_at - self._fetched_at
+			unknown_until = self._unknown.get(kid, 0.0)
+
+		if not has_keys:
+			self._refresh(requested_at)
+		elif age >= self.ttl_seconds * self.refresh_ahead and requested_at - self._attempted_at >= self.min_refresh_seconds:
+			self._refresh_in_background(requested_at)
+
+		keys = self._keys
+		key = keys.get(kid)
+		if key is not None or not keys:
+			# Without any keys (JWKS unreachable) there is nothing to compare
+			# the kid against, so it is not negative-cached.
+			return key
+		if unknown_until > requested_at:
+			return None
+
+		# Possibly a rotated key: refetch, but at most every min_refresh_seconds.
+		with self._lock:
+			may_refresh = requested_at - self._attempted_at >= self.min_refresh_seconds
+		if may_refresh:
+			self._refresh(requested_at)
+			key = self._keys.get(kid)
+			if key is not None:
+				return key
+		with self._lock:
+			self._unknown[kid] = requested_at + self.unknown_kid_ttl_seconds
+			self._unknown.move_to_end(kid)
+			while len(self._unknown) > self.unknown_kid_max:
+				self._unknown.popitem(last=False)
+		return None
+
+	def kids(self) -> list[str]:
+		return sorted(self._keys)
+
+
+__all__ = ["JwksCache", "fetch_jwks", "parse_jwks"]
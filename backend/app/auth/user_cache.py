@@ -0,0 +1,104 @@
+"""Process-level cache of synced users.
+
+``_sync_user`` runs on every authenticated request. Once a user row is
+known to match the token's profile claims, its column values are kept here
+for USER_SYNC_TTL_SECONDS and later requests with the same claims rebuild a
+detached ``User`` from them without touching the database. Code that
+changes a user row must call ``invalidate_user``.
+
+``invalidate_user`` only reaches this process. So that other workers do not
+keep serving an account that was scheduled for deletion or purged, the
+cache also watches a deletion stamp (count and latest
+``delete_requested_at`` of accounts pending deletion, read through their
+partial index) every USER_SYNC_DELETION_POLL_SECONDS and drops everything
+when it changes. Until then other workers may still serve the old row;
+profile edits made on another worker can show for up to
+USER_SYNC_TTL_SECONDS.
+"""
+
+import hashlib
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from sqlalchemy import func, select
+from sqlalchemy import inspect as sa_inspect
+from sqlalchemy.orm import Session, make_transient_to_detached
+
+from app.db.models.user import User
+
+USER_SYNC_TTL_SECONDS = float(os.getenv("USER_SYNC_TTL_SECONDS", "300"))
+USER_SYNC_CACHE_MAX_USERS = int(os.getenv("USER_SYNC_CACHE_MAX_USERS", "10000"))
+USER_SYNC_DELETION_POLL_SECONDS = float(os.getenv("USER_SYNC_DELETION_POLL_SECONDS", "5"))
+
+_COLUMNS = [column.key for column in sa_inspect(User).column_attrs]
+
+_cache: OrderedDict[uuid.UUID, tuple[float, str, dict]] = OrderedDict()
+_lock = threading.Lock()
+_deletion_stamp: tuple | None = None
+_deletion_checked_at = float("-inf")
+
+
+def claims_digest(email: str | None, full_name: str | None) -> str:
+	return hashlib.sha256(f"{email or ''}\x00{full_name or ''}".encode("utf-8")).hexdigest()
+
+
+def _check_deletions(db: Session, now: float) -> None:
+	global _deletion_checked_at, _deletion_stamp
+	with _lock:
+		if now - _deletion_checked_at < USER_SYNC_DELETION_POLL_SECONDS:
+			return
+		# Claimed before querying, so one request polls for everyone.
+		_deletion_checked_at = now
+	# Not under the lock: this may run inside ``AsyncSession.run_sync`` on
+	# the event-loop thread, where the query yields to other requests.
+	stamp = tuple(
+		db.execute(
+			select(func.count(User.id), func.max(User.delete_requested_at)).where(
+				User.delete_requested_at.isnot(None)
+			)
+		).one()
+	)
+	with _lock:
+		if _deletion_stamp is not None and stamp != _deletion_stamp:
+			_cache.clear()
+		_deletion_stamp = stamp
+
+
+def get_cached_user(db: Session, user_id: uuid.UUID, digest: str) -> User | None:
+	now = time.monotonic()
+	if USER_SYNC_TTL_SECONDS > 0:
+		_check_deletions(db, now)
+	with _lock:
+		entry = _cache.get(user_id)
+		if not entry or entry[0] <= now or entry[1] != digest:
+			return None
+		_cache.move_to_end(user_id)
+		values = entry[2]
+	user = User(**values)
+	make_transient_to_detached(user)
+	return user
+
+
+def remember_user(user: User, digest: str) -> None:
+	if USER_SYNC_TTL_SECONDS <= 0:
+		return
+	values = {key: getattr(user, key) for key in _COLUMNS}
+	with _lock:
+		_cache[user.id] = (time.monotonic() + USER_SYNC_TTL_SECONDS, digest, values)
+		_cache.move_to_end(user.id)
+		while len(_cache) > USER_SYNC_CACHE_MAX_USERS:
+			_cache.popitem(last=False)
+
+
+def invalidate_user(user_id: uuid.UUID | None = None) -> None:
+	with _lock:
+		if user_id is None:
+			_cache.clear()
+		else:
+			_cache.pop(user_id, None)
+
+
+__all__ = ["claims_digest", "get_cached_user", "invalidate_user", "remember_user"]
@@ -1,4 +1,248 @@
-"""Rate limiting helpers (placeholder).
+"""In-process daily quota counters for anonymous callers.
 
-Legacy OTP limits were removed in favor of Supabase Auth.
+Anonymous usage is counted per ``anon:{ip}``, tool and day. Checking that
+against the ``usage`` table costs a write transaction per request, which
+lets bots turn traffic into database load. ``AnonymousRateLimiter`` keeps
+the counters in sharded in-memory maps instead, rejects over-limit callers
+without touching the database, and hands the accumulated increments to
+``app.usage.tracker.flush_anonymous_usage`` every
+ANON_RATE_LIMIT_FLUSH_SECONDS.
+
+Each worker counts on its own; the totals written by a flush are read back
+so workers converge on the shared count. Until then a worker only knows its
+own count: a new or restarted worker starts every counter at 0 until its
+first flush, and between flushes an anonymous caller spread over N workers
+can use up to N times the daily limit. Setting ANON_RATE_LIMIT_REDIS_URL
+(requires the ``redis`` package) moves the counters into Redis, which makes
+the limit exact across workers; the database flush works the same way.
+Request handlers use ``consume_async`` so Redis is never waited on from the
+event-loop thread.
 """
+
+import logging
+import os
+import threading
+import zlib
+from dataclasses import dataclass
+from datetime import datetime
+
+try:
+    import redis
+    import redis.asyncio as redis_asyncio
+except ImportError:
+    redis = None
+    redis_asyncio = None
+
+ANON_RATE_LIMIT_ENABLED = os.getenv("ANON_RATE_LIMIT_ENABLED", "1").lower() in {"1", "true", "yes"}
+ANON_RATE_LIMIT_SHARDS = int(os.getenv("ANON_RATE_LIMIT_SHARDS", "16"))
+ANON_RATE_LIMIT_FLUSH_SECONDS = float(os.getenv("ANON_RATE_LIMIT_FLUSH_SECONDS", "10"))
+ANON_RATE_LIMIT_REDIS_URL = os.getenv("ANON_RATE_LIMIT_REDIS_URL", "")
+
+logger = logging.getLogger("app.rate_limit")
+
+# INCRBY, undone when it would pass the limit; the key expires with its day.
+_REDIS_CONSUME = """
+local used = redis.call('INCRBY', KEYS[1], ARGV[1])
+if used == tonumber(ARGV[1]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+if used > tonumber(ARGV[2]) then
+    redis.call('DECRBY', KEYS[1], ARGV[1])
+    return -1
+end
+return used
+"""
+
+CounterKey = tuple[str, str, datetime]
+
+
+@dataclass
+class PendingUsage:
+    anon_key: str
+    tool: str
+    period_start: datetime
+    amount: int
+    limit: int
+
+
+class _Shard:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        # key -> [used, pending, limit]
+        self.counters: dict[CounterKey, list[int]] = {}
+
+
+class AnonymousRateLimiter:
+    def __init__(
+        self,
+        shards: int = ANON_RATE_LIMIT_SHARDS,
+        enabled: bool = ANON_RATE_LIMIT_ENABLED,
+        redis_url: str = ANON_RATE_LIMIT_REDIS_URL,
+    ) -> None:
+        self.enabled = enabled
+        self._shards = [_Shard() for _ in range(max(1, shards))]
+        self._stats_lock = threading.Lock()
+        self._allowed = 0
+        self._rejected = 0
+        self._flushed = 0
+        self._redis = None
+        self._redis_consume = None
+        self._redis_consume_async = None
+        if enabled and redis_url:
+            if redis is None:
+                logger.warning("ANON_RATE_LIMIT_REDIS_URL is set but redis is not installed; counting in memory")
+            else:
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.5)
+                self._redis_consume = self._redis.register_script(_REDIS_CONSUME)
+                self._redis_consume_async = redis_asyncio.Redis.from_url(
+                    redis_url, socket_timeout=0.5
+                ).register_script(_REDIS_CONSUME)
+
+    @property
+    def backend(self) -> str:
+        return "redis" if self._redis is not None else "memory"
+
+    def _shard(self, anon_key: str) -> _Shard:
+        return self._shards[zlib.crc32(anon_key.encode("utf-8")) % len(self._shards)]
+
+    @staticmethod
+    def _redis_key(key: CounterKey) -> str:
+        anon_key, tool, period_start = key
+        return f"usage:{anon_key}:{tool}:{period_start:%Y%m%d}"
+
+    def _consume_redis(self, key: CounterKey, amount: int, limit: int, ttl_seconds: int) -> int | None:
+        used = int(self._redis_consume(keys=[self._redis_key(key)], args=[amount, limit, ttl_seconds]))
+        return None if used < 0 else used
+
+    async def _consume_redis_async(self, key: CounterKey, amount: int, limit: int, ttl_seconds: int) -> int | None:
+        used = int(await self._redis_consume_async(keys=[self._redis_key(key)], args=[amount, limit, ttl_seconds]))
+        return None if used < 0 else used
+
+    def _consume_local(self, key: CounterKey, amount: int, limit: int, remote_used: int | None) -> int | None:
+        shard = self._shard(key[0])
+        with shard.lock:
+            counter = shard.counters.setdefault(key, [0, 0, limit])
+            if remote_used is None and counter[0] + amount > limit:
+                used = None
+            else:
+                counter[0] = remote_used if remote_used is not None else counter[0] + amount
+                counter[1] += amount
+                counter[2] = limit
+                used = counter[0]
+        self._count(allowed=used is not None)
+        return used
+
+    def consume(
+        self,
+        anon_key: str,
+        tool: str,
+        amount: int,
+        limit: int,
+        period_start: datetime,
+        ttl_seconds: int,
+    ) -> int | None:
+        """Count ``amount`` against the day's limit; None when it would pass it.
+
+        Blocks on Redis when it is configured; use ``consume_async`` on the
+        event loop.
+        """
+        key = (anon_key, tool, period_start)
+        remote_used = None
+        if self._redis is not None:
+            try:
+                remote_used = self._consume_redis(key, amount, limit, ttl_seconds)
+            except Exception:
+                logger.exception("Redis rate limit check failed; counting in memory")
+            else:
+                if remote_used is None:
+                    self._count(allowed=False)
+                    return None
+        return self._consume_local(key, amount, limit, remote_used)
+
+    async def consume_async(
+        self,
+        anon_key: str,
+        tool: str,
+        amount: int,
+        limit: int,
+        period_start: datetime,
+        ttl_seconds: int,
+    ) -> int | None:
+        """Like ``consume``, talking to Redis without blocking the event loop."""
+        key = (anon_key, tool, period_start)
+        remote_used = None
+        if self._redis_consume_async is not None:
+            try:
+                remote_used = await self._consume_redis_async(key, amount, limit, ttl_seconds)
+            except Exception:
+                logger.exception("Redis rate limit check failed; counting in memory")
+            else:
+                if remote_used is None:
+                    self._count(allowed=False)
+                    return None
+        return self._consume_local(key, amount, limit, remote_used)
+
+    def drain(self, current_period_start: datetime) -> list[PendingUsage]:
+        """Take the increments counted since the last drain.
+
+        Counters of earlier days are dropped once nothing is pending for them.
+        """
+        drained: list[PendingUsage] = []
+        for shard in self._shards:
+            with shard.lock:
+                for key, counter in list(shard.counters.items()):
+                    anon_key, tool, period_start = key
+                    if counter[1]:
+                        drained.append(PendingUsage(anon_key, tool, period_start, counter[1], counter[2]))
+                        counter[1] = 0
+                    elif period_start < current_period_start:
+                        del shard.counters[key]
+        return drained
+
+    def restore(self, pending: list[PendingUsage]) -> None:
+        """Put back increments whose flush failed, for the next attempt."""
+        for item in pending:
+            shard = self._shard(item.anon_key)
+            with shard.lock:
+                counter = shard.counters.setdefault((item.anon_key, item.tool, item.period_start), [0, 0, item.limit])
+                counter[1] += item.amount
+
+    def observe(self, anon_key: str, tool: str, period_start: datetime, used: int) -> None:
+        """Raise a local counter to the stored total, which includes other workers."""
+        shard = self._shard(anon_key)
+        with shard.lock:
+            counter = shard.counters.get((anon_key, tool, period_start))
+            if counter is not None:
+                counter[0] = max(counter[0], used)
+
+    def record_flush(self, rows: int) -> None:
+        with self._stats_lock:
+            self._flushed += rows
+
+    def _count(self, allowed: bool) -> None:
+        with self._stats_lock:
+            if allowed:
+                self._allowed += 1
+            else:
+                self._rejected += 1
+
+    def metrics(self) -> dict:
+        counters = 0
+        for shard in self._shards:
+            with shard.lock:
+                counters += len(shard.counters)
+        with self._stats_lock:
+            return {
+                "enabled": self.enabled,
+                "backend": self.backend,
+                "shards": len(self._shards),
+                "counters": counters,
+                "allowed": self._allowed,
+                "rejected": self._rejected,
+                "flushed_rows": self._flushed,
+            }
+
+
+anon_limiter = AnonymousRateLimiter()
+
+__all__ = ["AnonymousRateLimiter", "PendingUsage", "anon_limiter"]
@@ -0,0 +1,211 @@
+"""Periodic maintenance tasks.
+
+Every web process starts one ``Scheduler`` thread, but each task runs only
+once per interval across the deployment:
+
+* ``cluster`` tasks (database cleanup) take a transaction-level Postgres
+  advisory lock and skip the run when ``scheduler_runs`` shows another
+  process finished one within the interval. The lock is held by an open
+  transaction rather than the session, so it also works behind
+  transaction-mode poolers.
+* ``host`` tasks (temporary files) take a non-blocking ``flock`` on a lock
+  file shared by the processes of one machine and deployment directory.
+
+Per-task stats (runs, skips, rows or files removed, duration, last error)
+are published through ``scheduler.metrics()``.
+"""
+
+import fcntl
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Iterator
+
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.engine import Engine
+
+from app.db.models.scheduler_run import SchedulerRun
+from app.usage.tracker import cleanup_usage
+from app.users.service import cleanup_deleted_users
+from app.utils.storage import cleanup_old_files
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "1").lower() in {"1", "true", "yes"}
+USAGE_CLEANUP_INTERVAL_SECONDS = float(os.getenv("USAGE_CLEANUP_INTERVAL_SECONDS", str(6 * 60 * 60)))
+USER_CLEANUP_INTERVAL_SECONDS = float(os.getenv("USER_CLEANUP_INTERVAL_SECONDS", str(6 * 60 * 60)))
+FILE_CLEANUP_INTERVAL_SECONDS = float(os.getenv("FILE_CLEANUP_INTERVAL_SECONDS", str(5 * 60)))
+
+logger = logging.getLogger("app.scheduler")
+
+
+@dataclass
+class TaskStats:
+    runs: int = 0
+    skipped: int = 0
+    failures: int = 0
+    removed_total: int = 0
+    last_removed: int | None = None
+    last_duration_seconds: float | None = None
+    last_finished_at: str | None = None
+    last_error: str | None = None
+
+
+@dataclass
+class ScheduledTask:
+    name: str
+    interval_seconds: float
+    run: Callable[[], int]
+    scope: str = "cluster"
+    next_run: float = 0.0
+    stats: TaskStats = field(default_factory=TaskStats)
+
+
+class Scheduler:
+    def __init__(self, engine: Engine, lock_dir: str | None = None) -> None:
+        self.engine = engine
+        self.lock_dir = lock_dir or tempfile.gettempdir()
+        self._tasks: list[ScheduledTask] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def add(self, name: str, interval_seconds: float, run: Callable[[], int], scope: str = "cluster") -> None:
+        if scope not in {"cluster", "host"}:
+            raise ValueError(f"Unknown scheduler scope: {scope}")
+        self._tasks.append(ScheduledTask(name=name, interval_seconds=interval_seconds, run=run, scope=scope))
+
+    @contextmanager
+    def _cluster_slot(self, task: ScheduledTask) -> Iterator[bool]:
+        key = zlib.crc32(f"caniedit:scheduler:{task.name}".encode("utf-8"))
+        with self.engine.connect() as connection, connection.begin():
+            if not connection.execute(select(func.pg_try_advisory_xact_lock(key))).scalar():
+                yield False
+                return
+            # Compared in SQL: the column is TIMESTAMPTZ in the Supabase
+            # schema but naive when created from the model. A little slack,
+            # so workers started together do not skip a round.
+            recent = connection.execute(
+                select(SchedulerRun.name).where(
+                    SchedulerRun.name == task.name,
+                    SchedulerRun.finished_at > func.now() - timedelta(seconds=task.interval_seconds * 0.9),
+                )
+            ).first()
+            if recent is not None:
+                yield False
+                return
+            yield True
+            values = {
+                "finished_at": func.now(),
+                "removed": task.stats.last_removed or 0,
+                "duration_ms": int((task.stats.last_duration_seconds or 0) * 1000),
+            }
+            connection.execute(
+                pg_insert(SchedulerRun)
+                .values(name=task.name, **values)
+                .on_conflict_do_update(index_elements=[SchedulerRun.name], set_=values)
+            )
+
+    @contextmanager
+    def _host_slot(self, task: ScheduledTask) -> Iterator[bool]:
+        digest = hashlib.sha256(os.getcwd().encode("utf-8")).hexdigest()[:12]
+        path = os.path.join(self.lock_dir, f"caniedit-{task.name}-{digest}.lock")
+        with open(path, "a") as handle:
+            try:
+                fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                yield False
+                return
+            try:
+                yield True
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+    def run_task(self, task: ScheduledTask) -> None:
+        slot = self._cluster_slot if task.scope == "cluster" else self._host_slot
+        stats = task.stats
+        try:
+            with slot(task) as acquired:
+                if not acquired:
+                    with self._lock:
+                        stats.skipped += 1
+                    return
+                started = time.perf_counter()
+                removed = task.run()
+                with self._lock:
+                    stats.runs += 1
+                    stats.removed_total += removed
+                    stats.last_removed = removed
+                    stats.last_duration_seconds = round(time.perf_counter() - started, 3)
+                    stats.last_finished_at = datetime.utcnow().isoformat()
+                    stats.last_error = None
+                logger.info("%s removed %s in %.3fs", task.name, removed, stats.last_duration_seconds)
+        except Exception as exc:
+            logger.exception("Scheduled task %s failed", task.name)
+            with self._lock:
+                stats.failures += 1
+                stats.last_error = str(exc)[:500]
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            now = time.monotonic()
+            for task in self._tasks:
+                if self._stop.is_set():
+                    return
+                if task.next_run <= now:
+                    self.run_task(task)
+                    task.next_run = time.monotonic() + task.interval_seconds
+            upcoming = min((task.next_run for task in self._tasks), default=now + 60)
+            self._stop.wait(max(1.0, upcoming - time.monotonic()))
+
+    def start(self) -> None:
+        if self._thread is not None or not self._tasks:
+            return
+        self._thread = threading.Thread(target=self._loop, name="scheduler", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                task.name: {
+                    "scope": task.scope,
+                    "interval_seconds": task.interval_seconds,
+                    **vars(task.stats),
+                }
+                for task in self._tasks
+            }
+
+
+def _with_session(session_factory, cleanup: Callable) -> Callable[[], int]:
+    def run() -> int:
+        with session_factory() as db:
+            return cleanup(db)
+
+    return run
+
+
+def build_scheduler(engine: Engine, session_factory) -> Scheduler:
+    scheduler = Scheduler(engine)
+    if SCHEDULER_ENABLED:
+        scheduler.add("usage_cleanup", USAGE_CLEANUP_INTERVAL_SECONDS, _with_session(session_factory, cleanup_usage))
+        scheduler.add(
+            "deleted_users_cleanup",
+            USER_CLEANUP_INTERVAL_SECONDS,
+            _with_session(session_factory, cleanup_deleted_users),
+        )
+        scheduler.add("temp_files_cleanup", FILE_CLEANUP_INTERVAL_SECONDS, cleanup_old_files, scope="host")
+    return scheduler
+
+
+__all__ = ["Scheduler", "ScheduledTask", "TaskStats", "build_scheduler"]
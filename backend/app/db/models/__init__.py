@@ -1,8 +1,10 @@
 from app.db.models.file import FileRecord
+from app.db.models.job import PdfJob
 from app.db.models.plan import Plan
+from app.db.models.scheduler_run import SchedulerRun
 from app.db.models.subscription import Subscription
 from app.db.models.tool import ToolDefinition
 from app.db.models.usage import Usage
 from app.db.models.user import User
 
-__all__ = ["FileRecord", "Plan", "Subscription", "ToolDefinition", "Usage", "User"]
+__all__ = ["FileRecord", "PdfJob", "Plan", "SchedulerRun", "Subscription", "ToolDefinition", "Usage", "User"]
@@ -0,0 +1,30 @@
+from datetime import datetime
+import uuid
+
+from sqlalchemy import JSON, Column, DateTime, ForeignKey, Index, Integer, String
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.base import Base
+
+
+class PdfJob(Base):
+    __tablename__ = "pdf_jobs"
+    __table_args__ = (Index("pdf_jobs_status_created_idx", "status", "created_at"),)
+
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    user_id = Column(UUID(as_uuid=True), ForeignKey("users.id"), index=True, nullable=True)
+    tool = Column(String(100), nullable=False)
+    status = Column(String(20), nullable=False, default="queued")
+    progress = Column(Integer, nullable=False, default=0)
+    params = Column(JSON, nullable=False, default=dict)
+    input_paths = Column(JSON, nullable=False, default=list)
+    output_name = Column(String(255), nullable=False)
+    error = Column(String(500), nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    def touch(self, now: datetime) -> None:
+        self.updated_at = now
@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Integer, String
+
+from app.db.base import Base
+
+
+class SchedulerRun(Base):
+    __tablename__ = "scheduler_runs"
+
+    name = Column(String(100), primary_key=True)
+    finished_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    removed = Column(Integer, default=0, nullable=False)
+    duration_ms = Column(Integer, default=0, nullable=False)
@@ -1,7 +1,7 @@
 from datetime import datetime
 import uuid
 
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String
+from sqlalchemy import Column, DateTime, ForeignKey, Index, Integer, String, text
 from sqlalchemy.dialects.postgresql import UUID
 
 from app.db.base import Base
@@ -21,5 +21,28 @@ class Usage(Base):
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
+    # One counter per owner, tool and day. These back the ON CONFLICT upsert
+    # in app.usage.tracker; an owner is either a user or an anonymous key.
+    __table_args__ = (
+        Index(
+            "usage_user_tool_period_key",
+            "user_id",
+            "tool",
+            "period_start",
+            unique=True,
+            postgresql_where=text("user_id IS NOT NULL"),
+        ),
+        Index(
+            "usage_anon_tool_period_key",
+            "anon_key",
+            "tool",
+            "period_start",
+            unique=True,
+            postgresql_where=text("anon_key IS NOT NULL"),
+        ),
+        # Retention cleanup deletes by period_end in batches.
+        Index("usage_period_end_idx", "period_end"),
+    )
+
     def touch(self, now: datetime) -> None:
         self.updated_at = now
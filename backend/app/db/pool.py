@@ -0,0 +1,70 @@
+"""Connection pool classes that record checkout statistics.
+
+SQLAlchemy's pools expose how many connections are checked in, checked out
+and in overflow, but not how long a request waited for one. ``timed_pool``
+derives a pool class that times every checkout into a ``PoolStats``; the
+class carries the stats so they survive ``Pool.recreate()`` after a
+disconnect invalidates the pool.
+"""
+
+import threading
+import time
+
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import QueuePool
+
+
+class PoolStats:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._checkouts = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def record(self, waited: float, timed_out: bool) -> None:
+        with self._lock:
+            if timed_out:
+                self._timeouts += 1
+                return
+            self._checkouts += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+
+    def snapshot(self, pool: QueuePool) -> dict:
+        with self._lock:
+            checkouts = self._checkouts
+            return {
+                "size": pool.size(),
+                "max_overflow": pool._max_overflow,
+                "checked_in": pool.checkedin(),
+                "in_use": pool.checkedout(),
+                # QueuePool counts overflow up from -size; only positive values
+                # are connections opened beyond pool_size.
+                "overflow": max(0, pool.overflow()),
+                "checkouts": checkouts,
+                "timeouts": self._timeouts,
+                "wait_seconds_avg": round(self._wait_total / checkouts, 6) if checkouts else 0.0,
+                "wait_seconds_max": round(self._wait_max, 6),
+            }
+
+
+class _TimedPool:
+    stats: PoolStats
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except sa_exc.TimeoutError:
+            self.stats.record(time.perf_counter() - started, timed_out=True)
+            raise
+        self.stats.record(time.perf_counter() - started, timed_out=False)
+        return connection
+
+
+def timed_pool(base: type[QueuePool], stats: PoolStats) -> type[QueuePool]:
+    return type(f"Timed{base.__name__}", (_TimedPool, base), {"stats": stats})
+
+
+__all__ = ["PoolStats", "timed_pool"]
@@ -1,12 +1,16 @@
 import os
-from typing import Iterator
+from typing import AsyncIterator, Iterator
 
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
 
 from dotenv import load_dotenv
 
 from app.db.base import Base
+from app.db.pool import PoolStats, timed_pool
 
 load_dotenv()
 
@@ -17,9 +21,70 @@ if not DATABASE_URL:
 if DATABASE_URL.startswith("postgresql://"):
     DATABASE_URL = DATABASE_URL.replace("postgresql://", "postgresql+psycopg://", 1)
 
-engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+
+def _env_flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).lower() in {"1", "true", "yes"}
+
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv("DB_POOL_TIMEOUT_SECONDS", "30"))
+# Recycling connections before the pooler's idle timeout replaces the
+# per-checkout ping, which costs a round trip on every request.
+DB_POOL_RECYCLE_SECONDS = int(os.getenv("DB_POOL_RECYCLE_SECONDS", "300"))
+DB_POOL_PRE_PING = _env_flag("DB_POOL_PRE_PING", "0")
+# Transaction-mode poolers (PgBouncer, Supabase port 6543) hand each
+# transaction to any server connection, so prepared statements and
+# session-level settings cannot be used.
+DB_PGBOUNCER = _env_flag("DB_PGBOUNCER", "0")
+DB_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "30000"))
+
+pool_stats = {"sync": PoolStats(), "async": PoolStats()}
+
+
+def _engine_options(pool_class: type[QueuePool], stats: PoolStats) -> dict:
+    connect_args: dict = {}
+    if DB_PGBOUNCER:
+        connect_args["prepare_threshold"] = None
+    elif DB_STATEMENT_TIMEOUT_MS > 0:
+        connect_args["options"] = f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"
+    return {
+        "poolclass": timed_pool(pool_class, stats),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_SECONDS,
+        "pool_recycle": DB_POOL_RECYCLE_SECONDS,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "connect_args": connect_args,
+    }
+
+
+def _set_local_statement_timeout(connection) -> None:
+    # Runs before the first statement of each transaction, so SET LOCAL
+    # opens the transaction and expires with it on the pooler's connection.
+    cursor = connection.connection.cursor()
+    try:
+        cursor.execute(f"SET LOCAL statement_timeout = {DB_STATEMENT_TIMEOUT_MS}")
+    finally:
+        cursor.close()
+
+
+def _apply_statement_timeout(target: Engine) -> None:
+    if DB_PGBOUNCER and DB_STATEMENT_TIMEOUT_MS > 0:
+        event.listen(target, "begin", _set_local_statement_timeout)
+
+
+engine = create_engine(DATABASE_URL, future=True, **_engine_options(QueuePool, pool_stats["sync"]))
+_apply_statement_timeout(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, future=True)
 
+# psycopg 3 drives both engines; for the async one SQLAlchemy selects its
+# asyncio dialect from the same URL. Loaded attributes must stay readable
+# after commit without lazy IO, hence expire_on_commit=False.
+async_engine = create_async_engine(DATABASE_URL, **_engine_options(AsyncAdaptedQueuePool, pool_stats["async"]))
+_apply_statement_timeout(async_engine.sync_engine)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
 
 def get_db() -> Iterator[Session]:
     db: Session = SessionLocal()
@@ -29,6 +94,18 @@ def get_db() -> Iterator[Session]:
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def pool_metrics() -> dict:
+    return {
+        "sync": pool_stats["sync"].snapshot(engine.pool),
+        "async": pool_stats["async"].snapshot(async_engine.sync_engine.pool),
+    }
+
+
 def init_db() -> None:
     """Create database tables if they do not exist."""
     from app.db import models  # noqa: F401 - registers models with metadata
@@ -40,7 +117,9 @@ def init_db() -> None:
 
     from app.subscriptions.plans import seed_default_plans
     from app.tools.registry import seed_tool_definitions
+    from app.usage.tracker import check_usage_constraints
 
     with SessionLocal() as db:
+        check_usage_constraints(db)
         seed_default_plans(db)
         seed_tool_definitions(db)
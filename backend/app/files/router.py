@@ -0,0 +1,21 @@
+from fastapi import APIRouter, Depends, Request
+from sqlalchemy.orm import Session
+
+from app.auth.dependencies import get_optional_user
+from app.db.session import get_db
+from app.files.service import download_file
+
+router = APIRouter(prefix="/files", tags=["files"])
+
+
+@router.api_route("/{filename}", methods=["GET", "HEAD"])
+def download_file_route(
+	filename: str,
+	request: Request,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return download_file(request, filename, current_user, db)
+
+
+__all__ = ["router"]
@@ -0,0 +1,74 @@
+"""Download of tool outputs stored in OUTPUT_DIR."""
+
+import hashlib
+import os
+import re
+from functools import lru_cache
+
+from fastapi import HTTPException, Request, status
+from fastapi.responses import FileResponse, Response
+from sqlalchemy.orm import Session
+
+from app.db.models.file import FileRecord
+from app.tools.pdf.service import OUTPUT_DIR
+
+HASH_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_CACHE_CONTROL = "private, no-cache"
+
+
+@lru_cache(maxsize=1024)
+def _content_hash(path: str, inode: int, size: int, mtime_ns: int) -> str:
+	# Keyed on the stat fields as well as the path, so a replaced file is
+	# hashed again while repeated and resumed downloads reuse the digest.
+	digest = hashlib.sha256()
+	with open(path, "rb") as handle:
+		while chunk := handle.read(HASH_CHUNK_SIZE):
+			digest.update(chunk)
+	return digest.hexdigest()
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+	if header.strip() == "*":
+		return True
+	candidates = {value.strip().removeprefix("W/") for value in header.split(",")}
+	return etag in candidates
+
+
+def download_file(request: Request, filename: str, current_user, db: Session) -> Response:
+	if not re.fullmatch(r"[\w.-]+", filename):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filename")
+
+	file_record = db.query(FileRecord).filter(FileRecord.filename == filename).first()
+	if file_record:
+		if not current_user:
+			raise HTTPException(
+				status_code=status.HTTP_401_UNAUTHORIZED,
+				detail="Missing authorization token",
+				headers={"WWW-Authenticate": "Bearer"},
+			)
+		if file_record.user_id != current_user.id:
+			raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to download this file")
+
+	file_path = os.path.join(OUTPUT_DIR, filename)
+	if not os.path.isfile(file_path):
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+	stat = os.stat(file_path)
+
+	etag = f'"{_content_hash(file_path, stat.st_ino, stat.st_size, stat.st_mtime_ns)}"'
+	headers = {"ETag": etag, "Cache-Control": DOWNLOAD_CACHE_CONTROL}
+
+	if_none_match = request.headers.get("if-none-match")
+	if if_none_match and _etag_matches(if_none_match, etag):
+		return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+	# FileResponse answers Range/If-Range requests itself and uses the
+	# server's zero-copy pathsend extension when one is available.
+	return FileResponse(
+		file_path,
+		filename=filename,
+		headers=headers,
+		stat_result=stat,
+	)
+
+
+__all__ = ["download_file"]
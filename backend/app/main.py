@@ -2,17 +2,23 @@ import threading
 
 from fastapi import FastAPI
 from fastapi.responses import JSONResponse
-from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import settings
-from app.db.session import SessionLocal, init_db
+from app.core.rate_limit import anon_limiter
+from app.core.scheduler import build_scheduler
+from app.db.session import SessionLocal, async_engine, engine, init_db, pool_metrics
+from app.files.router import router as files_router
 from app.subscriptions.router import router as subscriptions_router
+from app.tools.image.router import router as image_router
+from app.tools.pdf.engine import pdf_engine
+from app.tools.pdf.jobs import start_inline_workers
+from app.tools.pdf.ocr import ocr_engine
+from app.tools.pdf.office import OFFICE_WARM_ON_STARTUP, office_available, office_pool
 from app.tools.pdf.router import router as pdf_merge_router
 from app.users.router import router as users_router
-from app.users.service import cleanup_deleted_users_loop
-from app.usage.tracker import cleanup_usage_rows_loop
-from app.utils.storage import cleanup_old_files
+from app.usage.tracker import flush_anonymous_usage_loop
+from app.utils.result_cache import result_cache
 
 app = FastAPI(
     title="CanIEdit API",
@@ -40,22 +46,67 @@ def root():
         "message": "CanIEdit backend is running"
     })
 
+
+scheduler = build_scheduler(engine, SessionLocal)
+
+
+@app.get("/metrics")
+def metrics():
+    return JSONResponse({
+        "pdf_engine": pdf_engine.metrics(),
+        "ocr_engine": ocr_engine.metrics(),
+        "office_pool": office_pool.metrics(),
+        "result_cache": result_cache.metrics(),
+        "db_pool": pool_metrics(),
+        "anon_rate_limit": anon_limiter.metrics(),
+        "scheduler": scheduler.metrics(),
+    })
+
 # API routes
 app.include_router(pdf_merge_router, prefix="/api/pdf")
+app.include_router(image_router, prefix="/api")
 app.include_router(subscriptions_router, prefix="/api")
 app.include_router(users_router, prefix="/api")
-
-# Serve merged files
-app.mount(
-    "/temp_outputs",
-    StaticFiles(directory="temp_outputs"),
-    name="temp_outputs"
-)
+app.include_router(files_router, prefix="/api")
 
 
 @app.on_event("startup")
 def start_cleanup_thread() -> None:
     init_db()
-    threading.Thread(target=cleanup_old_files, daemon=True).start()
-    threading.Thread(target=cleanup_deleted_users_loop, args=(SessionLocal,), daemon=True).start()
-    threading.Thread(target=cleanup_usage_rows_loop, args=(SessionLocal,), daemon=True).start()
+    scheduler.start()
+    start_inline_workers(SessionLocal)
+    if OFFICE_WARM_ON_STARTUP and office_available():
+        office_pool.start()
+    if anon_limiter.enabled:
+        app.state.usage_flush_stop = threading.Event()
+        app.state.usage_flush_thread = threading.Thread(
+            target=flush_anonymous_usage_loop,
+            args=(SessionLocal, app.state.usage_flush_stop),
+            daemon=True,
+        )
+        app.state.usage_flush_thread.start()
+
+
+@app.on_event("shutdown")
+def stop_pdf_engine() -> None:
+    pdf_engine.shutdown()
+    ocr_engine.shutdown()
+    office_pool.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_scheduler() -> None:
+    scheduler.stop()
+
+
+@app.on_event("shutdown")
+def flush_anonymous_usage_on_shutdown() -> None:
+    thread = getattr(app.state, "usage_flush_thread", None)
+    if thread is not None:
+        app.state.usage_flush_stop.set()
+        thread.join(timeout=10)
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine() -> None:
+    await async_engine.dispose()
@@ -0,0 +1,112 @@
+"""Per-user entitlement cache (active plan and daily limit).
+
+Authentication and usage accounting both need to know which plan a user is
+on. The answer is resolved with one subscription query, kept on
+``request.state`` for the rest of the request and in a small process-level
+TTL cache for subsequent requests. Code that changes a user's subscriptions
+must call ``entitlements.invalidate(user_id)``; other workers pick the
+change up once ENTITLEMENT_CACHE_TTL_SECONDS has passed.
+"""
+
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from fastapi import Request
+from sqlalchemy.orm import Session
+
+from app.db.models.subscription import Subscription
+from app.subscriptions.plans import DEFAULT_PLAN_SLUG
+from app.usage.catalog import PlanInfo, catalog
+
+ENTITLEMENT_CACHE_TTL_SECONDS = float(os.getenv("ENTITLEMENT_CACHE_TTL_SECONDS", "60"))
+ENTITLEMENT_CACHE_MAX_USERS = int(os.getenv("ENTITLEMENT_CACHE_MAX_USERS", "10000"))
+
+
+@dataclass(frozen=True)
+class Entitlement:
+	user_id: uuid.UUID
+	has_subscription: bool
+	plan: PlanInfo | None
+
+	@property
+	def is_paid(self) -> bool:
+		return self.plan is not None and self.plan.slug != DEFAULT_PLAN_SLUG
+
+
+def _load_entitlement(db: Session, user_id: uuid.UUID) -> Entitlement:
+	# Active subscriptions sort first, so one row answers both "does the
+	# user have any subscription" and "which plan is active".
+	row = (
+		db.query(Subscription.plan_id, Subscription.status)
+		.filter(Subscription.user_id == user_id)
+		.order_by(
+			(Subscription.status == "active").desc(),
+			Subscription.current_period_end.desc().nullslast(),
+			Subscription.created_at.desc(),
+		)
+		.first()
+	)
+	plan = None
+	if row and row.status == "active":
+		plan = catalog.plan_by_id(db, row.plan_id)
+	if plan is None:
+		plan = catalog.plan_by_slug(db, DEFAULT_PLAN_SLUG)
+	return Entitlement(user_id=user_id, has_subscription=row is not None, plan=plan)
+
+
+class EntitlementCache:
+	def __init__(
+		self,
+		ttl_seconds: float = ENTITLEMENT_CACHE_TTL_SECONDS,
+		max_users: int = ENTITLEMENT_CACHE_MAX_USERS,
+	) -> None:
+		self.ttl_seconds = ttl_seconds
+		self.max_users = max_users
+		self._entries: OrderedDict[uuid.UUID, tuple[float, Entitlement]] = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, db: Session, user_id: uuid.UUID, request: Request | None = None) -> Entitlement:
+		if request is not None:
+			cached = getattr(request.state, "entitlement", None)
+			if cached is not None and cached.user_id == user_id:
+				return cached
+
+		now = time.monotonic()
+		with self._lock:
+			entry = self._entries.get(user_id)
+			if entry and entry[0] > now:
+				self._entries.move_to_end(user_id)
+				entitlement = entry[1]
+			else:
+				entitlement = None
+
+		if entitlement is None:
+			entitlement = _load_entitlement(db, user_id)
+			if self.ttl_seconds > 0:
+				with self._lock:
+					self._entries[user_id] = (now + self.ttl_seconds, entitlement)
+					self._entries.move_to_end(user_id)
+					while len(self._entries) > self.max_users:
+						self._entries.popitem(last=False)
+
+		if request is not None:
+			request.state.entitlement = entitlement
+		return entitlement
+
+	def invalidate(self, user_id: uuid.UUID | None = None, request: Request | None = None) -> None:
+		if request is not None:
+			request.state.entitlement = None
+		with self._lock:
+			if user_id is None:
+				self._entries.clear()
+			else:
+				self._entries.pop(user_id, None)
+
+
+entitlements = EntitlementCache()
+
+__all__ = ["Entitlement", "EntitlementCache", "entitlements"]
@@ -1,9 +1,11 @@
 from dataclasses import dataclass
+from datetime import datetime
 import os
 
 from sqlalchemy.orm import Session
 
 from app.db.models.plan import Plan
+from app.usage.catalog import catalog
 
 
 @dataclass(frozen=True)
@@ -33,6 +35,7 @@ PLAN_DEFINITIONS = [
 
 def seed_default_plans(db: Session) -> None:
 	existing = {plan.slug: plan for plan in db.query(Plan).all()}
+	now = datetime.utcnow()
 	changed = False
 	for definition in PLAN_DEFINITIONS:
 		plan = existing.get(definition.slug)
@@ -40,6 +43,8 @@ def seed_default_plans(db: Session) -> None:
 			if plan.name != definition.name or plan.daily_merge_limit != definition.daily_merge_limit:
 				plan.name = definition.name
 				plan.daily_merge_limit = definition.daily_merge_limit
+				# Other workers notice catalog changes through updated_at.
+				plan.touch(now)
 				db.add(plan)
 				changed = True
 			continue
@@ -52,3 +57,4 @@ def seed_default_plans(db: Session) -> None:
 		changed = True
 	if changed:
 		db.commit()
+		catalog.invalidate()
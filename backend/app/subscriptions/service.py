@@ -5,10 +5,28 @@ from datetime import datetime
 from fastapi import HTTPException, status
 from sqlalchemy.orm import Session
 
-from app.db.models.plan import Plan
 from app.db.models.subscription import Subscription
 from app.db.models.user import User
+from app.subscriptions.entitlements import entitlements
 from app.subscriptions.plans import DEFAULT_PLAN_SLUG
+from app.usage.catalog import catalog
+
+
+def build_starter_subscription(db: Session, user_id, now: datetime) -> Subscription:
+	"""Return an uncommitted starter subscription for ``user_id``."""
+	plan = catalog.plan_by_slug(db, DEFAULT_PLAN_SLUG)
+	if not plan:
+		raise HTTPException(
+			status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+			detail="Starter plan is not configured",
+		)
+	return Subscription(
+		user_id=user_id,
+		plan_id=plan.id,
+		status="active",
+		current_period_start=now,
+		current_period_end=None,
+	)
 
 
 def ensure_starter_subscription(db: Session, user: User) -> Subscription:
@@ -22,25 +40,12 @@ def ensure_starter_subscription(db: Session, user: User) -> Subscription:
 	if existing:
 		return existing
 
-	plan = db.query(Plan).filter(Plan.slug == DEFAULT_PLAN_SLUG).first()
-	if not plan:
-		raise HTTPException(
-			status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-			detail="Starter plan is not configured",
-		)
-
-	now = datetime.utcnow()
-	subscription = Subscription(
-		user_id=user.id,
-		plan_id=plan.id,
-		status="active",
-		current_period_start=now,
-		current_period_end=None,
-	)
+	subscription = build_starter_subscription(db, user.id, datetime.utcnow())
 	db.add(subscription)
 	db.commit()
 	db.refresh(subscription)
+	entitlements.invalidate(user.id)
 	return subscription
 
 
-__all__ = ["ensure_starter_subscription"]
+__all__ = ["build_starter_subscription", "ensure_starter_subscription"]
@@ -0,0 +1,261 @@
+"""CPU-bound image operations.
+
+Like ``app.tools.pdf.operations`` these only deal with files on disk and
+must not touch the database or FastAPI. Pillow releases the GIL while
+decoding, resampling and encoding, so batches run on a shared thread pool
+(``image_executor``) instead of worker processes.
+
+When an image is going to be scaled down, JPEG sources are decoded at
+reduced size with ``Image.draft``: libjpeg then skips most of the DCT work
+and returns the image at 1/2, 1/4 or 1/8 of its size. Only the first frame
+of animated images is used.
+"""
+
+import math
+import os
+import shutil
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass
+
+from PIL import Image, ImageOps
+
+try:
+	from pillow_heif import register_heif_opener
+except ImportError:
+	register_heif_opener = None
+else:
+	register_heif_opener()
+
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", str(os.cpu_count() or 1)))
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", str(50_000_000)))
+
+# Output format key -> (Pillow format, file extension).
+OUTPUT_FORMATS = {
+	"jpeg": ("JPEG", ".jpg"),
+	"png": ("PNG", ".png"),
+	"webp": ("WEBP", ".webp"),
+}
+FIT_MODES = {"contain", "cover", "stretch"}
+
+# Markers dropped when stripping a JPEG without re-encoding it: APP1
+# (EXIF, XMP), APP13 (IPTC) and comments. APP0, the ICC profile (APP2) and
+# Adobe's colour transform flag (APP14) are needed to show the image right.
+_JPEG_STRIPPED_MARKERS = {0xE1, 0xED, 0xFE}
+
+image_executor = ThreadPoolExecutor(max_workers=max(1, IMAGE_WORKERS), thread_name_prefix="image")
+
+
+class ImageInputError(ValueError):
+	"""Raised when an upload cannot be processed (not an image, too large...)."""
+
+
+@dataclass(frozen=True)
+class ImageSpec:
+	# Key of OUTPUT_FORMATS; None keeps the source format where possible.
+	format: str | None = None
+	quality: int = 85
+	width: int | None = None
+	height: int | None = None
+	fit: str = "contain"
+	strip_metadata: bool = False
+	# Write the source unchanged when re-encoding does not make it smaller.
+	keep_smaller: bool = False
+
+	@property
+	def resizes(self) -> bool:
+		return bool(self.width or self.height)
+
+
+def _output_format(source_format: str | None, spec: ImageSpec) -> tuple[str, str, str]:
+	if spec.format:
+		return (spec.format, *OUTPUT_FORMATS[spec.format])
+	for key, (name, extension) in OUTPUT_FORMATS.items():
+		if name == source_format:
+			return key, name, extension
+	# Photos from phones (HEIC, MPO) stay photos; everything else becomes PNG.
+	if source_format in {"HEIF", "MPO"}:
+		return ("jpeg", *OUTPUT_FORMATS["jpeg"])
+	return ("png", *OUTPUT_FORMATS["png"])
+
+
+def _scaled_size(size: tuple[int, int], spec: ImageSpec) -> tuple[int, int] | None:
+	"""Size to resample to; for ``cover`` this is before the centre crop."""
+	width, height = size
+	if not spec.resizes:
+		return None
+	if spec.fit == "stretch":
+		return spec.width or width, spec.height or height
+	scales = [target / current for target, current in ((spec.width, width), (spec.height, height)) if target]
+	if spec.fit == "cover" and len(scales) == 2:
+		scale = max(scales)
+	else:
+		# contain never enlarges.
+		scale = min(min(scales), 1.0)
+	if scale == 1.0:
+		return None
+	return max(1, math.ceil(width * scale)), max(1, math.ceil(height * scale))
+
+
+def _prepare_mode(image: Image.Image, format_name: str) -> Image.Image:
+	has_alpha = image.mode in {"RGBA", "LA", "PA"} or (image.mode == "P" and "transparency" in image.info)
+	if format_name == "JPEG":
+		if has_alpha:
+			# JPEG has no alpha; flatten onto white like browsers do.
+			rgba = image.convert("RGBA")
+			background = Image.new("RGB", image.size, (255, 255, 255))
+			background.paste(rgba, mask=rgba.getchannel("A"))
+			return background
+		if image.mode not in {"RGB", "L", "CMYK"}:
+			return image.convert("RGB")
+		return image
+	if format_name == "WEBP" and image.mode not in {"RGB", "RGBA"}:
+		return image.convert("RGBA" if has_alpha else "RGB")
+	if format_name == "PNG" and image.mode == "CMYK":
+		return image.convert("RGB")
+	return image
+
+
+def _save_options(format_name: str, spec: ImageSpec) -> dict:
+	if format_name == "JPEG":
+		return {"quality": spec.quality, "optimize": True, "progressive": True}
+	if format_name == "WEBP":
+		return {"quality": spec.quality, "method": 4}
+	return {"optimize": True}
+
+
+def strip_jpeg_metadata(input_path: str, output_path: str) -> bool:
+	"""Copy a JPEG without its EXIF, XMP, IPTC and comment segments.
+
+	The compressed image data is copied as is, so nothing is re-encoded.
+	Returns False (and writes nothing) when the file is not a plain JPEG.
+	"""
+	with open(input_path, "rb") as source:
+		data = source.read()
+	if data[:2] != b"\xff\xd8":
+		return False
+
+	kept = [data[:2]]
+	position = 2
+	while position + 4 <= len(data):
+		if data[position] != 0xFF:
+			return False
+		marker = data[position + 1]
+		if marker == 0xFF:
+			# Fill byte before a marker.
+			position += 1
+			continue
+		if marker == 0xDA:
+			# Start of scan: the rest is image data.
+			kept.append(data[position:])
+			break
+		length = int.from_bytes(data[position + 2:position + 4], "big")
+		if marker not in _JPEG_STRIPPED_MARKERS:
+			kept.append(data[position:position + 2 + length])
+		position += 2 + length
+	else:
+		return False
+
+	with open(output_path, "wb") as output:
+		for chunk in kept:
+			output.write(chunk)
+	return True
+
+
+def transform_image(input_path: str, output_stem: str, spec: ImageSpec) -> dict:
+	"""Resize, convert and re-encode ``input_path`` into ``output_stem`` + extension.
+
+	Returns the written path with the output format, size and byte counts.
+	"""
+	original_bytes = os.path.getsize(input_path)
+	with Image.open(input_path) as image:
+		if image.width * image.height > IMAGE_MAX_PIXELS:
+			raise ImageInputError("Image is too large.")
+		source_format = image.format
+		key, format_name, extension = _output_format(source_format, spec)
+		output_path = f"{output_stem}{extension}"
+		orientation = image.getexif().get(0x0112, 1)
+
+		if (
+			spec.strip_metadata
+			and not spec.resizes
+			and source_format == "JPEG"
+			and format_name == "JPEG"
+			and orientation == 1
+			and strip_jpeg_metadata(input_path, output_path)
+		):
+			return {
+				"path": output_path,
+				"format": key,
+				"width": image.width,
+				"height": image.height,
+				"size_bytes": os.path.getsize(output_path),
+				"original_bytes": original_bytes,
+			}
+
+		# EXIF orientations 5-8 swap width and height when applied.
+		transposed = orientation in {5, 6, 7, 8}
+		oriented_size = (image.height, image.width) if transposed else image.size
+		scaled_size = _scaled_size(oriented_size, spec)
+		if scaled_size and source_format == "JPEG":
+			draft_size = (scaled_size[1], scaled_size[0]) if transposed else scaled_size
+			image.draft(image.mode, draft_size)
+
+		result = ImageOps.exif_transpose(image)
+		if scaled_size:
+			# reducing_gap shrinks by whole factors first, which is much
+			# cheaper than a full LANCZOS pass from the original size.
+			result = result.resize(scaled_size, Image.LANCZOS, reducing_gap=3.0)
+		if spec.fit == "cover" and spec.width and spec.height and result.size != (spec.width, spec.height):
+			left = (result.width - spec.width) // 2
+			top = (result.height - spec.height) // 2
+			result = result.crop((left, top, left + spec.width, top + spec.height))
+		result = _prepare_mode(result, format_name)
+
+		options = _save_options(format_name, spec)
+		icc_profile = image.info.get("icc_profile")
+		if icc_profile:
+			options["icc_profile"] = icc_profile
+		if spec.strip_metadata:
+			# Encoders also pick up comments and XMP from ``info``.
+			result.info = {}
+		else:
+			exif = result.getexif()
+			if exif:
+				options["exif"] = exif
+		result.save(output_path, format_name, **options)
+
+	size_bytes = os.path.getsize(output_path)
+	if (
+		spec.keep_smaller
+		and not spec.resizes
+		and not spec.strip_metadata
+		and format_name == source_format
+		and size_bytes >= original_bytes
+	):
+		shutil.copyfile(input_path, output_path)
+		size_bytes = original_bytes
+	return {
+		"path": output_path,
+		"format": key,
+		"width": result.width,
+		"height": result.height,
+		"size_bytes": size_bytes,
+		"original_bytes": original_bytes,
+	}
+
+
+def submit_batch(jobs: list[tuple[str, str]], spec: ImageSpec) -> list[Future]:
+	"""Queue ``(input_path, output_stem)`` pairs on the image thread pool."""
+	return [image_executor.submit(transform_image, input_path, output_stem, spec) for input_path, output_stem in jobs]
+
+
+__all__ = [
+	"FIT_MODES",
+	"OUTPUT_FORMATS",
+	"ImageInputError",
+	"ImageSpec",
+	"image_executor",
+	"strip_jpeg_metadata",
+	"submit_batch",
+	"transform_image",
+]
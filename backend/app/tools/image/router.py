@@ -1,3 +1,105 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.auth.dependencies import get_optional_user, get_optional_user_async
+from app.db.session import get_async_db, get_db
+from app.tools.image.service import compress_images, convert_images, resize_images, strip_image_metadata
+from app.tools.pdf.service import delete_output_file
 
 router = APIRouter(prefix="/image", tags=["image-tools"])
+
+
+@router.post("/compress")
+async def compress_images_route(
+	request: Request,
+	files: list[UploadFile] = File(...),
+	quality: int = Form(75),
+	output_format: str | None = Form(None, alias="format"),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await compress_images(request, files, current_user, db, quality=quality, output_format=output_format)
+
+
+@router.delete("/compress/{filename}")
+def delete_compressed_image_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/convert")
+async def convert_images_route(
+	request: Request,
+	files: list[UploadFile] = File(...),
+	output_format: str = Form(..., alias="format"),
+	quality: int = Form(85),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await convert_images(request, files, current_user, db, output_format=output_format, quality=quality)
+
+
+@router.delete("/convert/{filename}")
+def delete_converted_image_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/resize")
+async def resize_images_route(
+	request: Request,
+	files: list[UploadFile] = File(...),
+	width: int | None = Form(None),
+	height: int | None = Form(None),
+	fit: str = Form("contain"),
+	output_format: str | None = Form(None, alias="format"),
+	quality: int = Form(85),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await resize_images(
+		request,
+		files,
+		current_user,
+		db,
+		width=width,
+		height=height,
+		fit=fit,
+		output_format=output_format,
+		quality=quality,
+	)
+
+
+@router.delete("/resize/{filename}")
+def delete_resized_image_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/strip-metadata")
+async def strip_image_metadata_route(
+	request: Request,
+	files: list[UploadFile] = File(...),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await strip_image_metadata(request, files, current_user, db)
+
+
+@router.delete("/strip-metadata/{filename}")
+def delete_stripped_image_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
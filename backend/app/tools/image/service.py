@@ -1 +1,251 @@
-"""Image tool services (placeholder)."""
+"""Image tool services: compress, convert, resize and strip metadata."""
+
+import asyncio
+import os
+import re
+import uuid
+import zipfile
+from typing import Final
+
+from fastapi import HTTPException, Request, UploadFile, status
+from PIL import Image, UnidentifiedImageError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.tools.image.operations import (
+	FIT_MODES,
+	OUTPUT_FORMATS,
+	ImageInputError,
+	ImageSpec,
+	submit_batch,
+)
+from app.tools.pdf.service import record_output, slugify_filename
+from app.usage.tracker import increment_usage_async
+from app.utils.storage import SpooledUpload, UploadTooLargeError, spool_upload
+
+MAX_FILE_SIZE_MB: Final = 20
+UPLOAD_DIR = "temp_uploads"
+OUTPUT_DIR = "temp_outputs"
+MAX_BATCH_FILES = int(os.getenv("IMAGE_MAX_BATCH_FILES", "20"))
+MAX_DIMENSION = 10000
+# Re-encoding only to drop metadata should not visibly cost quality.
+STRIP_QUALITY = 95
+
+os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(OUTPUT_DIR, exist_ok=True)
+
+
+async def save_upload(file: UploadFile) -> SpooledUpload:
+	"""Spool an upload into UPLOAD_DIR, enforcing MAX_FILE_SIZE_MB."""
+	# Keep the extension so downloads of the original stay recognisable.
+	extension = os.path.splitext(file.filename or "")[1].lower()
+	try:
+		return await spool_upload(
+			file,
+			UPLOAD_DIR,
+			max_bytes=MAX_FILE_SIZE_MB * 1024 * 1024,
+			suffix=extension if re.fullmatch(r"\.[a-z0-9]{1,5}", extension) else "",
+		)
+	except UploadTooLargeError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+			detail=f"File too large. Max {MAX_FILE_SIZE_MB}MB allowed.",
+		) from exc
+
+
+def _error_detail(exc: BaseException) -> str:
+	if isinstance(exc, ImageInputError):
+		return str(exc)
+	if isinstance(exc, Image.DecompressionBombError):
+		return "Image is too large."
+	if isinstance(exc, UnidentifiedImageError):
+		return "Not a supported image."
+	return "Unable to process this image."
+
+
+def _entry_name(slug: str, extension: str, used: set[str]) -> str:
+	name = f"{slug}{extension}"
+	suffix = 2
+	while name in used:
+		name = f"{slug}-{suffix}{extension}"
+		suffix += 1
+	used.add(name)
+	return name
+
+
+def _write_zip(output_path: str, entries: list[tuple[str, str]]) -> None:
+	# Images are already compressed; storing them keeps this cheap.
+	with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as archive:
+		for path, name in entries:
+			archive.write(path, name)
+			os.remove(path)
+
+
+async def _run_image_tool(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+	tool: str,
+	label: str,
+	spec: ImageSpec,
+) -> dict:
+	"""Apply ``spec`` to every upload on the image thread pool.
+
+	One upload gives back one image; several give back a ZIP with the
+	images that worked and a per-file summary in the response. Usage is
+	charged per file.
+	"""
+	if not files or len(files) > MAX_BATCH_FILES:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail=f"Upload between 1 and {MAX_BATCH_FILES} images.",
+		)
+
+	# Enforce daily usage for every file in one transaction.
+	await increment_usage_async(db, request, current_user, tool=tool, units=len(files))
+
+	token = uuid.uuid4().hex[:6]
+	slugs: list[str] = []
+	jobs: list[tuple[str, str]] = []
+	for index, file in enumerate(files, start=1):
+		slug = slugify_filename(file.filename, f"image-{index}")
+		spooled = await save_upload(file)
+		slugs.append(slug)
+		jobs.append((str(spooled.path), os.path.join(OUTPUT_DIR, f"caniedit-{label}-{slug}-{token}-{index}")))
+
+	results = await asyncio.gather(
+		*(asyncio.wrap_future(future) for future in submit_batch(jobs, spec)),
+		return_exceptions=True,
+	)
+
+	summaries: list[dict] = []
+	outputs: list[tuple[str, str]] = []
+	used_names: set[str] = set()
+	for slug, file, result in zip(slugs, files, results):
+		if isinstance(result, BaseException):
+			summaries.append({"file": file.filename, "success": False, "error": _error_detail(result)})
+			continue
+		name = _entry_name(slug, os.path.splitext(result["path"])[1], used_names)
+		outputs.append((result["path"], name))
+		summaries.append({
+			"file": name,
+			"success": True,
+			"format": result["format"],
+			"width": result["width"],
+			"height": result["height"],
+			"original_kb": round(result["original_bytes"] / 1024, 1),
+			"size_kb": round(result["size_bytes"] / 1024, 1),
+		})
+
+	if not outputs:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=summaries[0]["error"])
+
+	if len(files) == 1:
+		output_path = outputs[0][0]
+		output_name = os.path.basename(output_path)
+	else:
+		output_name = f"caniedit-{label}-{token}.zip"
+		output_path = os.path.join(OUTPUT_DIR, output_name)
+		await asyncio.to_thread(_write_zip, output_path, outputs)
+
+	await record_output(db, current_user, tool, output_name, output_path)
+
+	return {
+		"success": True,
+		"file": output_name,
+		"files": summaries,
+	}
+
+
+def _check_quality(quality: int) -> None:
+	if not 1 <= quality <= 100:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Quality must be between 1 and 100.")
+
+
+def _check_format(output_format: str | None) -> str | None:
+	if output_format is None or output_format == "":
+		return None
+	output_format = output_format.lower()
+	if output_format == "jpg":
+		output_format = "jpeg"
+	if output_format not in OUTPUT_FORMATS:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid output format.")
+	return output_format
+
+
+async def compress_images(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+	quality: int = 75,
+	output_format: str | None = None,
+) -> dict:
+	_check_quality(quality)
+	spec = ImageSpec(format=_check_format(output_format), quality=quality, keep_smaller=True)
+	return await _run_image_tool(request, files, current_user, db, "image_compress", "compressed", spec)
+
+
+async def convert_images(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+	output_format: str,
+	quality: int = 85,
+) -> dict:
+	_check_quality(quality)
+	output_format = _check_format(output_format)
+	if output_format is None:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Choose an output format.")
+	spec = ImageSpec(format=output_format, quality=quality)
+	return await _run_image_tool(request, files, current_user, db, "image_convert", "converted", spec)
+
+
+async def resize_images(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+	width: int | None = None,
+	height: int | None = None,
+	fit: str = "contain",
+	output_format: str | None = None,
+	quality: int = 85,
+) -> dict:
+	_check_quality(quality)
+	if fit not in FIT_MODES:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid fit mode.")
+	if not width and not height:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Enter a width or a height.")
+	for value in (width, height):
+		if value is not None and not 1 <= value <= MAX_DIMENSION:
+			raise HTTPException(
+				status_code=status.HTTP_400_BAD_REQUEST,
+				detail=f"Width and height must be between 1 and {MAX_DIMENSION} pixels.",
+			)
+	if fit == "cover" and not (width and height):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Cropping to fill needs both a width and a height.")
+	spec = ImageSpec(
+		format=_check_format(output_format),
+		quality=quality,
+		width=width,
+		height=height,
+		fit=fit,
+	)
+	return await _run_image_tool(request, files, current_user, db, "image_resize", "resized", spec)
+
+
+async def strip_image_metadata(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+) -> dict:
+	"""Remove EXIF (camera, GPS), XMP, IPTC and comments.
+
+	JPEGs are stripped without re-encoding when their orientation does not
+	need to be applied to the pixels.
+	"""
+	spec = ImageSpec(quality=STRIP_QUALITY, strip_metadata=True)
+	return await _run_image_tool(request, files, current_user, db, "image_strip_metadata", "clean", spec)
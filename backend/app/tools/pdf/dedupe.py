@@ -0,0 +1,114 @@
+"""Content-hash deduplication of stream objects inside a PdfWriter.
+
+Identical streams (the same logo on every page, a font embedded once per
+source document) are collapsed onto the first occurrence: every reference in
+the writer is rewritten to point at it and the duplicates are dropped before
+the file is written.
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Callable
+
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, PdfObject, StreamObject
+
+# Duplicates referencing other duplicates (an image and its /SMask) only match
+# once their children have been merged, so a few passes are needed.
+MAX_PASSES = 4
+
+
+@dataclass
+class DedupStats:
+	streams: int = 0
+	duplicates: int = 0
+	bytes_saved: int = 0
+
+	@property
+	def ratio(self) -> float:
+		return round(self.duplicates / self.streams, 4) if self.streams else 0.0
+
+	def as_dict(self) -> dict:
+		return {
+			"streams": self.streams,
+			"duplicates": self.duplicates,
+			"bytes_saved": self.bytes_saved,
+			"ratio": self.ratio,
+		}
+
+
+def _describe(value: PdfObject, digest) -> None:
+	if isinstance(value, IndirectObject):
+		digest.update(f"R{value.idnum};".encode())
+	elif isinstance(value, DictionaryObject):
+		digest.update(b"<<")
+		for key in sorted(value.keys()):
+			if key == "/Length":
+				continue
+			digest.update(key.encode("utf-8", "surrogateescape"))
+			_describe(value.raw_get(key), digest)
+		digest.update(b">>")
+	elif isinstance(value, ArrayObject):
+		digest.update(b"[")
+		for item in value:
+			_describe(item, digest)
+		digest.update(b"]")
+	else:
+		digest.update(repr(value).encode("utf-8", "surrogateescape"))
+		digest.update(b";")
+
+
+def stream_fingerprint(stream: StreamObject) -> str:
+	digest = hashlib.sha256()
+	_describe(stream, digest)
+	digest.update(stream._data or b"")
+	return digest.hexdigest()
+
+
+def _rewrite(value: PdfObject, mapping: dict[int, IndirectObject]) -> None:
+	if isinstance(value, DictionaryObject):
+		items = list(value.items())
+	elif isinstance(value, ArrayObject):
+		items = list(enumerate(value))
+	else:
+		return
+	for key, item in items:
+		if isinstance(item, IndirectObject):
+			target = mapping.get(item.idnum)
+			if target is not None and item.pdf is target.pdf:
+				value[key] = target
+		else:
+			_rewrite(item, mapping)
+
+
+def dedupe_streams(writer: PdfWriter, accept: Callable[[StreamObject], bool]) -> DedupStats:
+	"""Merge identical stream objects for which ``accept`` returns True."""
+	stats = DedupStats()
+	counted: set[int] = set()
+	for _ in range(MAX_PASSES):
+		canonical: dict[str, IndirectObject] = {}
+		mapping: dict[int, IndirectObject] = {}
+		for idnum, obj in enumerate(writer._objects, start=1):
+			if not isinstance(obj, StreamObject) or not accept(obj):
+				continue
+			if idnum not in counted:
+				counted.add(idnum)
+				stats.streams += 1
+			key = stream_fingerprint(obj)
+			if key in canonical:
+				mapping[idnum] = canonical[key]
+				stats.duplicates += 1
+				stats.bytes_saved += len(obj._data or b"")
+			else:
+				canonical[key] = obj.indirect_reference or IndirectObject(idnum, 0, writer)
+		if not mapping:
+			break
+		for obj in writer._objects:
+			if obj is not None:
+				_rewrite(obj, mapping)
+		for idnum in mapping:
+			writer._objects[idnum - 1] = None
+	return stats
+
+
+__all__ = ["DedupStats", "dedupe_streams", "stream_fingerprint"]
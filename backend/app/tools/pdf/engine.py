@@ -0,0 +1,225 @@
+"""Execution engine for CPU-bound PDF work.
+
+pypdf is pure Python, so running it inside an ``async def`` handler blocks the
+event loop for every other request. Handlers submit functions from
+``app.tools.pdf.operations`` here instead and await the result.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+logger = logging.getLogger("app.tools.pdf.engine")
+
+PDF_ENGINE = os.getenv("PDF_ENGINE", "process").lower()
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(min(4, os.cpu_count() or 1))))
+PDF_JOB_TIMEOUT_SECONDS = float(os.getenv("PDF_JOB_TIMEOUT_SECONDS", "120"))
+PDF_WORKER_MAX_JOBS = int(os.getenv("PDF_WORKER_MAX_JOBS", "50"))
+
+
+class PdfJobTimeout(Exception):
+	"""Raised when a job does not finish within its timeout."""
+
+
+def _run_job(func: Callable[..., Any], args: tuple, kwargs: dict) -> tuple[float, Any]:
+	# Runs inside the worker; the start time lets the caller measure queue wait.
+	started_at = time.time()
+	return started_at, func(*args, **kwargs)
+
+
+class PdfEngine:
+	"""Bounded pool that runs PDF jobs off the event loop.
+
+	``mode`` is ``"process"`` (default) or ``"thread"``. Process workers are
+	replaced after ``max_jobs_per_worker`` jobs so pypdf memory growth stays
+	capped.
+
+	A process job still running at its timeout cannot be cancelled, so the
+	pool's processes are killed and a fresh pool serves the next job; other
+	jobs lost with the old pool are resubmitted once. Threads cannot be
+	killed: a timed-out thread job keeps counting as in flight until it
+	returns.
+	"""
+
+	def __init__(
+		self,
+		mode: str = PDF_ENGINE,
+		workers: int = PDF_WORKERS,
+		timeout: float = PDF_JOB_TIMEOUT_SECONDS,
+		max_jobs_per_worker: int = PDF_WORKER_MAX_JOBS,
+	) -> None:
+		if mode not in {"process", "thread"}:
+			raise ValueError(f"Unknown PDF engine mode: {mode}")
+		self.mode = mode
+		self.workers = max(1, workers)
+		self.timeout = timeout
+		self.max_jobs_per_worker = max(1, max_jobs_per_worker)
+		self._executor: Executor | None = None
+		# Pools killed after a timeout; their other jobs are retried.
+		self._terminated: weakref.WeakSet[Executor] = weakref.WeakSet()
+		self._lock = threading.Lock()
+		self._in_flight = 0
+		self._completed = 0
+		self._failed = 0
+		self._timeouts = 0
+		self._wait_total = 0.0
+		self._wait_max = 0.0
+		self._run_total = 0.0
+
+	def _get_executor(self) -> Executor:
+		with self._lock:
+			if self._executor is None:
+				if self.mode == "process":
+					self._executor = ProcessPoolExecutor(
+						max_workers=self.workers,
+						max_tasks_per_child=self.max_jobs_per_worker,
+					)
+				else:
+					self._executor = ThreadPoolExecutor(
+						max_workers=self.workers,
+						thread_name_prefix="pdf-engine",
+					)
+			return self._executor
+
+	def _submit(self, func: Callable[..., Any], args: tuple, kwargs: dict):
+		executor = self._get_executor()
+		with self._lock:
+			self._in_flight += 1
+		return executor, time.time(), executor.submit(_run_job, func, args, kwargs)
+
+	def _release_abandoned(self, future) -> None:
+		with self._lock:
+			self._in_flight -= 1
+
+	def _terminate(self, executor: Executor) -> None:
+		"""Kill the processes of ``executor``; their pending jobs fail with BrokenExecutor."""
+		processes = list((getattr(executor, "_processes", None) or {}).values())
+		executor.shutdown(wait=False)
+		for process in processes:
+			process.kill()
+
+	def _failure(
+		self,
+		executor: Executor,
+		future,
+		func: Callable[..., Any],
+		exc: BaseException,
+		retry: bool = False,
+	) -> BaseException | None:
+		"""Account for a failed job and return the error to raise, or None to resubmit it."""
+		name = getattr(func, "__name__", str(func))
+		timed_out = isinstance(exc, TimeoutError)
+		# Still running: cancel() only works for jobs that have not started.
+		running = not future.done() and not future.cancel()
+		kill = timed_out and running and self.mode == "process"
+		lost = isinstance(exc, BrokenExecutor) and executor in self._terminated
+		with self._lock:
+			if not running or kill:
+				self._in_flight -= 1
+			if timed_out:
+				self._timeouts += 1
+			elif not (lost and retry):
+				self._failed += 1
+			if (kill or isinstance(exc, BrokenExecutor)) and self._executor is executor:
+				# A worker died (OOM kill, segfault) or hung; start a fresh pool for the next job.
+				self._executor = None
+			if kill:
+				self._terminated.add(executor)
+		if running and not kill:
+			# The job goes on in its thread (or after the caller went away);
+			# its slot stays taken until it actually returns.
+			future.add_done_callback(self._release_abandoned)
+		if kill:
+			logger.warning("PDF job %s timed out; restarting the worker pool", name)
+			self._terminate(executor)
+		if lost and retry:
+			logger.info("Resubmitting PDF job %s lost with a restarted pool", name)
+			return None
+		if timed_out:
+			if not kill:
+				logger.warning("PDF job %s timed out", name)
+			return PdfJobTimeout(name)
+		if isinstance(exc, BrokenExecutor):
+			executor.shutdown(wait=False, cancel_futures=True)
+		return exc
+
+	def _success(self, submitted_at: float, started_at: float) -> None:
+		finished_at = time.time()
+		wait = max(0.0, started_at - submitted_at)
+		with self._lock:
+			self._in_flight -= 1
+			self._completed += 1
+			self._wait_total += wait
+			self._wait_max = max(self._wait_max, wait)
+			self._run_total += max(0.0, finished_at - started_at)
+
+	async def run(self, func: Callable[..., Any], *args: Any, timeout: float | None = None, **kwargs: Any) -> Any:
+		"""Run ``func(*args, **kwargs)`` on the pool and return its result.
+
+		``func`` must be a module-level function so it can be pickled.
+		"""
+		for attempt in range(2):
+			executor, submitted_at, future = self._submit(func, args, kwargs)
+			try:
+				started_at, result = await asyncio.wait_for(
+					asyncio.wrap_future(future),
+					timeout=timeout if timeout is not None else self.timeout,
+				)
+			except (Exception, asyncio.CancelledError) as exc:
+				error = self._failure(executor, future, func, exc, retry=attempt == 0)
+				if error is None:
+					continue
+				if error is exc:
+					raise
+				raise error from exc
+			self._success(submitted_at, started_at)
+			return result
+
+	def run_blocking(self, func: Callable[..., Any], *args: Any, timeout: float | None = None, **kwargs: Any) -> Any:
+		"""Synchronous counterpart of :meth:`run` for background threads."""
+		for attempt in range(2):
+			executor, submitted_at, future = self._submit(func, args, kwargs)
+			try:
+				started_at, result = future.result(timeout=timeout if timeout is not None else self.timeout)
+			except Exception as exc:
+				error = self._failure(executor, future, func, exc, retry=attempt == 0)
+				if error is None:
+					continue
+				if error is exc:
+					raise
+				raise error from exc
+			self._success(submitted_at, started_at)
+			return result
+
+	def metrics(self) -> dict:
+		with self._lock:
+			completed = self._completed
+			return {
+				"mode": self.mode,
+				"workers": self.workers,
+				"in_flight": self._in_flight,
+				"queue_depth": max(0, self._in_flight - self.workers),
+				"completed": completed,
+				"failed": self._failed,
+				"timeouts": self._timeouts,
+				"wait_seconds_avg": round(self._wait_total / completed, 4) if completed else 0.0,
+				"wait_seconds_max": round(self._wait_max, 4),
+				"run_seconds_avg": round(self._run_total / completed, 4) if completed else 0.0,
+			}
+
+	def shutdown(self) -> None:
+		with self._lock:
+			executor, self._executor = self._executor, None
+		if executor is not None:
+			executor.shutdown(wait=False, cancel_futures=True)
+
+
+pdf_engine = PdfEngine()
+
+
+__all__ = ["PdfEngine", "PdfJobTimeout", "pdf_engine"]
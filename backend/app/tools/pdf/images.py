@@ -0,0 +1,227 @@
+"""Image re-encoding helpers for PDF compression.
+
+Images are located through each page's ``/Resources /XObject`` dictionary,
+decoded once with Pillow and re-encoded as baseline JPEG. A re-encoded image
+only replaces the original when it is actually smaller. Pillow releases the
+GIL while decoding, resizing and encoding, so that work runs on a thread pool.
+"""
+
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable
+
+from PIL import Image
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, IndirectObject, NameObject, NumberObject, StreamObject
+
+from app.tools.pdf.dedupe import DedupStats, dedupe_streams
+from app.tools.pdf.engine import PDF_WORKERS
+
+# Threads per PDF engine worker; the engine already runs PDF_WORKERS of
+# those in parallel, so together they should not oversubscribe the CPUs.
+PDF_IMAGE_WORKERS = int(os.getenv("PDF_IMAGE_WORKERS", str(max(1, (os.cpu_count() or 1) // max(1, PDF_WORKERS)))))
+
+# Below this size re-encoding cannot win enough to matter.
+MIN_IMAGE_BYTES = 4 * 1024
+_COPIED_KEYS = ("/SMask", "/Intent", "/Interpolate", "/Metadata", "/OC")
+
+
+@dataclass(frozen=True)
+class ImageSettings:
+	quality: int
+	scale: float = 1.0
+
+
+@dataclass
+class PdfImage:
+	reference: IndirectObject
+	original: StreamObject
+	original_size: int
+	page_size: tuple[float, float]
+	decoded: Image.Image | None = None
+	_scaled: dict[float, Image.Image] = field(default_factory=dict)
+
+	def scaled(self, scale: float) -> Image.Image:
+		"""Return the decoded image resized by ``scale``, cached per scale."""
+		assert self.decoded is not None
+		if scale >= 1.0:
+			return self.decoded
+		if scale not in self._scaled:
+			width = max(1, round(self.decoded.width * scale))
+			height = max(1, round(self.decoded.height * scale))
+			self._scaled[scale] = self.decoded.resize((width, height), Image.LANCZOS)
+		return self._scaled[scale]
+
+	def dpi_scale(self, max_dpi: int) -> float:
+		"""Scale that brings the image down to ``max_dpi`` on its page.
+
+		The image is assumed to span the page, which is exact for scans and
+		errs towards keeping more pixels for smaller placements.
+		"""
+		width_in = self.page_size[0] / 72 or 1
+		height_in = self.page_size[1] / 72 or 1
+		dpi = max(int(self.original.get("/Width", 0)) / width_in, int(self.original.get("/Height", 0)) / height_in)
+		if dpi <= max_dpi:
+			return 1.0
+		return round(max_dpi / dpi, 3)
+
+
+def _is_image(stream: StreamObject) -> bool:
+	return stream.get("/Subtype") == "/Image"
+
+
+def _is_candidate(image: StreamObject) -> bool:
+	if not _is_image(image):
+		return False
+	if image.get("/ImageMask"):
+		return False
+	# Colour-key masks and decode arrays refer to the original sample values.
+	if isinstance(image.get("/Mask"), ArrayObject) or "/Decode" in image:
+		return False
+	return len(image._data or b"") >= MIN_IMAGE_BYTES
+
+
+def dedupe_images(writer: PdfWriter) -> DedupStats:
+	"""Point identical image XObjects (and their soft masks) at one copy."""
+	return dedupe_streams(writer, _is_image)
+
+
+def collect_images(writer: PdfWriter) -> list[PdfImage]:
+	"""Return the distinct image XObjects referenced by the writer's pages."""
+	images: dict[int, PdfImage] = {}
+	for page in writer.pages:
+		resources = page.get("/Resources")
+		if resources is None:
+			continue
+		xobjects = resources.get_object().get("/XObject")
+		if xobjects is None:
+			continue
+		page_size = (float(page.mediabox.width), float(page.mediabox.height))
+		for reference in xobjects.get_object().values():
+			if not isinstance(reference, IndirectObject) or reference.idnum in images:
+				continue
+			image = reference.get_object()
+			if isinstance(image, StreamObject) and _is_candidate(image):
+				images[reference.idnum] = PdfImage(
+					reference=reference,
+					original=image,
+					original_size=len(image._data),
+					page_size=page_size,
+				)
+	return list(images.values())
+
+
+def _decode(image: PdfImage) -> bool:
+	if image.decoded is not None:
+		return True
+	try:
+		decoded = image.original.decode_as_image()
+	except Exception:
+		return False
+	if decoded is None:
+		return False
+	if decoded.mode in {"RGBA", "P", "CMYK", "YCbCr", "LAB", "RGBX"}:
+		decoded = decoded.convert("RGB")
+	elif decoded.mode == "LA":
+		decoded = decoded.convert("L")
+	if decoded.mode not in {"RGB", "L"}:
+		return False
+	decoded.load()
+	image.decoded = decoded
+	return True
+
+
+def decode_images(images: list[PdfImage], workers: int = PDF_IMAGE_WORKERS) -> list[PdfImage]:
+	"""Decode images in parallel; returns the ones Pillow could handle."""
+	if len(images) <= 1 or workers <= 1:
+		return [image for image in images if _decode(image)]
+	with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-image") as pool:
+		decoded = list(pool.map(_decode, images))
+	return [image for image, ok in zip(images, decoded) if ok]
+
+
+def encode_jpeg(image: Image.Image, quality: int) -> bytes:
+	buffer = io.BytesIO()
+	image.save(buffer, "JPEG", quality=quality, optimize=True)
+	return buffer.getvalue()
+
+
+def build_jpeg_stream(image: PdfImage, data: bytes, size: tuple[int, int], mode: str) -> DecodedStreamObject:
+	stream = DecodedStreamObject()
+	stream.set_data(data)
+	stream[NameObject("/Type")] = NameObject("/XObject")
+	stream[NameObject("/Subtype")] = NameObject("/Image")
+	stream[NameObject("/Width")] = NumberObject(size[0])
+	stream[NameObject("/Height")] = NumberObject(size[1])
+	stream[NameObject("/ColorSpace")] = NameObject("/DeviceRGB" if mode == "RGB" else "/DeviceGray")
+	stream[NameObject("/BitsPerComponent")] = NumberObject(8)
+	stream[NameObject("/Filter")] = NameObject("/DCTDecode")
+	for key in _COPIED_KEYS:
+		if key in image.original:
+			stream[NameObject(key)] = image.original.raw_get(key)
+	return stream
+
+
+def _reencode(image: PdfImage, settings: ImageSettings) -> StreamObject:
+	if image.decoded is None:
+		return image.original
+	pixels = image.scaled(settings.scale)
+	data = encode_jpeg(pixels, settings.quality)
+	if len(data) >= image.original_size:
+		return image.original
+	return build_jpeg_stream(image, data, pixels.size, pixels.mode)
+
+
+def reencode_images(
+	writer: PdfWriter,
+	images: list[PdfImage],
+	settings_for: Callable[[PdfImage], ImageSettings],
+	workers: int = PDF_IMAGE_WORKERS,
+) -> int:
+	"""Re-encode images in place in ``writer``; returns bytes saved.
+
+	Every call starts from the original decoded pixels, so a search over
+	settings never compounds JPEG loss.
+	"""
+	jobs = [(image, settings_for(image)) for image in images]
+	if len(jobs) <= 1 or workers <= 1:
+		replacements = [_reencode(image, settings) for image, settings in jobs]
+	else:
+		with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pdf-image") as pool:
+			replacements = list(pool.map(lambda job: _reencode(*job), jobs))
+
+	saved = 0
+	for image, replacement in zip(images, replacements):
+		writer._replace_object(image.reference, replacement)
+		saved += image.original_size - len(replacement._data or b"")
+	return saved
+
+
+def recompress_images(writer: PdfWriter, max_dpi: int, quality: int) -> dict:
+	"""Downsample images above ``max_dpi`` and re-encode them at ``quality``."""
+	dedup = dedupe_images(writer)
+	images = decode_images(collect_images(writer))
+	saved = reencode_images(
+		writer,
+		images,
+		lambda image: ImageSettings(quality, image.dpi_scale(max_dpi)),
+	)
+	return {
+		"images": len(images),
+		"duplicates": dedup.duplicates,
+		"bytes_saved": saved + dedup.bytes_saved,
+	}
+
+
+__all__ = [
+	"ImageSettings",
+	"PdfImage",
+	"collect_images",
+	"decode_images",
+	"dedupe_images",
+	"encode_jpeg",
+	"recompress_images",
+	"reencode_images",
+]
@@ -0,0 +1,427 @@
+"""Background job queue for PDF tools.
+
+Jobs are rows in ``pdf_jobs``. The web process stores the uploads, enqueues a
+row and returns its id right away; workers claim the oldest queued row with
+``FOR UPDATE SKIP LOCKED`` so any number of worker processes can drain the
+queue without picking up the same job twice.
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable
+
+from fastapi import HTTPException, Request, UploadFile, status
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.db.models.file import FileRecord
+from app.db.models.job import PdfJob
+from app.tools.pdf.engine import PdfJobTimeout, pdf_engine
+from app.tools.pdf.ocr import OCR_DPI, OCR_LANG, ocr_available, run_ocr
+from app.tools.pdf.operations import PdfPasswordError, compress_document, compress_to_target, merge_documents
+from app.tools.pdf.service import (
+	COMPRESSION_LEVELS,
+	OUTPUT_DIR,
+	compressed_output_name,
+	merged_output_name,
+	ocr_output_name,
+	save_upload,
+	slugify_filename,
+)
+from app.tools.registry import TOOL_DEFINITIONS
+from app.usage.tracker import increment_usage_async
+
+logger = logging.getLogger("app.tools.pdf.jobs")
+
+PDF_JOB_WORKERS_INLINE = int(os.getenv("PDF_JOB_WORKERS_INLINE", "1"))
+PDF_JOB_POLL_SECONDS = float(os.getenv("PDF_JOB_POLL_SECONDS", "1"))
+PDF_JOB_MAX_ATTEMPTS = int(os.getenv("PDF_JOB_MAX_ATTEMPTS", "2"))
+PDF_JOB_HEARTBEAT_SECONDS = float(os.getenv("PDF_JOB_HEARTBEAT_SECONDS", "15"))
+# A running job whose heartbeat is older than this belongs to a dead worker.
+PDF_JOB_STALE_SECONDS = float(os.getenv("PDF_JOB_STALE_SECONDS", str(max(60.0, PDF_JOB_HEARTBEAT_SECONDS * 4))))
+STALE_CHECK_INTERVAL_SECONDS = 60
+
+
+@dataclass(frozen=True)
+class JobTool:
+	build_call: Callable[[list[str], str, dict], tuple[Callable, tuple]]
+	output_name: Callable[[list[str]], str]
+	max_files: int | None
+	password_detail: str
+	# The function dispatches its own work to the engines; call it directly
+	# instead of running it on the PDF engine.
+	orchestrates: bool = False
+
+
+def _compress_call(paths: list[str], output_path: str, params: dict) -> tuple[Callable, tuple]:
+	level = params.get("level", "balanced")
+	target_kb = params.get("target_kb")
+	if target_kb is None:
+		return compress_document, (paths[0], output_path, level)
+	return compress_to_target, (paths[0], output_path, target_kb * 1024, level)
+
+
+JOB_TOOLS: dict[str, JobTool] = {
+	"pdf_merge": JobTool(
+		build_call=lambda paths, output_path, params: (merge_documents, (paths, output_path)),
+		output_name=merged_output_name,
+		max_files=None,
+		password_detail="One of the PDFs is password protected. Please unlock it first and try again.",
+	),
+	"pdf_compress": JobTool(
+		build_call=_compress_call,
+		output_name=lambda slugs: compressed_output_name(slugs[0]),
+		max_files=1,
+		password_detail="This PDF is password protected. Please unlock it first and try again.",
+	),
+	"pdf_ocr": JobTool(
+		build_call=lambda paths, output_path, params: (run_ocr, (paths[0], output_path, OCR_DPI, OCR_LANG)),
+		output_name=lambda slugs: ocr_output_name(slugs[0]),
+		max_files=1,
+		password_detail="This PDF is password protected. Please unlock it first and try again.",
+		orchestrates=True,
+	),
+}
+
+_REGISTERED_SLUGS = {definition["slug"] for definition in TOOL_DEFINITIONS}
+
+
+def _job_payload(job: PdfJob) -> dict:
+	return {
+		"id": str(job.id),
+		"tool": job.tool,
+		"status": job.status,
+		"progress": job.progress,
+		"file": job.output_name if job.status == "succeeded" else None,
+		"error": job.error,
+		"created_at": job.created_at.isoformat() if job.created_at else None,
+		"finished_at": job.finished_at.isoformat() if job.finished_at else None,
+	}
+
+
+async def enqueue_job(
+	request: Request,
+	tool: str,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+	level: str = "balanced",
+	target_kb: int | None = None,
+) -> dict:
+	spec = JOB_TOOLS.get(tool)
+	if spec is None or tool not in _REGISTERED_SLUGS:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported tool.")
+	if not files or (spec.max_files is not None and len(files) > spec.max_files):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid number of files for this tool.")
+	if tool == "pdf_ocr" and not ocr_available():
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="OCR is not available right now. Please try again later.",
+		)
+	if tool == "pdf_compress" and level not in COMPRESSION_LEVELS:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid compression level.")
+	if target_kb is not None and target_kb <= 0:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid target size.")
+
+	# Enforce daily usage before accepting the job.
+	await increment_usage_async(db, request, current_user, tool=tool)
+
+	slugs: list[str] = []
+	input_paths: list[str] = []
+	for index, file in enumerate(files, start=1):
+		slugs.append(slugify_filename(file.filename or f"document-{index}", f"file-{index}"))
+		spooled = await save_upload(file)
+		input_paths.append(str(spooled.path))
+
+	job = PdfJob(
+		user_id=current_user.id if current_user else None,
+		tool=tool,
+		status="queued",
+		params={"level": level, "target_kb": target_kb} if tool == "pdf_compress" else {},
+		input_paths=input_paths,
+		output_name=spec.output_name(slugs),
+	)
+	db.add(job)
+	await db.commit()
+	await db.refresh(job)
+
+	return {
+		"success": True,
+		"job_id": str(job.id),
+		"status": job.status,
+	}
+
+
+def get_job(job_id: str, current_user, db: Session) -> dict:
+	try:
+		parsed_id = uuid.UUID(job_id)
+	except ValueError as exc:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found") from exc
+
+	job = db.get(PdfJob, parsed_id)
+	if not job:
+		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+	if job.user_id:
+		if not current_user:
+			raise HTTPException(
+				status_code=status.HTTP_401_UNAUTHORIZED,
+				detail="Missing authorization token",
+				headers={"WWW-Authenticate": "Bearer"},
+			)
+		if job.user_id != current_user.id:
+			raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to view this job")
+
+	return _job_payload(job)
+
+
+def claim_next_job(db: Session) -> PdfJob | None:
+	job: PdfJob | None = (
+		db.query(PdfJob)
+		.filter(PdfJob.status == "queued")
+		.order_by(PdfJob.created_at.asc())
+		.with_for_update(skip_locked=True)
+		.first()
+	)
+	if not job:
+		db.rollback()
+		return None
+
+	now = datetime.utcnow()
+	job.status = "running"
+	job.attempts += 1
+	job.started_at = now
+	job.touch(now)
+	db.add(job)
+	db.commit()
+	db.refresh(job)
+	return job
+
+
+def _progress_writer(db: Session, job: PdfJob, attempt: int) -> Callable[[int], None]:
+	reported = job.progress
+
+	def report(percent: int) -> None:
+		nonlocal reported
+		# Throttle writes; a 500-page compress should not mean 500 commits.
+		if percent - reported < 5:
+			return
+		reported = percent
+		db.execute(_this_attempt(job, attempt).values(progress=percent, updated_at=datetime.utcnow()))
+		db.commit()
+
+	return report
+
+
+class _Heartbeat:
+	"""Refresh ``updated_at`` of a running job from a side thread.
+
+	Slow jobs stay alive as long as their worker does, so
+	``requeue_stale_jobs`` only picks up jobs of workers that died. If the
+	row stops being this attempt's (it was requeued after all), ``lost`` is
+	set and the worker must leave the job and its files alone.
+	"""
+
+	def __init__(self, db: Session, job: PdfJob) -> None:
+		self._bind = db.get_bind()
+		self._job_id = job.id
+		self._attempt = job.attempts
+		self._stop = threading.Event()
+		self._thread = threading.Thread(target=self._run, name=f"pdf-job-heartbeat-{job.id}", daemon=True)
+		self.lost = False
+
+	def _run(self) -> None:
+		while not self._stop.wait(PDF_JOB_HEARTBEAT_SECONDS):
+			try:
+				with self._bind.begin() as connection:
+					result = connection.execute(
+						update(PdfJob)
+						.where(
+							PdfJob.id == self._job_id,
+							PdfJob.status == "running",
+							PdfJob.attempts == self._attempt,
+						)
+						.values(updated_at=datetime.utcnow())
+					)
+			except Exception:
+				logger.warning("Heartbeat for PDF job %s failed", self._job_id, exc_info=True)
+				continue
+			if result.rowcount == 0:
+				self.lost = True
+				return
+
+	def __enter__(self) -> "_Heartbeat":
+		self._thread.start()
+		return self
+
+	def __exit__(self, *exc_info) -> None:
+		self._stop.set()
+		self._thread.join()
+
+
+def _this_attempt(job: PdfJob, attempt: int):
+	return update(PdfJob).where(PdfJob.id == job.id, PdfJob.status == "running", PdfJob.attempts == attempt)
+
+
+def _finish_job(
+	db: Session,
+	job: PdfJob,
+	attempt: int,
+	job_status: str,
+	error: str | None = None,
+	file_record: FileRecord | None = None,
+) -> bool:
+	"""Record the outcome of ``attempt``; False when the job is no longer that attempt's.
+
+	The row is only written while it is still running under ``attempt``, so
+	a worker whose job was requeued cannot overwrite the new attempt.
+	"""
+	now = datetime.utcnow()
+	values = {"status": job_status, "error": error, "finished_at": now, "updated_at": now}
+	if job_status == "succeeded":
+		values["progress"] = 100
+	result = db.execute(_this_attempt(job, attempt).values(**values))
+	if result.rowcount == 0:
+		db.rollback()
+		logger.warning("PDF job %s was requeued while running; leaving it to its new attempt", job.id)
+		return False
+	if file_record is not None:
+		db.add(file_record)
+	db.commit()
+	return True
+
+
+def run_job(db: Session, job: PdfJob, in_process: bool = True) -> None:
+	"""Execute a claimed job.
+
+	Dedicated workers run the operation in-process so they can report
+	page-level progress; inline workers hand it to the PDF engine instead so
+	pypdf never competes with the event loop of the web process.
+	"""
+	spec = JOB_TOOLS.get(job.tool)
+	input_paths = list(job.input_paths or [])
+	attempt = job.attempts
+	heartbeat = _Heartbeat(db, job)
+	owned = True
+	try:
+		if spec is None:
+			owned = _finish_job(db, job, attempt, "failed", error="Unsupported tool.")
+			return
+		if not all(os.path.isfile(path) for path in input_paths):
+			owned = _finish_job(
+				db, job, attempt, "failed", error="Uploaded files expired before processing. Please upload again."
+			)
+			return
+
+		output_path = os.path.join(OUTPUT_DIR, job.output_name)
+		func, args = spec.build_call(input_paths, output_path, job.params or {})
+		try:
+			with heartbeat:
+				if in_process or spec.orchestrates:
+					func(*args, progress=_progress_writer(db, job, attempt))
+				else:
+					pdf_engine.run_blocking(func, *args)
+		except PdfPasswordError:
+			owned = _finish_job(db, job, attempt, "failed", error=spec.password_detail)
+			return
+		except PdfJobTimeout:
+			owned = _finish_job(db, job, attempt, "failed", error="Processing took too long. Please try a smaller file.")
+			return
+		except Exception:
+			logger.exception("PDF job %s failed", job.id)
+			db.rollback()
+			owned = _finish_job(db, job, attempt, "failed", error="Unable to process this file right now.")
+			return
+
+		file_record = None
+		if job.user_id:
+			file_record = FileRecord(
+				user_id=job.user_id,
+				tool=job.tool,
+				filename=job.output_name,
+				storage_path=output_path,
+			)
+		owned = _finish_job(db, job, attempt, "succeeded", file_record=file_record)
+	finally:
+		# A requeued job still needs its inputs for the next attempt.
+		if owned and not heartbeat.lost:
+			for path in input_paths:
+				try:
+					os.remove(path)
+				except OSError:
+					pass
+
+
+def requeue_stale_jobs(db: Session) -> int:
+	"""Return jobs orphaned by a crashed worker to the queue (or fail them).
+
+	A job counts as orphaned once its heartbeat (``updated_at``) is older than
+	PDF_JOB_STALE_SECONDS; a slow job on a live worker keeps it fresh.
+	"""
+	cutoff = datetime.utcnow() - timedelta(seconds=PDF_JOB_STALE_SECONDS)
+	stale = (
+		db.query(PdfJob)
+		.filter(PdfJob.status == "running", PdfJob.updated_at < cutoff)
+		.with_for_update(skip_locked=True)
+		.all()
+	)
+	now = datetime.utcnow()
+	for job in stale:
+		if job.attempts >= PDF_JOB_MAX_ATTEMPTS:
+			job.status = "failed"
+			job.error = "Processing did not finish. Please try again."
+			job.finished_at = now
+		else:
+			job.status = "queued"
+			job.progress = 0
+		job.touch(now)
+		db.add(job)
+	db.commit()
+	return len(stale)
+
+
+def run_worker(session_factory, in_process: bool = True, stop_event: threading.Event | None = None) -> None:
+	"""Drain the job queue until ``stop_event`` is set."""
+	stop_event = stop_event or threading.Event()
+	next_stale_check = 0.0
+	while not stop_event.is_set():
+		try:
+			with session_factory() as db:
+				if time.monotonic() >= next_stale_check:
+					requeue_stale_jobs(db)
+					next_stale_check = time.monotonic() + STALE_CHECK_INTERVAL_SECONDS
+				job = claim_next_job(db)
+				if job:
+					run_job(db, job, in_process=in_process)
+					continue
+		except Exception:
+			logger.exception("PDF job worker iteration failed")
+		stop_event.wait(PDF_JOB_POLL_SECONDS)
+
+
+def start_inline_workers(session_factory, count: int = PDF_JOB_WORKERS_INLINE) -> None:
+	for index in range(max(0, count)):
+		threading.Thread(
+			target=run_worker,
+			args=(session_factory,),
+			kwargs={"in_process": False},
+			name=f"pdf-job-worker-{index}",
+			daemon=True,
+		).start()
+
+
+__all__ = [
+	"JOB_TOOLS",
+	"claim_next_job",
+	"enqueue_job",
+	"get_job",
+	"requeue_stale_jobs",
+	"run_job",
+	"run_worker",
+	"start_inline_workers",
+]
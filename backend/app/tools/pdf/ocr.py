@@ -0,0 +1,180 @@
+"""OCR for scanned PDFs: a searchable text layer over the original pages.
+
+The work is split in three steps so each can run where it fits:
+
+1. ``find_pages_without_text`` (PDF engine) lists the pages that have no
+   extractable text; pages that already have text are left alone.
+2. ``ocr_page`` (OCR engine, one call per page) renders a page with
+   pdfium and has Tesseract produce a text-only PDF page for it.
+3. ``add_text_layers`` (PDF engine) stamps those invisible text pages onto
+   the original pages, so the output keeps the original page content.
+
+``run_ocr`` drives the steps from any thread and reports progress per
+finished page. pypdfium2, pytesseract and the ``tesseract`` binary are
+optional; ``ocr_available`` tells whether they are installed.
+"""
+
+import io
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+
+from pypdf import PdfReader, PdfWriter, Transformation
+
+from app.tools.pdf.engine import PdfEngine, pdf_engine
+from app.tools.pdf.operations import PDF_READER_MMAP, ProgressCallback, _report, open_pdf
+
+try:
+	import pypdfium2
+	import pytesseract
+except ImportError:
+	pypdfium2 = None
+	pytesseract = None
+
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+OCR_WORKERS = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+OCR_PAGE_TIMEOUT_SECONDS = float(os.getenv("OCR_PAGE_TIMEOUT_SECONDS", "120"))
+OCR_MIN_TEXT_CHARS = int(os.getenv("OCR_MIN_TEXT_CHARS", "16"))
+TESSERACT_CMD = os.getenv("TESSERACT_CMD", "tesseract")
+
+# Pages are already spread over OCR_WORKERS processes; Tesseract's own
+# OpenMP threads would only oversubscribe the cores.
+os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+
+# pdfium is not thread-safe, so pages always go to worker processes.
+ocr_engine = PdfEngine(mode="process", workers=OCR_WORKERS, timeout=OCR_PAGE_TIMEOUT_SECONDS)
+
+
+class OcrUnavailableError(Exception):
+	"""Raised when pypdfium2, pytesseract or the tesseract binary is missing."""
+
+
+@lru_cache(maxsize=1)
+def ocr_available() -> bool:
+	return pypdfium2 is not None and pytesseract is not None and shutil.which(TESSERACT_CMD) is not None
+
+
+def _page_has_text(page, min_chars: int) -> bool:
+	resources = page.get("/Resources")
+	resources = resources.get_object() if resources is not None else {}
+	if not resources.get("/Font"):
+		# No fonts, no text: skip the (slow) extraction for plain scans.
+		return False
+	try:
+		return len(page.extract_text().strip()) >= min_chars
+	except Exception:
+		return False
+
+
+def find_pages_without_text(
+	input_path: str,
+	min_chars: int = OCR_MIN_TEXT_CHARS,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> tuple[int, list[int]]:
+	"""Return the page count and the 0-based indexes of pages to OCR."""
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		pending = [index for index, page in enumerate(reader.pages) if not _page_has_text(page, min_chars)]
+		return len(reader.pages), pending
+
+
+def ocr_page(input_path: str, index: int, dpi: int = OCR_DPI, lang: str = OCR_LANG) -> bytes:
+	"""Render page ``index`` and return a one-page, text-only PDF of its words.
+
+	Rotation is reset before rendering so the layer lines up with the
+	unrotated crop box it is stamped onto.
+	"""
+	pytesseract.pytesseract.tesseract_cmd = TESSERACT_CMD
+	document = pypdfium2.PdfDocument(input_path)
+	try:
+		page = document[index]
+		page.set_rotation(0)
+		image = page.render(scale=dpi / 72).to_pil()
+		page.close()
+	finally:
+		document.close()
+	return pytesseract.image_to_pdf_or_hocr(
+		image,
+		extension="pdf",
+		lang=lang,
+		config=f"--dpi {dpi} -c textonly_pdf=1",
+	)
+
+
+def add_text_layers(
+	input_path: str,
+	output_path: str,
+	layers: dict[int, bytes],
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		writer = PdfWriter()
+		for index, page in enumerate(reader.pages):
+			target = writer.add_page(page)
+			layer_pdf = layers.get(index)
+			if not layer_pdf:
+				continue
+			layer = PdfReader(io.BytesIO(layer_pdf)).pages[0]
+			box = target.cropbox
+			scale_x = float(box.width) / float(layer.mediabox.width)
+			scale_y = float(box.height) / float(layer.mediabox.height)
+			target.merge_transformed_page(
+				layer,
+				Transformation().scale(scale_x, scale_y).translate(float(box.left), float(box.bottom)),
+			)
+		with open(output_path, "wb") as handle:
+			writer.write(handle)
+	return {"pages": len(writer.pages)}
+
+
+def run_ocr(
+	input_path: str,
+	output_path: str,
+	dpi: int = OCR_DPI,
+	lang: str = OCR_LANG,
+	progress: ProgressCallback | None = None,
+	engine: PdfEngine | None = None,
+) -> dict:
+	"""OCR ``input_path`` into ``output_path`` and return page counts.
+
+	Only orchestrates: the PDF steps run on the PDF engine and every page on
+	``engine`` (the shared OCR engine by default), so this can be called from
+	any thread.
+	"""
+	if not ocr_available():
+		raise OcrUnavailableError()
+	engine = engine or ocr_engine
+
+	page_count, pending = pdf_engine.run_blocking(find_pages_without_text, input_path)
+	layers: dict[int, bytes] = {}
+	if pending:
+		with ThreadPoolExecutor(max_workers=min(len(pending), engine.workers), thread_name_prefix="ocr") as pool:
+			futures = {
+				pool.submit(engine.run_blocking, ocr_page, input_path, index, dpi, lang): index
+				for index in pending
+			}
+			try:
+				for done, future in enumerate(as_completed(futures), start=1):
+					layers[futures[future]] = future.result()
+					_report(progress, done, len(pending))
+			except BaseException:
+				for future in futures:
+					future.cancel()
+				raise
+		pdf_engine.run_blocking(add_text_layers, input_path, output_path, layers)
+	else:
+		shutil.copyfile(input_path, output_path)
+
+	return {"pages": page_count, "ocr_pages": len(pending), "skipped_pages": page_count - len(pending)}
+
+
+__all__ = [
+	"OcrUnavailableError",
+	"add_text_layers",
+	"find_pages_without_text",
+	"ocr_available",
+	"ocr_engine",
+	"ocr_page",
+	"run_ocr",
+]
@@ -0,0 +1,345 @@
+"""Office document conversion on a pool of warm LibreOffice processes.
+
+Starting LibreOffice takes seconds, far longer than converting a typical
+document. ``OfficePool`` keeps OFFICE_WORKERS ``unoserver`` processes (each
+driving its own headless ``soffice`` with a private profile) running
+between requests and hands them out one conversion at a time:
+
+* at most OFFICE_QUEUE_SIZE callers wait for a free converter; beyond that,
+  and after OFFICE_QUEUE_TIMEOUT_SECONDS of waiting, ``OfficeBusyError``
+  is raised instead of piling up requests;
+* a conversion running longer than OFFICE_JOB_TIMEOUT_SECONDS has its
+  process group killed and the converter is restarted;
+* a converter is restarted after OFFICE_MAX_CONVERSIONS conversions, so
+  LibreOffice memory growth stays capped.
+
+The ``unoserver`` package and command and LibreOffice are optional;
+``office_available`` tells whether they are installed.
+"""
+
+import logging
+import os
+import queue
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from pathlib import Path
+from xmlrpc.client import Fault, ServerProxy
+
+try:
+	from unoserver.client import UnoClient
+except ImportError:
+	UnoClient = None
+
+OFFICE_WORKERS = int(os.getenv("OFFICE_WORKERS", "2"))
+OFFICE_QUEUE_SIZE = int(os.getenv("OFFICE_QUEUE_SIZE", "8"))
+OFFICE_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OFFICE_QUEUE_TIMEOUT_SECONDS", "30"))
+OFFICE_JOB_TIMEOUT_SECONDS = float(os.getenv("OFFICE_JOB_TIMEOUT_SECONDS", "60"))
+OFFICE_START_TIMEOUT_SECONDS = float(os.getenv("OFFICE_START_TIMEOUT_SECONDS", "60"))
+OFFICE_MAX_CONVERSIONS = int(os.getenv("OFFICE_MAX_CONVERSIONS", "200"))
+OFFICE_WARM_ON_STARTUP = os.getenv("OFFICE_WARM_ON_STARTUP", "1").lower() in {"1", "true", "yes"}
+UNOSERVER_CMD = os.getenv("UNOSERVER_CMD", "unoserver")
+SOFFICE_CMD = os.getenv("SOFFICE_CMD", "soffice")
+
+logger = logging.getLogger("app.tools.pdf.office")
+
+
+class OfficeUnavailableError(Exception):
+	"""Raised when unoserver or LibreOffice is not installed or will not start."""
+
+
+class OfficeBusyError(Exception):
+	"""Raised when every converter is busy and the wait queue is full."""
+
+
+class OfficeTimeout(Exception):
+	"""Raised when a conversion does not finish within its timeout."""
+
+
+class OfficeConversionError(Exception):
+	"""Raised when LibreOffice cannot convert the document."""
+
+
+@lru_cache(maxsize=1)
+def office_available() -> bool:
+	return UnoClient is not None and shutil.which(UNOSERVER_CMD) is not None and shutil.which(SOFFICE_CMD) is not None
+
+
+def _free_port() -> int:
+	with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as probe:
+		probe.bind(("127.0.0.1", 0))
+		return probe.getsockname()[1]
+
+
+class OfficeConverter:
+	"""One ``unoserver`` process and the LibreOffice instance it drives."""
+
+	def __init__(self, index: int) -> None:
+		self.index = index
+		self.port = 0
+		self.conversions = 0
+		self._process: subprocess.Popen | None = None
+		self._profile: str | None = None
+
+	def alive(self) -> bool:
+		return self._process is not None and self._process.poll() is None
+
+	def start(self, timeout: float = OFFICE_START_TIMEOUT_SECONDS) -> None:
+		if self._profile is None:
+			self._profile = tempfile.mkdtemp(prefix=f"caniedit-office-{self.index}-")
+		self.port = _free_port()
+		self._process = subprocess.Popen(
+			[
+				UNOSERVER_CMD,
+				"--interface", "127.0.0.1",
+				"--port", str(self.port),
+				"--uno-interface", "127.0.0.1",
+				"--uno-port", str(_free_port()),
+				"--executable", shutil.which(SOFFICE_CMD) or SOFFICE_CMD,
+				"--user-installation", Path(self._profile).as_uri(),
+			],
+			stdout=subprocess.DEVNULL,
+			stderr=subprocess.DEVNULL,
+			# Own process group, so a kill also takes down soffice.
+			start_new_session=True,
+		)
+		self.conversions = 0
+
+		deadline = time.monotonic() + timeout
+		while time.monotonic() < deadline:
+			if not self.alive():
+				break
+			try:
+				with ServerProxy(f"http://127.0.0.1:{self.port}", allow_none=True) as proxy:
+					proxy.info()
+				return
+			except OSError:
+				time.sleep(0.25)
+		self.stop(kill=True)
+		raise OfficeUnavailableError(f"Converter {self.index} did not start")
+
+	def stop(self, kill: bool = False) -> None:
+		process, self._process = self._process, None
+		if process is not None and process.poll() is None:
+			try:
+				os.killpg(process.pid, signal.SIGKILL if kill else signal.SIGTERM)
+				process.wait(timeout=10)
+			except ProcessLookupError:
+				pass
+			except subprocess.TimeoutExpired:
+				os.killpg(process.pid, signal.SIGKILL)
+				process.wait()
+		if kill and self._profile is not None:
+			# A killed instance can leave its profile locked or half-written.
+			shutil.rmtree(self._profile, ignore_errors=True)
+			self._profile = None
+
+	def restart(self) -> None:
+		self.stop()
+		self.start()
+
+	def convert(
+		self,
+		input_path: str,
+		output_path: str,
+		convert_to: str,
+		filtername: str | None = None,
+		infiltername: str | None = None,
+		timeout: float = OFFICE_JOB_TIMEOUT_SECONDS,
+	) -> None:
+		outcome: dict = {}
+
+		def run() -> None:
+			try:
+				UnoClient(port=str(self.port), host_location="local").convert(
+					inpath=input_path,
+					outpath=output_path,
+					convert_to=convert_to,
+					filtername=filtername,
+					infiltername=infiltername,
+				)
+			except BaseException as exc:
+				outcome["error"] = exc
+
+		# The RPC call has no timeout of its own; wait for it on a helper
+		# thread and kill the converter if it hangs.
+		worker = threading.Thread(target=run, name=f"office-convert-{self.index}", daemon=True)
+		worker.start()
+		worker.join(timeout)
+		self.conversions += 1
+		if worker.is_alive():
+			self.stop(kill=True)
+			raise OfficeTimeout(input_path)
+
+		error = outcome.get("error")
+		if isinstance(error, (Fault, RuntimeError)):
+			raise OfficeConversionError(str(error)) from error
+		if error is not None:
+			# Lost the connection: the converter is restarted before reuse.
+			self.stop(kill=True)
+			raise OfficeConversionError(str(error)) from error
+		if not os.path.isfile(output_path) or os.path.getsize(output_path) == 0:
+			raise OfficeConversionError(input_path)
+
+
+class OfficePool:
+	def __init__(
+		self,
+		workers: int = OFFICE_WORKERS,
+		queue_size: int = OFFICE_QUEUE_SIZE,
+		queue_timeout: float = OFFICE_QUEUE_TIMEOUT_SECONDS,
+		timeout: float = OFFICE_JOB_TIMEOUT_SECONDS,
+		max_conversions: int = OFFICE_MAX_CONVERSIONS,
+	) -> None:
+		self.workers = max(1, workers)
+		self.queue_size = max(0, queue_size)
+		self.queue_timeout = queue_timeout
+		self.timeout = timeout
+		self.max_conversions = max(1, max_conversions)
+		self._idle: queue.Queue[OfficeConverter] = queue.Queue()
+		self._converters: list[OfficeConverter] = []
+		self._lock = threading.Lock()
+		self._started = False
+		self._waiting = 0
+		self._busy = 0
+		self._conversions = 0
+		self._failures = 0
+		self._timeouts = 0
+		self._rejected = 0
+		self._restarts = 0
+
+	def _start_converter(self, converter: OfficeConverter) -> None:
+		"""(Re)start ``converter`` in the background and return it to the idle queue."""
+
+		def run() -> None:
+			try:
+				converter.restart()
+			except Exception:
+				# Stays in the pool stopped; the next caller retries the start.
+				logger.exception("Office converter %s failed to start", converter.index)
+			with self._lock:
+				retired = converter not in self._converters
+			if retired:
+				# The pool was shut down while this converter was starting.
+				converter.stop()
+				return
+			self._idle.put(converter)
+
+		threading.Thread(target=run, name=f"office-start-{converter.index}", daemon=True).start()
+
+	def start(self) -> None:
+		"""Start the converters without waiting for them to be ready."""
+		with self._lock:
+			if self._started:
+				return
+			self._started = True
+			self._converters = [OfficeConverter(index) for index in range(self.workers)]
+		for converter in self._converters:
+			self._start_converter(converter)
+
+	def _acquire(self) -> OfficeConverter:
+		with self._lock:
+			if self._busy + self._waiting >= self.workers + self.queue_size:
+				self._rejected += 1
+				raise OfficeBusyError()
+			self._waiting += 1
+		try:
+			converter = self._idle.get(timeout=self.queue_timeout)
+		except queue.Empty as exc:
+			with self._lock:
+				self._rejected += 1
+			raise OfficeBusyError() from exc
+		finally:
+			with self._lock:
+				self._waiting -= 1
+		with self._lock:
+			self._busy += 1
+		return converter
+
+	def _release(self, converter: OfficeConverter) -> None:
+		with self._lock:
+			self._busy -= 1
+			recycle = not converter.alive() or converter.conversions >= self.max_conversions
+			if recycle:
+				self._restarts += 1
+		if recycle:
+			self._start_converter(converter)
+		else:
+			self._idle.put(converter)
+
+	def convert(
+		self,
+		input_path: str,
+		output_path: str,
+		convert_to: str,
+		filtername: str | None = None,
+		infiltername: str | None = None,
+	) -> None:
+		"""Convert ``input_path`` into ``output_path`` on a warm converter.
+
+		Blocks the calling thread; run it off the event loop.
+		"""
+		if not office_available():
+			raise OfficeUnavailableError()
+		self.start()
+
+		converter = self._acquire()
+		try:
+			if not converter.alive():
+				converter.start()
+			converter.convert(input_path, output_path, convert_to, filtername, infiltername, timeout=self.timeout)
+		except OfficeTimeout:
+			with self._lock:
+				self._timeouts += 1
+			raise
+		except Exception:
+			with self._lock:
+				self._failures += 1
+			raise
+		else:
+			with self._lock:
+				self._conversions += 1
+		finally:
+			self._release(converter)
+
+	def metrics(self) -> dict:
+		with self._lock:
+			return {
+				"available": office_available(),
+				"workers": self.workers,
+				"running": sum(1 for converter in self._converters if converter.alive()),
+				"busy": self._busy,
+				"waiting": self._waiting,
+				"queue_size": self.queue_size,
+				"conversions": self._conversions,
+				"failures": self._failures,
+				"timeouts": self._timeouts,
+				"rejected": self._rejected,
+				"restarts": self._restarts,
+			}
+
+	def shutdown(self) -> None:
+		with self._lock:
+			converters, self._converters = self._converters, []
+			self._idle = queue.Queue()
+			self._started = False
+		for converter in converters:
+			converter.stop()
+
+
+office_pool = OfficePool()
+
+__all__ = [
+	"OfficeBusyError",
+	"OfficeConversionError",
+	"OfficePool",
+	"OfficeTimeout",
+	"OfficeUnavailableError",
+	"office_available",
+	"office_pool",
+]
@@ -0,0 +1,445 @@
+"""CPU-bound PDF operations.
+
+These functions only deal with files on disk so they can run inside a worker
+process of the PDF engine. They must not touch the database or FastAPI.
+"""
+
+import io
+import mmap
+import os
+import re
+import zipfile
+from contextlib import ExitStack, contextmanager
+from typing import BinaryIO, Callable, Iterator
+
+from pypdf import PageObject, PdfReader, PdfWriter
+from pypdf.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+from app.tools.pdf.dedupe import dedupe_streams
+from app.tools.pdf.images import (
+	ImageSettings,
+	PdfImage,
+	collect_images,
+	decode_images,
+	dedupe_images,
+	recompress_images,
+	reencode_images,
+)
+
+ProgressCallback = Callable[[int], None]
+
+# PdfReader(path) copies the whole file into a BytesIO. Mapping the spooled
+# upload instead lets pypdf seek/read straight from the page cache.
+PDF_READER_MMAP = os.getenv("PDF_READER_MMAP", "1").lower() in {"1", "true", "yes"}
+
+# Merging exports of the same template repeats every font, logo and ICC
+# profile once per input; collapse identical streams before writing.
+PDF_MERGE_DEDUPE = os.getenv("PDF_MERGE_DEDUPE", "1").lower() in {"1", "true", "yes"}
+
+# Image stage per compression level: (DPI ceiling, JPEG quality). "light"
+# keeps images untouched.
+LEVEL_IMAGE_SETTINGS = {
+	"balanced": (150, 75),
+	"strong": (96, 55),
+}
+
+# Search space for "compress to N KB": downscale steps tried in order, with a
+# bisection over JPEG quality inside each step.
+TARGET_SCALES = (1.0, 0.75, 0.5, 0.35, 0.25)
+TARGET_MIN_QUALITY = 20
+TARGET_MAX_QUALITY = 85
+
+
+# Bytes per object beyond its dictionary and stream data ("n 0 obj",
+# "stream"/"endstream", xref entry), per page (/Parent entry and /Kids slot
+# added by the writer) and per part (header, catalog, trailer); used when
+# estimating split part sizes.
+OBJECT_OVERHEAD_BYTES = 48
+PAGE_OVERHEAD_BYTES = 32
+PART_OVERHEAD_BYTES = 1024
+
+
+class PdfPasswordError(Exception):
+	"""Raised when an input PDF is encrypted with a non-empty password."""
+
+
+class PdfInputError(ValueError):
+	"""Raised when tool parameters do not fit the document (e.g. page 9 of 5)."""
+
+
+def _open_reader(source: str | BinaryIO | mmap.mmap, input_path: str, password: str = "") -> PdfReader:
+	reader = PdfReader(source)
+
+	# 🔐 Handle encrypted PDFs
+	if reader.is_encrypted:
+		try:
+			decrypted = reader.decrypt(password)  # empty unless the caller has one
+		except Exception:
+			decrypted = 0
+
+		if not decrypted:
+			raise PdfPasswordError(input_path)
+
+	return reader
+
+
+@contextmanager
+def open_pdf(input_path: str, use_mmap: bool = PDF_READER_MMAP, password: str = "") -> Iterator[PdfReader]:
+	"""Open ``input_path`` for reading, memory-mapped when possible.
+
+	pypdf resolves objects lazily, so the mapping must stay open until the
+	writer that consumes these pages has been written out.
+	"""
+	if not use_mmap:
+		yield _open_reader(input_path, input_path, password)
+		return
+
+	with open(input_path, "rb") as handle:
+		if os.fstat(handle.fileno()).st_size == 0:
+			# mmap cannot map empty files; let pypdf raise its usual error.
+			yield _open_reader(handle, input_path, password)
+			return
+		with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+			yield _open_reader(mapped, input_path, password)
+
+
+def _report(progress: ProgressCallback | None, done: int, total: int) -> None:
+	if progress is not None and total:
+		progress(min(99, done * 100 // total))
+
+
+def merge_documents(
+	input_paths: list[str],
+	output_path: str,
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+	dedupe: bool = PDF_MERGE_DEDUPE,
+) -> dict:
+	writer = PdfWriter()
+	with ExitStack() as stack:
+		for index, input_path in enumerate(input_paths, start=1):
+			reader = stack.enter_context(open_pdf(input_path, use_mmap=use_mmap))
+			for page in reader.pages:
+				writer.add_page(page)
+			_report(progress, index, len(input_paths))
+
+		result = {"pages": len(writer.pages)}
+		if dedupe and len(input_paths) > 1:
+			# Any stream may be shared: fonts, images, ICC profiles, forms,
+			# even identical page content.
+			result["dedup"] = dedupe_streams(writer, lambda stream: True).as_dict()
+
+		with open(output_path, "wb") as handle:
+			writer.write(handle)
+
+	return result
+
+
+def _compressed_writer(reader: PdfReader, level: str, progress: ProgressCallback | None) -> PdfWriter:
+	writer = PdfWriter()
+	total_pages = len(reader.pages)
+	for index, page in enumerate(reader.pages, start=1):
+		try:
+			page.compress_content_streams()
+		except Exception:
+			pass
+		writer.add_page(page)
+		_report(progress, index, total_pages)
+
+	if level == "strong":
+		writer.add_metadata({"/Producer": "CanIEdit Compression"})
+	return writer
+
+
+def compress_document(
+	input_path: str,
+	output_path: str,
+	level: str = "balanced",
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		writer = _compressed_writer(reader, level, progress)
+		result = {"pages": len(writer.pages)}
+		if level in LEVEL_IMAGE_SETTINGS:
+			max_dpi, quality = LEVEL_IMAGE_SETTINGS[level]
+			result["images"] = recompress_images(writer, max_dpi, quality)
+		with open(output_path, "wb") as handle:
+			writer.write(handle)
+
+	return result
+
+
+def _serialize(writer: PdfWriter) -> bytes:
+	buffer = io.BytesIO()
+	writer.write(buffer)
+	return buffer.getvalue()
+
+
+def _search_image_settings(
+	writer: PdfWriter,
+	images: list[PdfImage],
+	target_bytes: int,
+) -> tuple[bytes, ImageSettings, int]:
+	iterations = 0
+
+	def measure(settings: ImageSettings) -> bytes:
+		nonlocal iterations
+		iterations += 1
+		reencode_images(writer, images, lambda image: settings)
+		return _serialize(writer)
+
+	# Try the most aggressive setting first: if even that misses the budget
+	# there is nothing to search for.
+	floor = ImageSettings(TARGET_MIN_QUALITY, TARGET_SCALES[-1])
+	smallest = measure(floor)
+	if len(smallest) > target_bytes:
+		return smallest, floor, iterations
+
+	for scale in TARGET_SCALES:
+		settings = ImageSettings(TARGET_MIN_QUALITY, scale)
+		data = smallest if settings == floor else measure(settings)
+		if len(data) > target_bytes:
+			continue
+
+		best, best_settings = data, settings
+		low, high = TARGET_MIN_QUALITY + 1, TARGET_MAX_QUALITY
+		while low <= high:
+			quality = (low + high) // 2
+			settings = ImageSettings(quality, scale)
+			data = measure(settings)
+			if len(data) <= target_bytes:
+				best, best_settings = data, settings
+				low = quality + 1
+			else:
+				high = quality - 1
+		return best, best_settings, iterations
+
+	return smallest, floor, iterations
+
+
+def compress_to_target(
+	input_path: str,
+	output_path: str,
+	target_bytes: int,
+	level: str = "balanced",
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	"""Compress until the output fits ``target_bytes`` or nothing more helps.
+
+	Images are decoded once and re-encoded from those pixels on every
+	iteration. The returned dict reports the achieved size and the settings
+	that produced it.
+	"""
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		writer = _compressed_writer(reader, level, progress)
+		best = _serialize(writer)
+		settings: ImageSettings | None = None
+		iterations = 1
+
+		if len(best) > target_bytes:
+			dedupe_images(writer)
+			images = decode_images(collect_images(writer))
+			if images:
+				searched, settings, count = _search_image_settings(writer, images, target_bytes)
+				iterations += count
+				if len(searched) < len(best):
+					best = searched
+				else:
+					settings = None
+
+	with open(output_path, "wb") as handle:
+		handle.write(best)
+
+	return {
+		"pages": len(writer.pages),
+		"size_bytes": len(best),
+		"target_bytes": target_bytes,
+		"target_reached": len(best) <= target_bytes,
+		"quality": settings.quality if settings else None,
+		"scale": settings.scale if settings else 1.0,
+		"iterations": iterations,
+	}
+
+
+def parse_page_ranges(spec: str, page_count: int) -> list[tuple[int, int]]:
+	"""Parse "1-3, 5, 8-" into 1-based inclusive (start, end) pairs."""
+	ranges: list[tuple[int, int]] = []
+	for part in spec.split(","):
+		part = part.strip()
+		if not part:
+			continue
+		match = re.fullmatch(r"(\d*)\s*(-?)\s*(\d*)", part)
+		if not match or not (match.group(1) or match.group(3)):
+			raise PdfInputError(f"Invalid page range: {part}")
+		start = int(match.group(1) or 1)
+		end = int(match.group(3) or page_count) if match.group(2) else start
+		if start < 1 or end > page_count or start > end:
+			raise PdfInputError(f"Page range {part} is outside 1-{page_count}.")
+		ranges.append((start, end))
+	if not ranges:
+		raise PdfInputError("No page ranges given.")
+	return ranges
+
+
+def _object_size(obj) -> int:
+	# Serializing the dictionary only writes references to other objects,
+	# so this stays cheap; stream data is counted by length, not copied.
+	buffer = io.BytesIO()
+	data_length = 0
+	if isinstance(obj, StreamObject):
+		data_length = len(obj._data or b"")
+		obj = DictionaryObject(obj)
+	obj.write_to_stream(buffer)
+	return buffer.tell() + data_length + OBJECT_OVERHEAD_BYTES
+
+
+def _page_objects(page: PageObject) -> dict[int, int]:
+	"""Approximate bytes of each indirect object ``page`` pulls into a writer.
+
+	The walk does not follow /Parent or /P back up the page tree and stops
+	at other pages (link destinations), mirroring what add_page copies.
+	"""
+	sizes: dict[int, int] = {}
+	stack: list = [page.indirect_reference or page]
+	while stack:
+		obj = stack.pop()
+		if isinstance(obj, IndirectObject):
+			if obj.idnum in sizes:
+				continue
+			resolved = obj.get_object()
+			sizes[obj.idnum] = _object_size(resolved)
+			if obj != page.indirect_reference and isinstance(resolved, DictionaryObject) and resolved.get("/Type") == "/Page":
+				continue
+			stack.append(resolved)
+		elif isinstance(obj, DictionaryObject):
+			stack.extend(value for key, value in obj.items() if key not in ("/Parent", "/P"))
+		elif isinstance(obj, ArrayObject):
+			stack.extend(obj)
+	return sizes
+
+
+def _plan_size_parts(reader: PdfReader, max_bytes: int) -> list[tuple[int, int]]:
+	# Greedy packing: objects shared by pages of one part (fonts, logos)
+	# are only counted once.
+	parts: list[tuple[int, int]] = []
+	start = 1
+	part_objects: set[int] = set()
+	part_size = PART_OVERHEAD_BYTES
+	for number, page in enumerate(reader.pages, start=1):
+		sizes = _page_objects(page)
+		extra = PAGE_OVERHEAD_BYTES + sum(size for idnum, size in sizes.items() if idnum not in part_objects)
+		if number > start and part_size + extra > max_bytes:
+			parts.append((start, number - 1))
+			start = number
+			part_objects = set()
+			part_size = PART_OVERHEAD_BYTES
+			extra = PAGE_OVERHEAD_BYTES + sum(sizes.values())
+		part_objects.update(sizes)
+		part_size += extra
+		# Only the object ids are kept; the parsed objects can go.
+		reader.resolved_objects.clear()
+	parts.append((start, len(reader.pages)))
+	return parts
+
+
+def split_document(
+	input_path: str,
+	output_path: str,
+	mode: str,
+	ranges: str | None = None,
+	every: int | None = None,
+	max_bytes: int | None = None,
+	base_name: str = "document",
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	"""Split ``input_path`` into parts and store them in the ZIP ``output_path``.
+
+	``mode`` is "ranges" (one part per range), "every" (``every`` pages per
+	part) or "size" (as many pages as fit ``max_bytes``, estimated from the
+	objects each page references). Parts are written one at a time, and
+	the reader's object cache is dropped between parts, so memory is bounded
+	by the largest part rather than the document.
+	"""
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		page_count = len(reader.pages)
+		if mode == "ranges":
+			parts = parse_page_ranges(ranges or "", page_count)
+		elif mode == "every":
+			parts = [(start, min(start + every - 1, page_count)) for start in range(1, page_count + 1, every)]
+		elif mode == "size":
+			parts = _plan_size_parts(reader, max_bytes)
+		else:
+			raise PdfInputError(f"Unknown split mode: {mode}")
+
+		summary: list[dict] = []
+		part_path = f"{output_path}.part"
+		try:
+			with zipfile.ZipFile(output_path, "w", compression=zipfile.ZIP_STORED) as archive:
+				for index, (start, end) in enumerate(parts, start=1):
+					label = f"{start}" if start == end else f"{start}-{end}"
+					entry_name = f"{base_name}-{index:03d}-pages-{label}.pdf"
+					writer = PdfWriter()
+					for number in range(start, end + 1):
+						writer.add_page(reader.pages[number - 1])
+					with open(part_path, "wb") as handle:
+						writer.write(handle)
+					del writer
+					reader.resolved_objects.clear()
+					archive.write(part_path, entry_name)
+					summary.append({"file": entry_name, "pages": label, "size_bytes": os.path.getsize(part_path)})
+					_report(progress, index, len(parts))
+		finally:
+			if os.path.exists(part_path):
+				os.remove(part_path)
+
+	result = {"pages": page_count, "parts": summary}
+	if mode == "size":
+		result["over_budget"] = sum(1 for part in summary if part["size_bytes"] > max_bytes)
+	return result
+
+
+def organize_document(
+	input_path: str,
+	output_path: str,
+	pages: list[dict],
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	"""Write the pages listed in ``pages`` (1-based, in output order) to ``output_path``.
+
+	Pages left out are deleted; each entry may add a ``rotate`` of a multiple
+	of 90 degrees. Only the listed pages are read from the input.
+	"""
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		page_count = len(reader.pages)
+		for entry in pages:
+			if not 1 <= entry["page"] <= page_count:
+				raise PdfInputError(f"Page {entry['page']} is outside 1-{page_count}.")
+
+		writer = PdfWriter()
+		for index, entry in enumerate(pages, start=1):
+			page = writer.add_page(reader.pages[entry["page"] - 1])
+			if entry.get("rotate"):
+				page.rotate(entry["rotate"])
+			_report(progress, index, len(pages))
+
+		with open(output_path, "wb") as handle:
+			writer.write(handle)
+
+	return {"pages": len(pages), "source_pages": page_count}
+
+
+__all__ = [
+	"PdfInputError",
+	"PdfPasswordError",
+	"compress_document",
+	"compress_to_target",
+	"merge_documents",
+	"open_pdf",
+	"organize_document",
+	"parse_page_ranges",
+	"split_document",
+]
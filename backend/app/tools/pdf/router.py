@@ -1,13 +1,25 @@
 from fastapi import APIRouter, Depends, File, Form, Request, UploadFile
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.auth.dependencies import get_current_user, get_optional_user
-from app.db.session import get_db
+from app.auth.dependencies import get_current_user, get_optional_user, get_optional_user_async
+from app.db.session import get_async_db, get_db
+from app.tools.pdf.jobs import enqueue_job, get_job
 from app.tools.pdf.service import (
 	compress_pdf,
+	compress_pdf_batch,
 	delete_compressed_pdf,
 	delete_merged_pdf,
+	delete_output_file,
 	merge_pdfs,
+	ocr_pdf,
+	organize_pdf,
+	pdf_to_word,
+	protect_pdf,
+	split_pdf,
+	unlock_pdf,
+	watermark_pdf,
+	word_to_pdf,
 )
 
 router = APIRouter()
@@ -17,8 +29,8 @@ router = APIRouter()
 async def merge_pdfs_route(
 	request: Request,
 	files: list[UploadFile] = File(...),
-	current_user=Depends(get_optional_user),
-	db: Session = Depends(get_db),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
 ):
 	return await merge_pdfs(request, files, current_user, db)
 
@@ -37,10 +49,22 @@ async def compress_pdf_route(
 	request: Request,
 	file: UploadFile = File(...),
 	level: str = Form("balanced"),
-	current_user=Depends(get_optional_user),
-	db: Session = Depends(get_db),
+	target_kb: int | None = Form(None),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await compress_pdf(request, file, current_user, db, level=level, target_kb=target_kb)
+
+
+@router.post("/compress/batch")
+async def compress_pdf_batch_route(
+	request: Request,
+	files: list[UploadFile] = File(...),
+	level: str = Form("balanced"),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
 ):
-	return await compress_pdf(request, file, current_user, db, level=level)
+	return await compress_pdf_batch(request, files, current_user, db, level=level)
 
 
 @router.delete("/compress/{filename}")
@@ -52,4 +76,213 @@ def delete_compressed_pdf_route(
 	return delete_compressed_pdf(filename, current_user, db)
 
 
+@router.post("/split")
+async def split_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	mode: str = Form("ranges"),
+	ranges: str | None = Form(None),
+	every: int | None = Form(None),
+	max_kb: int | None = Form(None),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await split_pdf(request, file, current_user, db, mode=mode, ranges=ranges, every=every, max_kb=max_kb)
+
+
+@router.delete("/split/{filename}")
+def delete_split_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/organize-pages")
+async def organize_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	pages: str = Form(...),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await organize_pdf(request, file, current_user, db, pages=pages)
+
+
+@router.delete("/organize-pages/{filename}")
+def delete_organized_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/ocr")
+async def ocr_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	lang: str = Form("eng"),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await ocr_pdf(request, file, current_user, db, lang=lang)
+
+
+@router.delete("/ocr/{filename}")
+def delete_ocr_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/watermark")
+async def watermark_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	text: str = Form(...),
+	opacity: float = Form(0.25),
+	font_size: float = Form(48),
+	angle: float = Form(45),
+	color: str = Form("#808080"),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await watermark_pdf(
+		request,
+		file,
+		current_user,
+		db,
+		text=text,
+		opacity=opacity,
+		font_size=font_size,
+		angle=angle,
+		color=color,
+	)
+
+
+@router.delete("/watermark/{filename}")
+def delete_watermarked_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/protect")
+async def protect_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	password: str = Form(...),
+	owner_password: str | None = Form(None),
+	allow_printing: bool = Form(True),
+	allow_copying: bool = Form(True),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await protect_pdf(
+		request,
+		file,
+		current_user,
+		db,
+		password=password,
+		owner_password=owner_password,
+		allow_printing=allow_printing,
+		allow_copying=allow_copying,
+	)
+
+
+@router.delete("/protect/{filename}")
+def delete_protected_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/unlock")
+async def unlock_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	password: str = Form(""),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await unlock_pdf(request, file, current_user, db, password=password)
+
+
+@router.delete("/unlock/{filename}")
+def delete_unlocked_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/word-to-pdf")
+async def word_to_pdf_route(
+	request: Request,
+	file: UploadFile = File(...),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await word_to_pdf(request, file, current_user, db)
+
+
+@router.delete("/word-to-pdf/{filename}")
+def delete_word_to_pdf_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/pdf-to-word")
+async def pdf_to_word_route(
+	request: Request,
+	file: UploadFile = File(...),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await pdf_to_word(request, file, current_user, db)
+
+
+@router.delete("/pdf-to-word/{filename}")
+def delete_pdf_to_word_route(
+	filename: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return delete_output_file(filename, current_user, db)
+
+
+@router.post("/jobs")
+async def create_pdf_job_route(
+	request: Request,
+	tool: str = Form(...),
+	files: list[UploadFile] = File(...),
+	level: str = Form("balanced"),
+	target_kb: int | None = Form(None),
+	current_user=Depends(get_optional_user_async),
+	db: AsyncSession = Depends(get_async_db),
+):
+	return await enqueue_job(request, tool, files, current_user, db, level=level, target_kb=target_kb)
+
+
+@router.get("/jobs/{job_id}")
+def get_pdf_job_route(
+	job_id: str,
+	current_user=Depends(get_optional_user),
+	db: Session = Depends(get_db),
+):
+	return get_job(job_id, current_user, db)
+
+
 __all__ = ["router"]
@@ -0,0 +1,221 @@
+"""Password protection and removal in a single streaming pass.
+
+``PdfWriter`` clones every object of the source into a new graph and
+renumbers it before anything is written. Encrypting or decrypting does not
+change the structure of a document, so ``rewrite_document`` copies the
+source objects one at a time instead: each object is parsed, encrypted (or
+written as decrypted) under its original number and dropped again, with
+references left untouched. Only the trailer and the encryption dictionary
+are new.
+
+Objects that were packed into object streams are written out individually;
+cross-reference streams, object streams and linearization data are not
+copied, since they describe the layout of the source file.
+"""
+
+import os
+from typing import BinaryIO
+
+from pypdf import PdfReader
+from pypdf.constants import UserAccessPermissions
+from pypdf.generic import (
+	ArrayObject,
+	ByteStringObject,
+	DictionaryObject,
+	IndirectObject,
+	NameObject,
+	NumberObject,
+	StreamObject,
+)
+
+from app.tools.pdf.operations import PDF_READER_MMAP, PdfInputError, ProgressCallback, _report, open_pdf
+
+# pypdf only exposes encryption through PdfWriter, which would clone the
+# whole document. Its private encryption module is used instead; pypdf is
+# pinned in requirements.txt for this, and a release that moves the module
+# disables protect instead of breaking the import of the app.
+try:
+	from pypdf._encryption import EncryptAlgorithm, Encryption
+except ImportError:
+	EncryptAlgorithm = Encryption = None
+
+# Parsed objects are cached by the reader; drop them every so often so a
+# large document is never held in memory as a whole.
+RELEASE_EVERY_OBJECTS = 512
+
+SKIPPED_TYPES = {"/XRef", "/ObjStm"}
+
+
+def encryption_available() -> bool:
+	return Encryption is not None
+
+
+def document_permissions(allow_printing: bool = True, allow_copying: bool = True) -> int:
+	permissions = UserAccessPermissions.all()
+	if not allow_printing:
+		permissions &= ~(UserAccessPermissions.PRINT | UserAccessPermissions.PRINT_TO_REPRESENTATION)
+	if not allow_copying:
+		permissions &= ~(UserAccessPermissions.EXTRACT | UserAccessPermissions.EXTRACT_TEXT_AND_GRAPHICS)
+	return int(permissions)
+
+
+def _source_objects(reader: PdfReader) -> list[tuple[int, int]]:
+	numbers: dict[int, int] = {}
+	for generation, entries in reader.xref.items():
+		for idnum in entries:
+			numbers[idnum] = generation
+	for idnum in reader.xref_objStm:
+		numbers.setdefault(idnum, 0)
+	return sorted(numbers.items())
+
+
+def _string_bytes(value) -> bytes:
+	return bytes(value.original_bytes if hasattr(value, "original_bytes") else value)
+
+
+def _skip(obj) -> bool:
+	if obj is None:
+		return True
+	if isinstance(obj, StreamObject) and obj.get("/Type") in SKIPPED_TYPES:
+		return True
+	return isinstance(obj, DictionaryObject) and "/Linearized" in obj
+
+
+def _write_xref(out: BinaryIO, offsets: dict[int, tuple[int, int]], size: int) -> int:
+	"""Write a classic xref table; unused numbers become linked free entries."""
+	free = [idnum for idnum in range(1, size) if idnum not in offsets]
+	next_free = dict(zip([0, *free], [*free, 0]))
+	position = out.tell()
+	out.write(f"xref\n0 {size}\n".encode())
+	for idnum in range(size):
+		if idnum in offsets:
+			offset, generation = offsets[idnum]
+			out.write(f"{offset:010d} {generation:05d} n \n".encode())
+		else:
+			out.write(f"{next_free[idnum]:010d} {65535 if idnum == 0 else 1:05d} f \n".encode())
+	return position
+
+
+def rewrite_document(
+	input_path: str,
+	output_path: str,
+	password: str = "",
+	user_password: str | None = None,
+	owner_password: str | None = None,
+	permissions: int | None = None,
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	"""Copy ``input_path`` to ``output_path``, decrypting it with ``password``.
+
+	With ``user_password`` the output is encrypted with AES-256; without it
+	the output has no encryption at all.
+	"""
+	with open_pdf(input_path, use_mmap=use_mmap, password=password) as reader:
+		source_encrypt = reader.trailer.raw_get("/Encrypt") if "/Encrypt" in reader.trailer else None
+		page_count = len(reader.pages)
+		objects = _source_objects(reader)
+		size = max((idnum for idnum, _ in objects), default=0) + 1
+
+		file_id = reader.trailer.get("/ID")
+		# Keep the permanent identifier; the changing half is new.
+		first_id = _string_bytes(file_id[0]) if file_id else os.urandom(16)
+		document_id = ArrayObject([ByteStringObject(first_id), ByteStringObject(os.urandom(16))])
+
+		encryption = None
+		header = reader.pdf_header
+		if user_password is not None:
+			if Encryption is None:
+				raise RuntimeError("pypdf encryption support is not available")
+			encryption = Encryption.make(
+				EncryptAlgorithm.AES_256,
+				permissions if permissions is not None else document_permissions(),
+				first_id,
+			)
+			encrypt_entry = encryption.write_entry(user_password, owner_password or user_password)
+			# AES-256 (revision 6) is defined by PDF 2.0.
+			header = "%PDF-2.0"
+
+		offsets: dict[int, tuple[int, int]] = {}
+		with open(output_path, "wb") as out:
+			out.write(header.encode() + b"\n%\xe2\xe3\xcf\xd3\n")
+			for index, (idnum, generation) in enumerate(objects, start=1):
+				if isinstance(source_encrypt, IndirectObject) and idnum == source_encrypt.idnum:
+					continue
+				obj = IndirectObject(idnum, generation, reader).get_object()
+				if _skip(obj):
+					continue
+				if encryption is not None:
+					obj = encryption.encrypt_object(obj, idnum, generation)
+				offsets[idnum] = (out.tell(), generation)
+				out.write(f"{idnum} {generation} obj\n".encode())
+				obj.write_to_stream(out)
+				out.write(b"\nendobj\n")
+				if index % RELEASE_EVERY_OBJECTS == 0:
+					reader.resolved_objects.clear()
+					_report(progress, index, len(objects))
+
+			trailer = DictionaryObject({
+				NameObject("/Root"): reader.trailer.raw_get("/Root"),
+				NameObject("/ID"): document_id,
+			})
+			info = reader.trailer.raw_get("/Info") if "/Info" in reader.trailer else None
+			if isinstance(info, IndirectObject) and info.idnum in offsets:
+				trailer[NameObject("/Info")] = info
+			if encryption is not None:
+				offsets[size] = (out.tell(), 0)
+				out.write(f"{size} 0 obj\n".encode())
+				encrypt_entry.write_to_stream(out)
+				out.write(b"\nendobj\n")
+				trailer[NameObject("/Encrypt")] = IndirectObject(size, 0, reader)
+				size += 1
+			trailer[NameObject("/Size")] = NumberObject(size)
+
+			xref_position = _write_xref(out, offsets, size)
+			out.write(b"trailer\n")
+			trailer.write_to_stream(out)
+			out.write(f"\nstartxref\n{xref_position}\n%%EOF\n".encode())
+
+		return {"pages": page_count, "encrypted": encryption is not None}
+
+
+def protect_document(
+	input_path: str,
+	output_path: str,
+	user_password: str,
+	owner_password: str,
+	permissions: int,
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	return rewrite_document(
+		input_path,
+		output_path,
+		user_password=user_password,
+		owner_password=owner_password,
+		permissions=permissions,
+		progress=progress,
+		use_mmap=use_mmap,
+	)
+
+
+def unlock_document(
+	input_path: str,
+	output_path: str,
+	password: str = "",
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	with open_pdf(input_path, use_mmap=use_mmap, password=password) as reader:
+		if not reader.is_encrypted:
+			raise PdfInputError("This PDF is not password protected.")
+	return rewrite_document(input_path, output_path, password=password, progress=progress, use_mmap=use_mmap)
+
+
+__all__ = [
+	"document_permissions",
+	"encryption_available",
+	"protect_document",
+	"rewrite_document",
+	"unlock_document",
+]
@@ -1,114 +1,233 @@
+import asyncio
+import json
 import os
 import re
+import secrets
 import uuid
-from typing import Final
+import zipfile
+from typing import AsyncIterator, Final
 
 from fastapi import HTTPException, Request, UploadFile, status
-from pypdf import PdfReader, PdfWriter
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.db.models.file import FileRecord
-from app.usage.tracker import increment_usage
+from app.tools.pdf.engine import PdfJobTimeout, pdf_engine
+from app.tools.pdf.office import (
+	OfficeBusyError,
+	OfficeConversionError,
+	OfficeTimeout,
+	OfficeUnavailableError,
+	office_available,
+	office_pool,
+)
+from app.tools.pdf.ocr import OCR_DPI, OCR_LANG, OcrUnavailableError, ocr_available, run_ocr
+from app.tools.pdf.operations import (
+	PdfInputError,
+	PdfPasswordError,
+	compress_document,
+	compress_to_target,
+	merge_documents,
+	organize_document,
+	split_document,
+)
+from app.tools.pdf.security import document_permissions, encryption_available, protect_document, unlock_document
+from app.tools.pdf.watermark import WatermarkSpec, watermark_available, watermark_document
+from app.usage.tracker import increment_usage_async
+from app.utils.result_cache import result_cache
+from app.utils.storage import SpooledUpload, UploadTooLargeError, spool_upload
 
 MAX_FILE_SIZE_MB: Final = 10
 UPLOAD_DIR = "temp_uploads"
 OUTPUT_DIR = "temp_outputs"
+COMPRESSION_LEVELS = {"light", "balanced", "strong"}
+SPLIT_MODES = {"ranges", "every", "size"}
+MAX_ORGANIZE_PAGES = 5000
+MAX_BATCH_FILES = int(os.getenv("PDF_MAX_BATCH_FILES", "50"))
+MAX_WATERMARK_TEXT = 200
+WORD_EXTENSIONS = {".doc", ".docx", ".odt", ".rtf"}
+MAX_PASSWORD_LENGTH = 128
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 
-async def merge_pdfs(
-	request: Request,
-	files: list[UploadFile],
-	current_user,
-	db: Session,
-) -> dict:
-	# Enforce daily usage before processing.
-	increment_usage(db, request, current_user, tool="pdf_merge")
+def slugify_filename(filename: str | None, fallback: str) -> str:
+	stem, _ = os.path.splitext(filename or "")
+	slug = re.sub(r"[^a-zA-Z0-9]+", "-", stem).strip("-").lower()
+	return slug or fallback
 
-	writer = PdfWriter()
-	max_bytes = MAX_FILE_SIZE_MB * 1024 * 1024
 
-	preserved_names: list[str] = []
+def merged_output_name(slugs: list[str]) -> str:
+	joined_names = "-".join(slugs[:3])
+	if not joined_names:
+		joined_names = "merged"
+	if len(joined_names) > 60:
+		joined_names = joined_names[:60].rstrip("-") or "merged"
 
-	for index, file in enumerate(files, start=1):
-		file_size = getattr(file, "size", None)
-		if file_size is not None and file_size > max_bytes:
-			raise HTTPException(
-				status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-				detail="File too large. Max 10MB allowed.",
-			)
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-{joined_names}-{token}.pdf"
 
-		contents = await file.read()
 
-		if file_size is None and len(contents) > max_bytes:
-			raise HTTPException(
-				status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-				detail="File too large. Max 10MB allowed.",
-			)
+def compressed_output_name(slug: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-compressed-{slug}-{token}.pdf"
 
-		original_name = file.filename or f"document-{index}"
-		stem, _ = os.path.splitext(original_name)
-		slug = re.sub(r"[^a-zA-Z0-9]+", "-", stem).strip("-").lower()
-		if not slug:
-			slug = f"file-{index}"
-		preserved_names.append(slug)
 
-		input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
+def split_output_name(slug: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-split-{slug}-{token}.zip"
 
-		with open(input_path, "wb") as handle:
-			handle.write(contents)
 
-		reader = PdfReader(input_path)
+def ocr_output_name(slug: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-ocr-{slug}-{token}.pdf"
 
-		# 🔐 Handle encrypted PDFs
-		if reader.is_encrypted:
-			try:
-				decrypted = reader.decrypt("")  # try empty password
-			except Exception:
-				decrypted = 0
 
-			if not decrypted:
-				raise HTTPException(
-					status_code=status.HTTP_400_BAD_REQUEST,
-					detail="One of the PDFs is password protected. Please unlock it first and try again.",
-				)
+def organized_output_name(slug: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-organized-{slug}-{token}.pdf"
 
-		for page in reader.pages:
-			writer.add_page(page)
 
-	selected_names = preserved_names[:3]
-	joined_names = "-".join(selected_names)
-	if not joined_names:
-		joined_names = "merged"
-	if len(joined_names) > 60:
-		joined_names = joined_names[:60].rstrip("-") or "merged"
+def watermarked_output_name(slug: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-watermarked-{slug}-{token}.pdf"
 
+
+def protected_output_name(slug: str) -> str:
 	token = uuid.uuid4().hex[:6]
-	output_name = f"caniedit-{joined_names}-{token}.pdf"
-	output_path = os.path.join(OUTPUT_DIR, output_name)
+	return f"caniedit-protected-{slug}-{token}.pdf"
 
-	with open(output_path, "wb") as handle:
-		writer.write(handle)
 
-	if current_user:
-		file_record = FileRecord(
+def unlocked_output_name(slug: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-unlocked-{slug}-{token}.pdf"
+
+
+def converted_output_name(slug: str, extension: str) -> str:
+	token = uuid.uuid4().hex[:6]
+	return f"caniedit-{slug}-{token}{extension}"
+
+
+async def save_upload(file: UploadFile, suffix: str = ".pdf") -> SpooledUpload:
+	"""Spool an upload into UPLOAD_DIR, enforcing MAX_FILE_SIZE_MB."""
+	try:
+		return await spool_upload(
+			file,
+			UPLOAD_DIR,
+			max_bytes=MAX_FILE_SIZE_MB * 1024 * 1024,
+			suffix=suffix,
+		)
+	except UploadTooLargeError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+			detail="File too large. Max 10MB allowed.",
+		) from exc
+
+
+async def _run_pdf_job(func, *args, password_detail: str, **kwargs) -> dict:
+	try:
+		return await pdf_engine.run(func, *args, **kwargs)
+	except PdfPasswordError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail=password_detail,
+		) from exc
+	except PdfInputError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail=str(exc),
+		) from exc
+	except PdfJobTimeout as exc:
+		raise HTTPException(
+			status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+			detail="Processing took too long. Please try a smaller file.",
+		) from exc
+
+
+async def _run_cached_pdf_job(
+	tool: str,
+	uploads: list[SpooledUpload],
+	params: dict,
+	output_path: str,
+	func,
+	*args,
+	password_detail: str,
+) -> dict:
+	"""Run a PDF job unless the same inputs and params were seen recently.
+
+	Usage has already been counted by the caller, so hits and misses cost
+	the user the same.
+	"""
+	key = result_cache.key(tool, [upload.sha256 for upload in uploads], params)
+	cached = result_cache.fetch(key, output_path)
+	if cached is not None:
+		return cached
+
+	result = await _run_pdf_job(func, *args, password_detail=password_detail)
+	result_cache.store(key, output_path, result)
+	return result
+
+
+async def record_output(db: AsyncSession, current_user, tool: str, filename: str, storage_path: str) -> None:
+	if not current_user:
+		return
+	db.add(
+		FileRecord(
 			user_id=current_user.id,
-			tool="pdf_merge",
-			filename=output_name,
-			storage_path=output_path,
+			tool=tool,
+			filename=filename,
+			storage_path=storage_path,
 		)
-		db.add(file_record)
-		db.commit()
+	)
+	await db.commit()
 
-	return {
+
+async def merge_pdfs(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+) -> dict:
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_merge")
+
+	preserved_names: list[str] = []
+	uploads: list[SpooledUpload] = []
+
+	for index, file in enumerate(files, start=1):
+		preserved_names.append(slugify_filename(file.filename or f"document-{index}", f"file-{index}"))
+		uploads.append(await save_upload(file))
+	input_paths = [str(upload.path) for upload in uploads]
+
+	output_name = merged_output_name(preserved_names)
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	# File order is part of the key: the input hashes are listed in order.
+	result = await _run_cached_pdf_job(
+		"pdf_merge",
+		uploads,
+		{},
+		output_path,
+		merge_documents,
+		input_paths,
+		output_path,
+		password_detail="One of the PDFs is password protected. Please unlock it first and try again.",
+	)
+
+	await record_output(db, current_user, "pdf_merge", output_name, output_path)
+
+	response = {
 		"success": True,
 		"file": output_name,
 	}
+	if "dedup" in result:
+		response["dedup"] = result["dedup"]
+	return response
 
 
-def delete_merged_pdf(filename: str, current_user, db: Session) -> dict:
+def delete_output_file(filename: str, current_user, db: Session) -> dict:
 	if not re.fullmatch(r"[\w.-]+", filename):
 		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filename")
 
@@ -139,121 +258,694 @@ def delete_merged_pdf(filename: str, current_user, db: Session) -> dict:
 	return {"success": True}
 
 
+def delete_merged_pdf(filename: str, current_user, db: Session) -> dict:
+	return delete_output_file(filename, current_user, db)
+
+
 async def compress_pdf(
 	request: Request,
 	file: UploadFile,
 	current_user,
-	db: Session,
+	db: AsyncSession,
 	level: str = "balanced",
+	target_kb: int | None = None,
 ) -> dict:
 	# Enforce daily usage before processing.
-	increment_usage(db, request, current_user, tool="pdf_compress")
+	await increment_usage_async(db, request, current_user, tool="pdf_compress")
 
-	max_bytes = MAX_FILE_SIZE_MB * 1024 * 1024
-	file_size = getattr(file, "size", None)
-	if file_size is not None and file_size > max_bytes:
+	if level not in COMPRESSION_LEVELS:
 		raise HTTPException(
-			status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-			detail="File too large. Max 10MB allowed.",
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Invalid compression level.",
 		)
-
-	contents = await file.read()
-	if file_size is None and len(contents) > max_bytes:
+	if target_kb is not None and target_kb <= 0:
 		raise HTTPException(
-			status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
-			detail="File too large. Max 10MB allowed.",
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Invalid target size.",
+		)
+
+	spooled = await save_upload(file)
+	input_path = str(spooled.path)
+
+	output_name = compressed_output_name(slugify_filename(file.filename, "document"))
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	password_detail = "This PDF is password protected. Please unlock it first and try again."
+	params = {"level": level, "target_kb": target_kb}
+	if target_kb is None:
+		result = await _run_cached_pdf_job(
+			"pdf_compress",
+			[spooled],
+			params,
+			output_path,
+			compress_document,
+			input_path,
+			output_path,
+			level,
+			password_detail=password_detail,
+		)
+	else:
+		result = await _run_cached_pdf_job(
+			"pdf_compress",
+			[spooled],
+			params,
+			output_path,
+			compress_to_target,
+			input_path,
+			output_path,
+			target_kb * 1024,
+			level,
+			password_detail=password_detail,
+		)
+
+	await record_output(db, current_user, "pdf_compress", output_name, output_path)
+
+	response = {
+		"success": True,
+		"file": output_name,
+	}
+	if target_kb is not None:
+		response["compression"] = {
+			"target_kb": target_kb,
+			"size_kb": round(result["size_bytes"] / 1024, 1),
+			"target_reached": result["target_reached"],
+			"quality": result["quality"],
+			"scale": result["scale"],
+		}
+	return response
+
+
+class _ZipStream:
+	"""Write-only sink for ZipFile that hands out what was written so far.
+
+	It has no ``tell``/``seek``, so ZipFile writes data descriptors after
+	each entry instead of seeking back, which is what lets the archive be
+	streamed.
+	"""
+
+	def __init__(self) -> None:
+		self._chunks: list[bytes] = []
+
+	def write(self, data: bytes) -> int:
+		self._chunks.append(bytes(data))
+		return len(data)
+
+	def flush(self) -> None:
+		pass
+
+	def drain(self) -> bytes:
+		data = b"".join(self._chunks)
+		self._chunks.clear()
+		return data
+
+
+def _batch_entry_name(slug: str, used: set[str]) -> str:
+	name = f"{slug}-compressed.pdf"
+	suffix = 2
+	while name in used:
+		name = f"{slug}-compressed-{suffix}.pdf"
+		suffix += 1
+	used.add(name)
+	return name
+
+
+async def _compress_batch_entry(entry_name: str, spooled: SpooledUpload, level: str) -> tuple[str, str, dict]:
+	output_path = os.path.join(OUTPUT_DIR, compressed_output_name(uuid.uuid4().hex[:8]))
+	try:
+		await _run_cached_pdf_job(
+			"pdf_compress",
+			[spooled],
+			{"level": level, "target_kb": None},
+			output_path,
+			compress_document,
+			str(spooled.path),
+			output_path,
+			level,
+			password_detail="This PDF is password protected. Please unlock it first and try again.",
 		)
+	except HTTPException as exc:
+		return entry_name, output_path, {"file": entry_name, "success": False, "error": exc.detail}
+	except Exception:
+		return entry_name, output_path, {"file": entry_name, "success": False, "error": "Unable to compress this file."}
+	return entry_name, output_path, {
+		"file": entry_name,
+		"success": True,
+		"original_kb": round(spooled.size / 1024, 1),
+		"size_kb": round(os.path.getsize(output_path) / 1024, 1),
+	}
+
 
-	allowed_levels = {"light", "balanced", "strong"}
-	if level not in allowed_levels:
+async def _stream_batch_zip(tasks: list[asyncio.Task]) -> AsyncIterator[bytes]:
+	sink = _ZipStream()
+	manifest: list[dict] = []
+	try:
+		with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+			# PDFs are already compressed; storing them keeps this cheap.
+			for next_done in asyncio.as_completed(tasks):
+				entry_name, output_path, summary = await next_done
+				manifest.append(summary)
+				if summary["success"]:
+					await asyncio.to_thread(archive.write, output_path, entry_name)
+					try:
+						os.remove(output_path)
+					except OSError:
+						pass
+				chunk = sink.drain()
+				if chunk:
+					yield chunk
+			archive.writestr("manifest.json", json.dumps(manifest, indent=2))
+		yield sink.drain()
+	finally:
+		for task in tasks:
+			task.cancel()
+
+
+async def compress_pdf_batch(
+	request: Request,
+	files: list[UploadFile],
+	current_user,
+	db: AsyncSession,
+	level: str = "balanced",
+) -> StreamingResponse:
+	"""Compress many PDFs and stream them back as one ZIP.
+
+	Usage is charged once for the whole batch. Files are compressed in
+	parallel on the PDF engine and each one is added to the archive as soon
+	as it finishes; failures are listed in ``manifest.json`` instead of
+	aborting the download.
+	"""
+	if level not in COMPRESSION_LEVELS:
 		raise HTTPException(
 			status_code=status.HTTP_400_BAD_REQUEST,
 			detail="Invalid compression level.",
 		)
+	if not files or len(files) > MAX_BATCH_FILES:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail=f"Upload between 1 and {MAX_BATCH_FILES} files.",
+		)
 
-	original_name = file.filename or "document"
-	stem, _ = os.path.splitext(original_name)
-	slug = re.sub(r"[^a-zA-Z0-9]+", "-", stem).strip("-").lower()
-	if not slug:
-		slug = "document"
+	# Enforce daily usage for every file in one transaction.
+	await increment_usage_async(db, request, current_user, tool="pdf_compress", units=len(files))
 
-	input_path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4()}.pdf")
-	with open(input_path, "wb") as handle:
-		handle.write(contents)
+	used_names: set[str] = set()
+	tasks: list[asyncio.Task] = []
+	try:
+		for index, file in enumerate(files, start=1):
+			entry_name = _batch_entry_name(slugify_filename(file.filename, f"document-{index}"), used_names)
+			spooled = await save_upload(file)
+			# Start compressing while the remaining uploads are still spooling.
+			tasks.append(asyncio.create_task(_compress_batch_entry(entry_name, spooled, level)))
+	except BaseException:
+		for task in tasks:
+			task.cancel()
+		raise
+
+	token = uuid.uuid4().hex[:6]
+	return StreamingResponse(
+		_stream_batch_zip(tasks),
+		media_type="application/zip",
+		headers={"Content-Disposition": f'attachment; filename="caniedit-compressed-{token}.zip"'},
+	)
+
+
+def delete_compressed_pdf(filename: str, current_user, db: Session) -> dict:
+	return delete_output_file(filename, current_user, db)
 
-	reader = PdfReader(input_path)
-	if reader.is_encrypted:
-		try:
-			decrypted = reader.decrypt("")
-		except Exception:
-			decrypted = 0
 
-		if not decrypted:
+async def split_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+	mode: str = "ranges",
+	ranges: str | None = None,
+	every: int | None = None,
+	max_kb: int | None = None,
+) -> dict:
+	if mode not in SPLIT_MODES:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid split mode.")
+	if mode == "ranges" and not (ranges or "").strip():
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Enter the page ranges to extract.")
+	if mode == "every" and (every is None or every <= 0):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid number of pages per file.")
+	if mode == "size" and (max_kb is None or max_kb <= 0):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid target size.")
+
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_split")
+
+	spooled = await save_upload(file)
+	slug = slugify_filename(file.filename, "document")
+	output_name = split_output_name(slug)
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+	max_bytes = max_kb * 1024 if mode == "size" else None
+	params = {
+		"mode": mode,
+		"ranges": ranges if mode == "ranges" else None,
+		"every": every if mode == "every" else None,
+		"max_kb": max_kb if mode == "size" else None,
+		"name": slug,
+	}
+
+	result = await _run_cached_pdf_job(
+		"pdf_split",
+		[spooled],
+		params,
+		output_path,
+		split_document,
+		str(spooled.path),
+		output_path,
+		mode,
+		params["ranges"],
+		params["every"],
+		max_bytes,
+		slug,
+		password_detail="This PDF is password protected. Please unlock it first and try again.",
+	)
+
+	await record_output(db, current_user, "pdf_split", output_name, output_path)
+
+	response = {
+		"success": True,
+		"file": output_name,
+		"pages": result["pages"],
+		"parts": result["parts"],
+	}
+	if "over_budget" in result:
+		response["over_budget"] = result["over_budget"]
+	return response
+
+
+def _parse_organize_pages(raw: str) -> list[dict]:
+	"""Parse the ``pages`` form field: a JSON list of page numbers or {"page", "rotate"} objects."""
+	try:
+		entries = json.loads(raw)
+	except ValueError as exc:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page list.") from exc
+	if not isinstance(entries, list) or not entries or len(entries) > MAX_ORGANIZE_PAGES:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page list.")
+
+	pages: list[dict] = []
+	for entry in entries:
+		if isinstance(entry, int):
+			entry = {"page": entry}
+		if not isinstance(entry, dict):
+			raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid page list.")
+		page = entry.get("page")
+		rotate = entry.get("rotate", 0)
+		if not isinstance(page, int) or isinstance(page, bool) or not isinstance(rotate, int) or rotate % 90:
 			raise HTTPException(
 				status_code=status.HTTP_400_BAD_REQUEST,
-				detail="This PDF is password protected. Please unlock it first and try again.",
+				detail="Each page needs a page number and a rotation in steps of 90 degrees.",
 			)
+		pages.append({"page": page, "rotate": rotate % 360})
+	return pages
+
+
+async def organize_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+	pages: str,
+) -> dict:
+	page_list = _parse_organize_pages(pages)
 
-	writer = PdfWriter()
-	for page in reader.pages:
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_organize")
+
+	spooled = await save_upload(file)
+	output_name = organized_output_name(slugify_filename(file.filename, "document"))
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	result = await _run_cached_pdf_job(
+		"pdf_organize",
+		[spooled],
+		{"pages": page_list},
+		output_path,
+		organize_document,
+		str(spooled.path),
+		output_path,
+		page_list,
+		password_detail="This PDF is password protected. Please unlock it first and try again.",
+	)
+
+	await record_output(db, current_user, "pdf_organize", output_name, output_path)
+
+	return {
+		"success": True,
+		"file": output_name,
+		"pages": result["pages"],
+	}
+
+
+async def ocr_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+	lang: str = OCR_LANG,
+) -> dict:
+	if not ocr_available():
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="OCR is not available right now. Please try again later.",
+		)
+	if not re.fullmatch(r"[a-z_]{3,}(\+[a-z_]{3,})*", lang):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid OCR language.")
+
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_ocr")
+
+	spooled = await save_upload(file)
+	output_name = ocr_output_name(slugify_filename(file.filename, "document"))
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	key = result_cache.key("pdf_ocr", [spooled.sha256], {"lang": lang, "dpi": OCR_DPI})
+	result = result_cache.fetch(key, output_path)
+	if result is None:
 		try:
-			page.compress_content_streams()
-		except Exception:
-			pass
-		writer.add_page(page)
+			# run_ocr only waits on the PDF and OCR engines, so a thread is enough.
+			result = await asyncio.to_thread(run_ocr, str(spooled.path), output_path, OCR_DPI, lang)
+		except PdfPasswordError as exc:
+			raise HTTPException(
+				status_code=status.HTTP_400_BAD_REQUEST,
+				detail="This PDF is password protected. Please unlock it first and try again.",
+			) from exc
+		except PdfJobTimeout as exc:
+			raise HTTPException(
+				status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+				detail="Processing took too long. Please try a smaller file.",
+			) from exc
+		except OcrUnavailableError as exc:
+			raise HTTPException(
+				status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+				detail="OCR is not available right now. Please try again later.",
+			) from exc
+		result_cache.store(key, output_path, result)
 
-	if level == "strong":
-		writer.add_metadata({"/Producer": "CanIEdit Compression"})
+	await record_output(db, current_user, "pdf_ocr", output_name, output_path)
 
-	token = uuid.uuid4().hex[:6]
-	output_name = f"caniedit-compressed-{slug}-{token}.pdf"
+	return {
+		"success": True,
+		"file": output_name,
+		"pages": result["pages"],
+		"ocr_pages": result["ocr_pages"],
+		"skipped_pages": result["skipped_pages"],
+	}
+
+
+def _watermark_spec(text: str, opacity: float, font_size: float, angle: float, color: str) -> WatermarkSpec:
+	text = text.strip()
+	if not text or len(text) > MAX_WATERMARK_TEXT:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail=f"Watermark text must be 1-{MAX_WATERMARK_TEXT} characters.",
+		)
+	if not 0.05 <= opacity <= 1:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Opacity must be between 0.05 and 1.")
+	if not 8 <= font_size <= 200:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Font size must be between 8 and 200.")
+	if not -360 <= angle <= 360:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid watermark angle.")
+	if not re.fullmatch(r"#?[0-9a-fA-F]{6}", color):
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid watermark color.")
+	rgb = bytes.fromhex(color.lstrip("#"))
+	return WatermarkSpec(
+		text=text,
+		font_size=font_size,
+		opacity=opacity,
+		angle=angle,
+		color=(rgb[0] / 255, rgb[1] / 255, rgb[2] / 255),
+	)
+
+
+async def watermark_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+	text: str,
+	opacity: float = 0.25,
+	font_size: float = 48,
+	angle: float = 45,
+	color: str = "#808080",
+) -> dict:
+	if not watermark_available():
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="Watermarking is not available right now. Please try again later.",
+		)
+	spec = _watermark_spec(text, opacity, font_size, angle, color)
+
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_watermark")
+
+	spooled = await save_upload(file)
+	output_name = watermarked_output_name(slugify_filename(file.filename, "document"))
 	output_path = os.path.join(OUTPUT_DIR, output_name)
 
-	with open(output_path, "wb") as handle:
-		writer.write(handle)
+	result = await _run_cached_pdf_job(
+		"pdf_watermark",
+		[spooled],
+		{
+			"text": spec.text,
+			"opacity": spec.opacity,
+			"font_size": spec.font_size,
+			"angle": spec.angle,
+			"color": list(spec.color),
+		},
+		output_path,
+		watermark_document,
+		str(spooled.path),
+		output_path,
+		spec,
+		password_detail="This PDF is password protected. Please unlock it first and try again.",
+	)
+
+	await record_output(db, current_user, "pdf_watermark", output_name, output_path)
 
-	if current_user:
-		file_record = FileRecord(
-			user_id=current_user.id,
-			tool="pdf_compress",
-			filename=output_name,
-			storage_path=output_path,
+	return {
+		"success": True,
+		"file": output_name,
+		"pages": result["pages"],
+	}
+
+
+def _check_password(password: str | None, detail: str) -> None:
+	if password is not None and len(password) > MAX_PASSWORD_LENGTH:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail=f"{detail} can be at most {MAX_PASSWORD_LENGTH} characters.",
 		)
-		db.add(file_record)
-		db.commit()
+
+
+async def protect_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+	password: str,
+	owner_password: str | None = None,
+	allow_printing: bool = True,
+	allow_copying: bool = True,
+) -> dict:
+	"""Encrypt a PDF with AES-256 behind ``password``.
+
+	Without an ``owner_password`` a random one is used, so the printing and
+	copying restrictions cannot be lifted with the open password.
+	"""
+	if not encryption_available():
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="Password protection is not available right now. Please try again later.",
+		)
+	if not password:
+		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Enter a password.")
+	_check_password(password, "Password")
+	_check_password(owner_password, "Owner password")
+
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_protect")
+
+	spooled = await save_upload(file)
+	output_name = protected_output_name(slugify_filename(file.filename, "document"))
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	# Not cached: the cache key would be derived from the password.
+	result = await _run_pdf_job(
+		protect_document,
+		str(spooled.path),
+		output_path,
+		password,
+		owner_password or secrets.token_urlsafe(24),
+		document_permissions(allow_printing=allow_printing, allow_copying=allow_copying),
+		password_detail="This PDF is already password protected. Please unlock it first and try again.",
+	)
+
+	await record_output(db, current_user, "pdf_protect", output_name, output_path)
 
 	return {
 		"success": True,
 		"file": output_name,
+		"pages": result["pages"],
 	}
 
 
-def delete_compressed_pdf(filename: str, current_user, db: Session) -> dict:
-	if not re.fullmatch(r"[\w.-]+", filename):
-		raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid filename")
+async def unlock_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+	password: str = "",
+) -> dict:
+	"""Remove the password and restrictions from a PDF.
 
-	file_record = db.query(FileRecord).filter(FileRecord.filename == filename).first()
-	if file_record:
-		if not current_user:
-			raise HTTPException(
-				status_code=status.HTTP_401_UNAUTHORIZED,
-				detail="Missing authorization token",
-				headers={"WWW-Authenticate": "Bearer"},
-			)
-		if file_record.user_id != current_user.id:
-			raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Not authorized to delete this file")
+	Files that only carry restrictions (no open password) unlock without one.
+	"""
+	_check_password(password, "Password")
 
-	file_path = os.path.join(OUTPUT_DIR, filename)
-	if not os.path.isfile(file_path):
-		raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found")
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_unlock")
+
+	spooled = await save_upload(file)
+	output_name = unlocked_output_name(slugify_filename(file.filename, "document"))
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	# Not cached: the cache key would be derived from the password.
+	result = await _run_pdf_job(
+		unlock_document,
+		str(spooled.path),
+		output_path,
+		password,
+		password_detail="Incorrect password. Please check it and try again.",
+	)
+
+	await record_output(db, current_user, "pdf_unlock", output_name, output_path)
+
+	return {
+		"success": True,
+		"file": output_name,
+		"pages": result["pages"],
+	}
+
+
+def _require_office() -> None:
+	if not office_available():
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="Document conversion is not available right now. Please try again later.",
+		)
+
+
+async def _run_office_conversion(
+	tool: str,
+	spooled: SpooledUpload,
+	output_path: str,
+	convert_to: str,
+	filtername: str | None = None,
+	infiltername: str | None = None,
+) -> None:
+	key = result_cache.key(tool, [spooled.sha256], {"convert_to": convert_to})
+	if result_cache.fetch(key, output_path) is not None:
+		return
 
 	try:
-		os.remove(file_path)
-	except OSError as exc:
-		raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Unable to delete file right now") from exc
+		# The pool only waits on LibreOffice, so a thread is enough.
+		await asyncio.to_thread(
+			office_pool.convert,
+			str(spooled.path),
+			output_path,
+			convert_to,
+			filtername,
+			infiltername,
+		)
+	except OfficeConversionError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Unable to convert this document. It may be damaged or password protected.",
+		) from exc
+	except OfficeTimeout as exc:
+		raise HTTPException(
+			status_code=status.HTTP_504_GATEWAY_TIMEOUT,
+			detail="Processing took too long. Please try a smaller file.",
+		) from exc
+	except OfficeBusyError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="The converter is busy. Please try again in a moment.",
+			headers={"Retry-After": "10"},
+		) from exc
+	except OfficeUnavailableError as exc:
+		raise HTTPException(
+			status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+			detail="Document conversion is not available right now. Please try again later.",
+		) from exc
+	result_cache.store(key, output_path, {})
 
-	if file_record:
-		db.delete(file_record)
-		db.commit()
 
-	return {"success": True}
+async def word_to_pdf(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+) -> dict:
+	_require_office()
+	extension = os.path.splitext(file.filename or "")[1].lower()
+	if extension not in WORD_EXTENSIONS:
+		raise HTTPException(
+			status_code=status.HTTP_400_BAD_REQUEST,
+			detail="Upload a Word document (.doc, .docx, .odt or .rtf).",
+		)
+
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="word_to_pdf")
+
+	# LibreOffice picks the import filter from the extension.
+	spooled = await save_upload(file, suffix=extension)
+	output_name = converted_output_name(slugify_filename(file.filename, "document"), ".pdf")
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	await _run_office_conversion("word_to_pdf", spooled, output_path, "pdf")
+
+	await record_output(db, current_user, "word_to_pdf", output_name, output_path)
+
+	return {
+		"success": True,
+		"file": output_name,
+	}
+
+
+async def pdf_to_word(
+	request: Request,
+	file: UploadFile,
+	current_user,
+	db: AsyncSession,
+) -> dict:
+	_require_office()
+
+	# Enforce daily usage before processing.
+	await increment_usage_async(db, request, current_user, tool="pdf_to_word")
+
+	spooled = await save_upload(file)
+	output_name = converted_output_name(slugify_filename(file.filename, "document"), ".docx")
+	output_path = os.path.join(OUTPUT_DIR, output_name)
+
+	# Without writer_pdf_import LibreOffice opens PDFs in Draw, which cannot
+	# export to Word.
+	await _run_office_conversion(
+		"pdf_to_word",
+		spooled,
+		output_path,
+		"docx",
+		filtername="MS Word 2007 XML",
+		infiltername="writer_pdf_import",
+	)
+
+	await record_output(db, current_user, "pdf_to_word", output_name, output_path)
+
+	return {
+		"success": True,
+		"file": output_name,
+	}
@@ -0,0 +1,222 @@
+"""Text watermarks drawn from one shared overlay.
+
+The watermark is compiled once into a Form XObject (content stream, a
+standard Helvetica font and an opacity graphics state). ``compile_overlay``
+caches the compiled content stream per worker by watermark parameters, and
+each document adds the form to its writer a single time. Every page then
+only gets a reference to the form in its resources plus a few bytes of
+content placing it; pages of the same size and rotation share that
+placement stream too. Nothing is re-rendered or merged per page.
+"""
+
+import math
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+
+from pypdf import PageObject, PdfWriter
+from pypdf.generic import (
+	ArrayObject,
+	DecodedStreamObject,
+	DictionaryObject,
+	FloatObject,
+	IndirectObject,
+	NameObject,
+)
+
+from app.tools.pdf.operations import PDF_READER_MMAP, PdfInputError, ProgressCallback, _report, open_pdf
+
+# Helvetica metrics come from a private pypdf module; pypdf is pinned in
+# requirements.txt for this, and a release that moves the module disables
+# the watermark tool instead of breaking the import of the app.
+try:
+	from pypdf._codecs.core_font_metrics import CORE_FONT_METRICS
+except ImportError:
+	CORE_FONT_METRICS = None
+
+WATERMARK_FONT = "Helvetica"
+WATERMARK_CACHE_SIZE = int(os.getenv("PDF_WATERMARK_CACHE_SIZE", "128"))
+# Largest share of the page width/height the watermark may cover; longer
+# texts are scaled down to fit.
+WATERMARK_MAX_FILL = 0.9
+WATERMARK_XOBJECT_NAME = "/CanIEditWatermark"
+
+
+@dataclass(frozen=True)
+class WatermarkSpec:
+	text: str
+	font_size: float = 48
+	opacity: float = 0.25
+	angle: float = 45
+	color: tuple[float, float, float] = (0.5, 0.5, 0.5)
+
+
+@dataclass(frozen=True)
+class CompiledOverlay:
+	content: bytes
+	width: float
+	height: float
+
+
+def watermark_available() -> bool:
+	return CORE_FONT_METRICS is not None and WATERMARK_FONT in CORE_FONT_METRICS
+
+
+@lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def compile_overlay(spec: WatermarkSpec) -> CompiledOverlay:
+	"""Lay out ``spec.text`` once and return the form's content stream and size."""
+	if not spec.text.strip():
+		raise PdfInputError("Enter the watermark text.")
+	try:
+		encoded = spec.text.encode("cp1252")
+	except UnicodeEncodeError as exc:
+		raise PdfInputError("Watermark text may only use Latin characters.") from exc
+
+	metrics = CORE_FONT_METRICS[WATERMARK_FONT]
+	widths = metrics.character_widths
+	scale = spec.font_size / 1000
+	width = sum(widths.get(char, widths["default"]) for char in spec.text) * scale
+	descent = -metrics.font_descriptor.descent * scale
+	height = metrics.font_descriptor.ascent * scale + descent
+	red, green, blue = spec.color
+	content = (
+		f"/GS0 gs {red:.3f} {green:.3f} {blue:.3f} rg "
+		f"BT /F0 {spec.font_size:g} Tf 0 {descent:.3f} Td <{encoded.hex()}> Tj ET"
+	).encode("ascii")
+	return CompiledOverlay(content=content, width=width, height=height)
+
+
+def _add_form(writer: PdfWriter, spec: WatermarkSpec, overlay: CompiledOverlay) -> IndirectObject:
+	font = DictionaryObject({
+		NameObject("/Type"): NameObject("/Font"),
+		NameObject("/Subtype"): NameObject("/Type1"),
+		NameObject("/BaseFont"): NameObject(f"/{WATERMARK_FONT}"),
+		NameObject("/Encoding"): NameObject("/WinAnsiEncoding"),
+	})
+	state = DictionaryObject({
+		NameObject("/Type"): NameObject("/ExtGState"),
+		NameObject("/ca"): FloatObject(spec.opacity),
+		NameObject("/CA"): FloatObject(spec.opacity),
+	})
+	form = DecodedStreamObject()
+	form.set_data(overlay.content)
+	form.update({
+		NameObject("/Type"): NameObject("/XObject"),
+		NameObject("/Subtype"): NameObject("/Form"),
+		NameObject("/BBox"): ArrayObject(FloatObject(value) for value in (0, 0, overlay.width, overlay.height)),
+		NameObject("/Resources"): DictionaryObject({
+			NameObject("/Font"): DictionaryObject({NameObject("/F0"): writer._add_object(font)}),
+			NameObject("/ExtGState"): DictionaryObject({NameObject("/GS0"): writer._add_object(state)}),
+		}),
+	})
+	return writer._add_object(form)
+
+
+def _placement(overlay: CompiledOverlay, angle: float, width: float, height: float, left: float, bottom: float) -> str:
+	"""``cm`` operands centring the overlay on the box, rotated and scaled to fit."""
+	radians = math.radians(angle)
+	cos, sin = math.cos(radians), math.sin(radians)
+	extent_x = abs(overlay.width * cos) + abs(overlay.height * sin)
+	extent_y = abs(overlay.width * sin) + abs(overlay.height * cos)
+	scale = min(1.0, WATERMARK_MAX_FILL * width / extent_x, WATERMARK_MAX_FILL * height / extent_y)
+	a, b, c, d = scale * cos, scale * sin, -scale * sin, scale * cos
+	e = left + width / 2 - (a * overlay.width + c * overlay.height) / 2
+	f = bottom + height / 2 - (b * overlay.width + d * overlay.height) / 2
+	return " ".join(f"{value:.4f}" for value in (a, b, c, d, e, f))
+
+
+def _stream(writer: PdfWriter, data: bytes) -> IndirectObject:
+	stream = DecodedStreamObject()
+	stream.set_data(data)
+	return writer._add_object(stream)
+
+
+class OverlayStamper:
+	"""Places one compiled overlay on pages of ``writer``."""
+
+	def __init__(self, writer: PdfWriter, spec: WatermarkSpec) -> None:
+		self.writer = writer
+		self.spec = spec
+		self.overlay = compile_overlay(spec)
+		self.form = _add_form(writer, spec, self.overlay)
+		# Saves the graphics state so the page content cannot leak a
+		# transformation or colour into the watermark.
+		self._open = _stream(writer, b"q\n")
+		self._placements: dict[tuple, IndirectObject] = {}
+
+	def _resource_name(self, page: PageObject) -> NameObject:
+		resources = page.get("/Resources")
+		if resources is None:
+			resources = DictionaryObject()
+			page[NameObject("/Resources")] = resources
+		resources = resources.get_object()
+		xobjects = resources.get("/XObject")
+		if xobjects is None:
+			xobjects = DictionaryObject()
+			resources[NameObject("/XObject")] = xobjects
+		xobjects = xobjects.get_object()
+
+		name = WATERMARK_XOBJECT_NAME
+		suffix = 1
+		while name in xobjects and xobjects.raw_get(name) != self.form:
+			name = f"{WATERMARK_XOBJECT_NAME}{suffix}"
+			suffix += 1
+		xobjects[NameObject(name)] = self.form
+		return NameObject(name)
+
+	def _placement_stream(self, page: PageObject, name: str) -> IndirectObject:
+		box = page.cropbox
+		rotation = page.rotation % 360
+		key = (name, float(box.left), float(box.bottom), float(box.width), float(box.height), rotation)
+		placement = self._placements.get(key)
+		if placement is None:
+			# /Rotate turns the page clockwise when shown, so the text is
+			# turned back by the same amount to keep the requested angle.
+			matrix = _placement(
+				self.overlay,
+				self.spec.angle + rotation,
+				float(box.width),
+				float(box.height),
+				float(box.left),
+				float(box.bottom),
+			)
+			placement = _stream(self.writer, f"\nQ q {matrix} cm {name} Do Q\n".encode("ascii"))
+			self._placements[key] = placement
+		return placement
+
+	def stamp(self, page: PageObject) -> None:
+		name = self._resource_name(page)
+		contents = page.raw_get("/Contents") if "/Contents" in page else None
+		if isinstance(contents, IndirectObject) and isinstance(contents.get_object(), ArrayObject):
+			contents = contents.get_object()
+		if contents is None:
+			existing = []
+		elif isinstance(contents, ArrayObject):
+			existing = list(contents)
+		else:
+			existing = [contents]
+		page[NameObject("/Contents")] = ArrayObject([self._open, *existing, self._placement_stream(page, name)])
+
+
+def watermark_document(
+	input_path: str,
+	output_path: str,
+	spec: WatermarkSpec,
+	progress: ProgressCallback | None = None,
+	use_mmap: bool = PDF_READER_MMAP,
+) -> dict:
+	with open_pdf(input_path, use_mmap=use_mmap) as reader:
+		writer = PdfWriter()
+		stamper = OverlayStamper(writer, spec)
+		total = len(reader.pages)
+		for index, page in enumerate(reader.pages, start=1):
+			stamper.stamp(writer.add_page(page))
+			_report(progress, index, total)
+
+		with open(output_path, "wb") as handle:
+			writer.write(handle)
+
+	return {"pages": total}
+
+
+__all__ = ["OverlayStamper", "WatermarkSpec", "compile_overlay", "watermark_available", "watermark_document"]
@@ -3,6 +3,7 @@ from datetime import datetime
 from sqlalchemy.orm import Session
 
 from app.db.models.tool import ToolDefinition
+from app.usage.catalog import catalog
 
 TOOL_DEFINITIONS = [
     {
@@ -17,6 +18,78 @@ TOOL_DEFINITIONS = [
         "weight": 2,
         "is_premium": False,
     },
+    {
+        "slug": "pdf_split",
+        "category": "pdf",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "pdf_organize",
+        "category": "pdf",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "pdf_ocr",
+        "category": "pdf",
+        "weight": 3,
+        "is_premium": False,
+    },
+    {
+        "slug": "pdf_watermark",
+        "category": "pdf",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "pdf_protect",
+        "category": "pdf",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "pdf_unlock",
+        "category": "pdf",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "word_to_pdf",
+        "category": "pdf",
+        "weight": 2,
+        "is_premium": False,
+    },
+    {
+        "slug": "pdf_to_word",
+        "category": "pdf",
+        "weight": 2,
+        "is_premium": False,
+    },
+    {
+        "slug": "image_compress",
+        "category": "image",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "image_convert",
+        "category": "image",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "image_resize",
+        "category": "image",
+        "weight": 1,
+        "is_premium": False,
+    },
+    {
+        "slug": "image_strip_metadata",
+        "category": "image",
+        "weight": 1,
+        "is_premium": False,
+    },
 ]
 
 
@@ -51,3 +124,4 @@ def seed_tool_definitions(db: Session) -> None:
             tool.touch(now)
             db.add(tool)
     db.commit()
+    catalog.invalidate()
@@ -0,0 +1,152 @@
+"""Process-local cache of the tool and plan catalog.
+
+The ``tools`` and ``plans`` tables only change when the seed functions run,
+yet every quota check needs a tool's weight and a plan's limit. Both tables
+are loaded into an immutable snapshot that is served without touching the
+database. Other workers notice changes through a cheap version query
+(max ``updated_at`` and row count of both tables) polled every
+CATALOG_VERSION_POLL_SECONDS; the snapshot is reloaded outright after
+CATALOG_CACHE_TTL_SECONDS regardless.
+"""
+
+import os
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.db.models.plan import Plan
+from app.db.models.tool import ToolDefinition
+
+CATALOG_CACHE_TTL_SECONDS = float(os.getenv("CATALOG_CACHE_TTL_SECONDS", "300"))
+CATALOG_VERSION_POLL_SECONDS = float(os.getenv("CATALOG_VERSION_POLL_SECONDS", "30"))
+
+
+@dataclass(frozen=True)
+class ToolInfo:
+    slug: str
+    category: str | None
+    weight: int
+    is_premium: bool
+
+
+@dataclass(frozen=True)
+class PlanInfo:
+    id: uuid.UUID
+    slug: str
+    name: str
+    daily_merge_limit: int
+
+
+@dataclass(frozen=True)
+class CatalogSnapshot:
+    version: tuple
+    loaded_at: float
+    tools: dict[str, ToolInfo] = field(default_factory=dict)
+    plans_by_id: dict[uuid.UUID, PlanInfo] = field(default_factory=dict)
+    plans_by_slug: dict[str, PlanInfo] = field(default_factory=dict)
+
+
+def _catalog_version(db: Session) -> tuple:
+    statement = select(
+        select(func.max(ToolDefinition.updated_at)).scalar_subquery(),
+        select(func.count(ToolDefinition.id)).scalar_subquery(),
+        select(func.max(Plan.updated_at)).scalar_subquery(),
+        select(func.count(Plan.id)).scalar_subquery(),
+    )
+    return tuple(db.execute(statement).one())
+
+
+class CatalogCache:
+    def __init__(
+        self,
+        ttl_seconds: float = CATALOG_CACHE_TTL_SECONDS,
+        poll_seconds: float = CATALOG_VERSION_POLL_SECONDS,
+    ) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.poll_seconds = poll_seconds
+        self._snapshot: CatalogSnapshot | None = None
+        self._checked_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session) -> CatalogSnapshot:
+        version = _catalog_version(db)
+        tools = {
+            tool.slug: ToolInfo(
+                slug=tool.slug,
+                category=tool.category,
+                weight=tool.weight,
+                is_premium=tool.is_premium,
+            )
+            for tool in db.query(ToolDefinition).all()
+        }
+        plans = [
+            PlanInfo(id=plan.id, slug=plan.slug, name=plan.name, daily_merge_limit=plan.daily_merge_limit)
+            for plan in db.query(Plan).all()
+        ]
+        return CatalogSnapshot(
+            version=version,
+            loaded_at=time.monotonic(),
+            tools=tools,
+            plans_by_id={plan.id: plan for plan in plans},
+            plans_by_slug={plan.slug: plan for plan in plans},
+        )
+
+    def snapshot(self, db: Session) -> CatalogSnapshot:
+        now = time.monotonic()
+        snapshot = self._snapshot
+        if snapshot and now - snapshot.loaded_at < self.ttl_seconds and now - self._checked_at < self.poll_seconds:
+            return snapshot
+
+        # The lock only guards the bookkeeping, never a query: this runs
+        # inside ``AsyncSession.run_sync`` on the event-loop thread, where
+        # each query yields to other requests that would then block on it.
+        with self._lock:
+            snapshot = self._snapshot
+            expired = snapshot is None or now - snapshot.loaded_at >= self.ttl_seconds
+            if snapshot is not None and self._refreshing:
+                # Another request is already checking; serve what we have.
+                return snapshot
+            self._refreshing = True
+        try:
+            if expired or _catalog_version(db) != snapshot.version:
+                snapshot = self._load(db)
+        except BaseException:
+            with self._lock:
+                self._refreshing = False
+            raise
+        with self._lock:
+            self._refreshing = False
+            current = self._snapshot
+            if current is None or current.loaded_at <= snapshot.loaded_at:
+                self._snapshot = snapshot
+                self._checked_at = now
+        return snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._snapshot = None
+
+    def tool(self, db: Session, slug: str) -> ToolInfo | None:
+        return self.snapshot(db).tools.get(slug)
+
+    def plan_by_id(self, db: Session, plan_id) -> PlanInfo | None:
+        snapshot = self.snapshot(db)
+        plan = snapshot.plans_by_id.get(plan_id)
+        if plan is None and time.monotonic() - snapshot.loaded_at >= 1.0:
+            # A subscription may point at a plan added since the last load.
+            self.invalidate()
+            plan = self.snapshot(db).plans_by_id.get(plan_id)
+        return plan
+
+    def plan_by_slug(self, db: Session, slug: str) -> PlanInfo | None:
+        return self.snapshot(db).plans_by_slug.get(slug)
+
+
+catalog = CatalogCache()
+
+__all__ = ["CatalogCache", "PlanInfo", "ToolInfo", "catalog"]
@@ -1,21 +1,30 @@
+import logging
 import os
+import threading
+import uuid
 from datetime import datetime, timedelta
 
 from fastapi import HTTPException, Request, status
+from sqlalchemy import delete, select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from app.db.models.plan import Plan
-from app.db.models.subscription import Subscription
-from app.db.models.tool import ToolDefinition
+from app.core.rate_limit import ANON_RATE_LIMIT_FLUSH_SECONDS, anon_limiter
 from app.db.models.usage import Usage
 from app.db.models.user import User
+from app.subscriptions.entitlements import entitlements
 from app.subscriptions.plans import DEFAULT_PLAN_SLUG, PLAN_DEFINITIONS
+from app.usage.catalog import ToolInfo, catalog
 
 USAGE_WINDOW_SECONDS = int(os.getenv("USAGE_WINDOW_SECONDS", str(60 * 60 * 24)))
 USAGE_RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", "30"))
+USAGE_CLEANUP_BATCH_SIZE = int(os.getenv("USAGE_CLEANUP_BATCH_SIZE", "5000"))
 ANON_DAILY_LIMIT = int(os.getenv("ANON_DAILY_LIMIT", "10"))
 LOGGED_IN_DAILY_LIMIT = int(os.getenv("LOGGED_IN_DAILY_LIMIT", "20"))
 
+logger = logging.getLogger("app.usage")
+
 
 def _default_plan_limit() -> int:
     for definition in PLAN_DEFINITIONS:
@@ -30,75 +39,183 @@ def _daily_window(now: datetime) -> tuple[datetime, datetime]:
     return start, end
 
 
-def _get_active_plan(db: Session, user_id) -> Plan | None:
-    subscription: Subscription | None = (
-        db.query(Subscription)
-        .filter(Subscription.user_id == user_id, Subscription.status == "active")
-        .order_by(Subscription.current_period_end.desc().nullslast())
-        .first()
-    )
-    if subscription:
-        plan = db.query(Plan).filter(Plan.id == subscription.plan_id).first()
-        if plan:
-            return plan
-    return db.query(Plan).filter(Plan.slug == DEFAULT_PLAN_SLUG).first()
-
+def _get_tool_definition(db: Session, tool: str) -> ToolInfo | None:
+    return catalog.tool(db, tool)
 
-def _get_tool_definition(db: Session, tool: str) -> ToolDefinition | None:
-    return db.query(ToolDefinition).filter(ToolDefinition.slug == tool).first()
 
-
-def _get_tool_weight(db: Session, tool: str) -> int:
-    definition = _get_tool_definition(db, tool)
+def _get_tool_weight(definition: ToolInfo | None) -> int:
     if definition and definition.weight > 0:
         return definition.weight
     return 1
 
 
-def _get_usage_record(
+def _consume_quota(
     db: Session,
     tool: str,
+    amount: int,
     limit: int,
     user_id=None,
     anon_key: str | None = None,
-    window_seconds: int = USAGE_WINDOW_SECONDS,
-) -> Usage:
+) -> int | None:
+    """Add ``amount`` to today's counter in one statement.
+
+    The row is created on first use; afterwards the conditional DO UPDATE
+    only applies while the new total stays within ``limit``, so concurrent
+    requests cannot both slip past the check. Returns the new total, or
+    None when the limit would be exceeded.
+    """
     now = datetime.utcnow()
     window_start, window_end = _daily_window(now)
-    query = db.query(Usage).filter(
-        Usage.tool == tool,
-        Usage.period_start == window_start,
-        Usage.period_end == window_end,
-    )
     if user_id is not None:
-        query = query.filter(Usage.user_id == user_id)
+        conflict_columns = [Usage.user_id, Usage.tool, Usage.period_start]
+        conflict_where = Usage.user_id.isnot(None)
     else:
-        query = query.filter(Usage.anon_key == anon_key)
-
-    record: Usage | None = query.order_by(Usage.period_end.desc()).first()
-
-    if record:
-        if record.limit_value != limit:
-            record.limit_value = limit
-            record.touch(now)
-            db.add(record)
-            db.commit()
-            db.refresh(record)
-        return record
-
-    record = Usage(
-        user_id=user_id,
-        anon_key=anon_key,
-        tool=tool,
-        period_start=window_start,
-        period_end=window_end,
-        used=0,
-        limit_value=limit,
+        conflict_columns = [Usage.anon_key, Usage.tool, Usage.period_start]
+        conflict_where = Usage.anon_key.isnot(None)
+
+    statement = (
+        pg_insert(Usage)
+        .values(
+            id=uuid.uuid4(),
+            user_id=user_id,
+            anon_key=anon_key,
+            tool=tool,
+            period_start=window_start,
+            period_end=window_end,
+            used=amount,
+            limit_value=limit,
+            created_at=now,
+            updated_at=now,
+        )
+        .on_conflict_do_update(
+            index_elements=conflict_columns,
+            index_where=conflict_where,
+            set_={
+                "used": Usage.used + amount,
+                "limit_value": limit,
+                "updated_at": now,
+            },
+            where=Usage.used + amount <= limit,
+        )
+        .returning(Usage.used)
     )
-    db.add(record)
+    used = db.execute(statement).scalar_one_or_none()
     db.commit()
-    db.refresh(record)
-    return record
+    return used
+
+
+def _anonymous_window() -> tuple[datetime, int]:
+    now = datetime.utcnow()
+    window_start, window_end = _daily_window(now)
+    return window_start, int((window_end - now).total_seconds()) + 60
+
+
+def _consume_anonymous_quota(tool: str, amount: int, limit: int, anon_key: str) -> int | None:
+    # Counted in memory; flush_anonymous_usage writes the totals to usage.
+    window_start, ttl_seconds = _anonymous_window()
+    return anon_limiter.consume(anon_key, tool, amount, limit, window_start, ttl_seconds=ttl_seconds)
+
+
+async def _consume_anonymous_quota_async(tool: str, amount: int, limit: int, anon_key: str) -> int | None:
+    window_start, ttl_seconds = _anonymous_window()
+    return await anon_limiter.consume_async(anon_key, tool, amount, limit, window_start, ttl_seconds=ttl_seconds)
+
+
+def flush_anonymous_usage(db: Session) -> int:
+    """Add the anonymous usage counted in memory to the usage table.
+
+    Returns the number of counters written. The stored totals, which
+    include other workers' flushes, are fed back into the local counters.
+    """
+    now = datetime.utcnow()
+    window_start, _ = _daily_window(now)
+    pending = anon_limiter.drain(window_start)
+    if not pending:
+        return 0
+
+    rows = [
+        {
+            "id": uuid.uuid4(),
+            "anon_key": item.anon_key,
+            "tool": item.tool,
+            "period_start": item.period_start,
+            "period_end": item.period_start + timedelta(days=1),
+            "used": item.amount,
+            "limit_value": item.limit,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for item in pending
+    ]
+    statement = pg_insert(Usage)
+    statement = statement.on_conflict_do_update(
+        index_elements=[Usage.anon_key, Usage.tool, Usage.period_start],
+        index_where=Usage.anon_key.isnot(None),
+        set_={
+            "used": Usage.used + statement.excluded.used,
+            "limit_value": statement.excluded.limit_value,
+            "updated_at": statement.excluded.updated_at,
+        },
+    ).returning(Usage.anon_key, Usage.tool, Usage.period_start, Usage.used)
+    try:
+        totals = db.execute(statement, rows).all()
+        db.commit()
+    except Exception:
+        db.rollback()
+        anon_limiter.restore(pending)
+        raise
+
+    for row in totals:
+        anon_limiter.observe(row.anon_key, row.tool, row.period_start, row.used)
+    anon_limiter.record_flush(len(rows))
+    return len(rows)
+
+
+def flush_anonymous_usage_loop(
+    session_factory,
+    stop: threading.Event,
+    interval_seconds: float = ANON_RATE_LIMIT_FLUSH_SECONDS,
+) -> None:
+    # Runs in every worker: each one holds its own unflushed counts. Once
+    # ``stop`` is set, a last flush runs before the loop exits.
+    while True:
+        stopping = stop.wait(interval_seconds)
+        try:
+            with session_factory() as db:
+                flush_anonymous_usage(db)
+        except Exception:
+            logger.exception("Flushing anonymous usage failed")
+        if stopping:
+            return
+
+
+def check_usage_constraints(db: Session) -> bool:
+    """Log an error when the unique indexes behind _consume_quota are missing.
+
+    ``create_all`` only builds them with a new table. Existing databases get
+    them from the one-off migration in db/supabase_schema.sql, which also
+    removes duplicate rows first; that is not done at startup.
+    """
+    expected = {index.name for index in Usage.__table__.indexes if index.unique}
+    present = set(
+        db.execute(
+            text(
+                """
+                SELECT class.relname
+                FROM pg_index AS index
+                JOIN pg_class AS class ON class.oid = index.indexrelid
+                WHERE index.indrelid = 'usage'::regclass AND index.indisvalid
+                """
+            )
+        ).scalars()
+    )
+    missing = sorted(expected - present)
+    if missing:
+        logger.error(
+            "usage is missing the unique indexes %s; run the usage migration in db/supabase_schema.sql",
+            ", ".join(missing),
+        )
+    return not missing
 
 
 def _normalize_ip(value: str) -> str:
@@ -129,98 +246,124 @@ def client_ip(request: Request) -> str:
     return "unknown"
 
 
-def increment_usage(
+def _resolve_quota(
     db: Session,
     request: Request,
     user: User | None,
     tool: str,
-    amount: int | None = None,
-    window_seconds: int = USAGE_WINDOW_SECONDS,
-) -> Usage:
+    amount: int | None,
+    units: int,
+) -> tuple[int, int, dict]:
+    """Check premium access and return the charge, the day's limit and the owner."""
     definition = _get_tool_definition(db, tool)
+    entitlement = entitlements.get(db, user.id, request) if user else None
+    plan = entitlement.plan if entitlement else None
     if definition and definition.is_premium:
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_402_PAYMENT_REQUIRED,
                 detail="This tool is available on paid plans. Please sign in and upgrade.",
             )
-        plan = _get_active_plan(db, user.id)
-        if not plan or plan.slug == DEFAULT_PLAN_SLUG:
+        if not entitlement.is_paid:
             raise HTTPException(
                 status_code=status.HTTP_402_PAYMENT_REQUIRED,
                 detail="This tool is available on paid plans. Please upgrade.",
             )
 
     if amount is None:
-        amount = _get_tool_weight(db, tool)
+        amount = _get_tool_weight(definition) * units
     if user:
-        plan = _get_active_plan(db, user.id)
         limit = plan.daily_merge_limit if plan else LOGGED_IN_DAILY_LIMIT
-        record = _get_usage_record(
-            db,
-            tool=tool,
-            limit=limit,
-            user_id=user.id,
-            window_seconds=window_seconds,
-        )
+        owner = {"user_id": user.id}
     else:
-        anon_key = f"anon:{client_ip(request)}"
-        record = _get_usage_record(
-            db,
-            tool=tool,
-            limit=ANON_DAILY_LIMIT,
-            anon_key=anon_key,
-            window_seconds=window_seconds,
-        )
+        limit = ANON_DAILY_LIMIT
+        owner = {"anon_key": f"anon:{client_ip(request)}"}
+    return amount, limit, owner
+
 
-    if record.used + amount > record.limit_value:
+def _check_used(used: int | None, user: User | None) -> int:
+    if used is None:
         detail = (
             "Daily limit reached. Sign in to get higher limits."
             if not user
             else "Daily limit reached for your plan. Upgrade to increase limits."
         )
         raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=detail)
+    return used
 
-    record.used += amount
-    record.touch(datetime.utcnow())
-    db.add(record)
-    db.commit()
-    db.refresh(record)
-    return record
+
+def increment_usage(
+    db: Session,
+    request: Request,
+    user: User | None,
+    tool: str,
+    amount: int | None = None,
+    window_seconds: int = USAGE_WINDOW_SECONDS,
+    units: int = 1,
+) -> int:
+    amount, limit, owner = _resolve_quota(db, request, user, tool, amount, units)
+    if amount > limit:
+        used = None
+    elif not user and anon_limiter.enabled:
+        used = _consume_anonymous_quota(tool, amount, limit, owner["anon_key"])
+    else:
+        used = _consume_quota(db, tool=tool, amount=amount, limit=limit, **owner)
+    return _check_used(used, user)
 
 
-def cleanup_usage_rows(db: Session) -> int:
-    cutoff = datetime.utcnow() - timedelta(days=USAGE_RETENTION_DAYS)
-    deleted = (
-        db.query(Usage)
-        .filter(Usage.period_end < cutoff)
-        .delete(synchronize_session=False)
+async def increment_usage_async(
+    db: AsyncSession,
+    request: Request,
+    user: User | None,
+    tool: str,
+    amount: int | None = None,
+    units: int = 1,
+) -> int:
+    # run_sync drives the same code over the async connection, so the
+    # queries no longer block the event loop. The anonymous counters are
+    # checked outside it: with Redis configured that is network I/O, which
+    # must be awaited rather than run on the event-loop thread.
+    amount, limit, owner = await db.run_sync(
+        lambda session: _resolve_quota(session, request, user, tool, amount, units)
     )
-    if deleted:
+    if amount > limit:
+        used = None
+    elif not user and anon_limiter.enabled:
+        used = await _consume_anonymous_quota_async(tool, amount, limit, owner["anon_key"])
+    else:
+        used = await db.run_sync(
+            lambda session: _consume_quota(session, tool=tool, amount=amount, limit=limit, **owner)
+        )
+    return _check_used(used, user)
+
+
+def _delete_usage_in_batches(db: Session, condition, batch_size: int) -> int:
+    # Each batch is its own short transaction, found through usage_period_end_idx.
+    deleted = 0
+    while True:
+        batch = select(Usage.id).where(condition).limit(batch_size)
+        result = db.execute(
+            delete(Usage).where(Usage.id.in_(batch)).execution_options(synchronize_session=False)
+        )
         db.commit()
-    return deleted or 0
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
 
 
-def cleanup_anonymous_usage_rows(db: Session) -> int:
+def cleanup_usage_rows(db: Session, batch_size: int = USAGE_CLEANUP_BATCH_SIZE) -> int:
+    cutoff = datetime.utcnow() - timedelta(days=USAGE_RETENTION_DAYS)
+    return _delete_usage_in_batches(db, Usage.period_end < cutoff, batch_size)
+
+
+def cleanup_anonymous_usage_rows(db: Session, batch_size: int = USAGE_CLEANUP_BATCH_SIZE) -> int:
     today_start, _ = _daily_window(datetime.utcnow())
-    deleted = (
-        db.query(Usage)
-        .filter(Usage.anon_key.isnot(None), Usage.period_end <= today_start)
-        .delete(synchronize_session=False)
+    return _delete_usage_in_batches(
+        db,
+        (Usage.period_end <= today_start) & Usage.anon_key.isnot(None),
+        batch_size,
     )
-    if deleted:
-        db.commit()
-    return deleted or 0
-
 
-def cleanup_usage_rows_loop(session_factory, sleep_seconds: int = 6 * 60 * 60) -> None:
-    import time
 
-    while True:
-        try:
-            with session_factory() as db:
-                cleanup_usage_rows(db)
-                cleanup_anonymous_usage_rows(db)
-        except Exception:
-            pass
-        time.sleep(sleep_seconds)
+def cleanup_usage(db: Session) -> int:
+    return cleanup_usage_rows(db) + cleanup_anonymous_usage_rows(db)
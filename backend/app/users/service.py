@@ -5,14 +5,20 @@ from __future__ import annotations
 from datetime import datetime, timedelta
 from typing import Iterable
 
+from sqlalchemy import delete, select
 from sqlalchemy.orm import Session
 
+from app.auth.user_cache import invalidate_user
+from app.db.models.file import FileRecord
+from app.db.models.job import PdfJob
 from app.db.models.plan import Plan
 from app.db.models.subscription import Subscription
 from app.db.models.usage import Usage
 from app.db.models.user import User
+from app.subscriptions.entitlements import entitlements
 
 DELETE_GRACE_DAYS = 30
+DELETE_BATCH_SIZE = 100
 
 
 def get_profile(user: User) -> dict:
@@ -42,6 +48,7 @@ def update_profile(db: Session, user: User, full_name: str | None = None, email:
 		db.add(user)
 		db.commit()
 		db.refresh(user)
+		invalidate_user(user.id)
 	return user
 
 
@@ -59,6 +66,7 @@ def request_account_deletion(db: Session, user: User) -> dict:
 	db.add(user)
 	db.commit()
 	db.refresh(user)
+	invalidate_user(user.id)
 
 	return {
 		"delete_requested_at": user.delete_requested_at,
@@ -79,6 +87,7 @@ def cancel_account_deletion(db: Session, user: User) -> dict:
 	db.add(user)
 	db.commit()
 	db.refresh(user)
+	invalidate_user(user.id)
 	return {
 		"delete_requested_at": None,
 		"delete_at": None,
@@ -151,32 +160,35 @@ def get_subscription_summary(db: Session, user: User) -> dict:
 	}
 
 
-def cleanup_deleted_users(db: Session) -> int:
+def cleanup_deleted_users(db: Session, batch_size: int = DELETE_BATCH_SIZE) -> int:
 	cutoff = datetime.utcnow() - timedelta(days=DELETE_GRACE_DAYS)
-	to_delete = (
-		db.query(User)
-		.filter(User.delete_requested_at.isnot(None), User.delete_requested_at < cutoff)
-		.all()
-	)
 	count = 0
-	for user in to_delete:
-		count += 1
-		db.delete(user)
-	if count:
-		db.commit()
-	return count
-
-
-def cleanup_deleted_users_loop(session_factory, sleep_seconds: int = 6 * 60 * 60) -> None:
-	import time
-
 	while True:
-		try:
-			with session_factory() as db:
-				cleanup_deleted_users(db)
-		except Exception:
-			pass
-		time.sleep(sleep_seconds)
+		user_ids = list(
+			db.execute(
+				select(User.id)
+				.where(User.delete_requested_at.isnot(None), User.delete_requested_at < cutoff)
+				.order_by(User.delete_requested_at)
+				.limit(batch_size)
+				.with_for_update(skip_locked=True)
+			).scalars()
+		)
+		if not user_ids:
+			return count
+		# Dependent rows go first, so this works whether or not the foreign
+		# keys cascade.
+		for model in (Usage, FileRecord, PdfJob, Subscription):
+			db.execute(
+				delete(model).where(model.user_id.in_(user_ids)).execution_options(synchronize_session=False)
+			)
+		db.execute(delete(User).where(User.id.in_(user_ids)).execution_options(synchronize_session=False))
+		db.commit()
+		for user_id in user_ids:
+			entitlements.invalidate(user_id)
+			invalidate_user(user_id)
+		count += len(user_ids)
+		if len(user_ids) < batch_size:
+			return count
 
 
 __all__ = [
@@ -186,5 +198,5 @@ __all__ = [
 	"cancel_account_deletion",
 	"get_usage_summary",
 	"get_subscription_summary",
-	"cleanup_deleted_users_loop",
+	"cleanup_deleted_users",
 ]
@@ -0,0 +1,154 @@
+"""Content-addressed cache of tool outputs.
+
+Entries live in ``temp_outputs/cache`` and are keyed by the SHA-256 of the
+input bytes (in order), the tool slug and its parameters, so re-submitting
+the same file with the same options returns the stored output without
+running the tool again. Each entry is an output file plus a small JSON file
+holding the tool's result dict. Hits refresh the entry's mtime, which makes
+``prune`` an LRU eviction bounded by age and total size.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from pathlib import Path
+
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "1").lower() in {"1", "true", "yes"}
+RESULT_CACHE_DIR = Path(os.getenv("RESULT_CACHE_DIR", "temp_outputs/cache"))
+RESULT_CACHE_MAX_MB = int(os.getenv("RESULT_CACHE_MAX_MB", "512"))
+RESULT_CACHE_TTL_SECONDS = int(os.getenv("RESULT_CACHE_TTL_SECONDS", str(60 * 60 * 24)))
+
+# Bump when a change to the tools alters their output for the same inputs.
+CACHE_VERSION = 1
+
+
+class ResultCache:
+    def __init__(
+        self,
+        directory: str | Path = RESULT_CACHE_DIR,
+        max_bytes: int = RESULT_CACHE_MAX_MB * 1024 * 1024,
+        ttl_seconds: int = RESULT_CACHE_TTL_SECONDS,
+        enabled: bool = RESULT_CACHE_ENABLED,
+    ) -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    @staticmethod
+    def key(tool: str, input_hashes: list[str], params: dict | None = None) -> str:
+        payload = json.dumps(
+            {"v": CACHE_VERSION, "tool": tool, "inputs": input_hashes, "params": params or {}},
+            sort_keys=True,
+            separators=(",", ":"),
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _paths(self, key: str) -> tuple[Path, Path]:
+        return self.directory / f"{key}.out", self.directory / f"{key}.json"
+
+    def fetch(self, key: str, destination: str | Path) -> dict | None:
+        """Place the cached output for ``key`` at ``destination``.
+
+        Returns the stored result dict, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+        output, meta = self._paths(key)
+        try:
+            result = json.loads(meta.read_text(encoding="utf-8"))
+            _link_or_copy(output, Path(destination))
+            now = time.time()
+            os.utime(output, (now, now))
+            os.utime(meta, (now, now))
+        except (OSError, ValueError):
+            with self._lock:
+                self._misses += 1
+            return None
+        with self._lock:
+            self._hits += 1
+        return result
+
+    def store(self, key: str, source: str | Path, result: dict) -> None:
+        """Add ``source`` to the cache; failures only cost a future miss."""
+        if not self.enabled:
+            return
+        output, meta = self._paths(key)
+        token = uuid.uuid4().hex
+        staged_output = self.directory / f".{key}.{token}.out"
+        staged_meta = self.directory / f".{key}.{token}.json"
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(Path(source), staged_output)
+            staged_meta.write_text(json.dumps(result), encoding="utf-8")
+            # Output first: a reader only trusts an entry once its JSON exists.
+            os.replace(staged_output, output)
+            os.replace(staged_meta, meta)
+        except OSError:
+            staged_output.unlink(missing_ok=True)
+            staged_meta.unlink(missing_ok=True)
+
+    def prune(self) -> int:
+        """Drop expired entries, then the least recently used beyond max_bytes."""
+        if not self.directory.is_dir():
+            return 0
+        now = time.time()
+        entries: list[tuple[float, int, Path]] = []
+        for entry in self.directory.iterdir():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.startswith("."):
+                # Leftovers from a store() that died halfway.
+                if stat.st_mtime < now - 60 * 60:
+                    entry.unlink(missing_ok=True)
+                continue
+            if entry.suffix == ".out":
+                entries.append((stat.st_mtime, stat.st_size, entry))
+
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for mtime, size, output in entries:
+            if mtime >= now - self.ttl_seconds and total <= self.max_bytes:
+                break
+            output.with_suffix(".json").unlink(missing_ok=True)
+            output.unlink(missing_ok=True)
+            total -= size
+            removed += 1
+        with self._lock:
+            self._evictions += removed
+        return removed
+
+    def metrics(self) -> dict:
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+            }
+
+
+def _link_or_copy(source: Path, destination: Path) -> None:
+    # A hard link costs no space and no copy; fall back when the
+    # destination is on another filesystem.
+    destination.unlink(missing_ok=True)
+    try:
+        os.link(source, destination)
+    except OSError:
+        shutil.copyfile(source, destination)
+
+
+result_cache = ResultCache()
+
+__all__ = ["ResultCache", "result_cache"]
@@ -1,11 +1,30 @@
+import hashlib
+import shutil
 import time
+import uuid
+from dataclasses import dataclass
 from pathlib import Path
 from typing import BinaryIO
 
+from fastapi import UploadFile
+
+from app.utils.result_cache import result_cache
+
 UPLOAD_DIR = Path("temp_uploads")
 OUTPUT_DIR = Path("temp_outputs")
 MAX_FILE_AGE_SECONDS = 10 * 60
-SLEEP_INTERVAL_SECONDS = 5 * 60
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class UploadTooLargeError(Exception):
+    """Raised by spool_upload once an upload crosses its byte limit."""
+
+
+@dataclass(frozen=True)
+class SpooledUpload:
+    path: Path
+    size: int
+    sha256: str
 
 
 def ensure_dir(path: str | Path) -> Path:
@@ -25,10 +44,48 @@ def save_stream(directory: str | Path, filename: str, stream: BinaryIO) -> Path:
     dir_path = ensure_dir(directory)
     file_path = dir_path / filename
     with open(file_path, "wb") as handle:
-        handle.write(stream.read())
+        shutil.copyfileobj(stream, handle, UPLOAD_CHUNK_SIZE)
     return file_path
 
 
+async def spool_upload(
+    upload: UploadFile,
+    directory: str | Path = UPLOAD_DIR,
+    max_bytes: int | None = None,
+    suffix: str = "",
+    chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> SpooledUpload:
+    """Stream an upload to disk in fixed-size chunks.
+
+    At most one chunk is held in memory. The limit is checked as chunks
+    arrive, so an oversized upload is rejected (and the partial file
+    removed) as soon as it crosses ``max_bytes``.
+    """
+    file_size = getattr(upload, "size", None)
+    if max_bytes is not None and file_size is not None and file_size > max_bytes:
+        raise UploadTooLargeError(file_size)
+
+    file_path = ensure_dir(directory) / f"{uuid.uuid4()}{suffix}"
+    digest = hashlib.sha256()
+    written = 0
+    try:
+        with open(file_path, "wb") as handle:
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+                written += len(chunk)
+                if max_bytes is not None and written > max_bytes:
+                    raise UploadTooLargeError(written)
+                digest.update(chunk)
+                handle.write(chunk)
+    except BaseException:
+        file_path.unlink(missing_ok=True)
+        raise
+
+    return SpooledUpload(path=file_path, size=written, sha256=digest.hexdigest())
+
+
 def delete_file(path: str | Path) -> bool:
     target = Path(path)
     if not target.exists() or not target.is_file():
@@ -37,20 +94,30 @@ def delete_file(path: str | Path) -> bool:
     return True
 
 
-def cleanup_old_files() -> None:
-    """Remove temporary files older than MAX_FILE_AGE_SECONDS."""
-    while True:
-        cutoff_ts = time.time() - MAX_FILE_AGE_SECONDS
-        for directory in (UPLOAD_DIR, OUTPUT_DIR):
-            directory.mkdir(parents=True, exist_ok=True)
-            for entry in directory.iterdir():
-                if not entry.is_file():
-                    continue
-                try:
-                    if entry.stat().st_mtime < cutoff_ts:
-                        entry.unlink(missing_ok=False)
-                except FileNotFoundError:
-                    continue
-                except OSError:
-                    continue
-        time.sleep(SLEEP_INTERVAL_SECONDS)
+def cleanup_old_files() -> int:
+    """Remove temporary files older than MAX_FILE_AGE_SECONDS.
+
+    Returns the number of files removed. The result cache under OUTPUT_DIR
+    has its own age and size bounds, so it is skipped here and pruned
+    separately.
+    """
+    removed = 0
+    cutoff_ts = time.time() - MAX_FILE_AGE_SECONDS
+    for directory in (UPLOAD_DIR, OUTPUT_DIR):
+        directory.mkdir(parents=True, exist_ok=True)
+        for entry in directory.iterdir():
+            if not entry.is_file():
+                continue
+            try:
+                if entry.stat().st_mtime < cutoff_ts:
+                    entry.unlink(missing_ok=False)
+                    removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError:
+                continue
+    try:
+        result_cache.prune()
+    except OSError:
+        pass
+    return removed
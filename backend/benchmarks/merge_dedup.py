@@ -0,0 +1,113 @@
+"""Measure stream deduplication when merging exports of one template.
+
+Run from the backend directory:
+
+    python -m benchmarks.merge_dedup [--sizes 2,10,50] [--logo-kb 256] [--font-kb 128]
+
+Every generated document embeds the same logo image, font program and ICC
+profile, plus a page of text unique to that document, which is the shape of
+invoices or certificates exported from a single template.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+import zlib
+
+from pypdf import PdfWriter
+from pypdf.generic import ArrayObject, DecodedStreamObject, DictionaryObject, NameObject, NumberObject, StreamObject
+
+from app.tools.pdf.operations import merge_documents
+
+
+def _stream(data: bytes, **entries) -> StreamObject:
+    stream = DecodedStreamObject()
+    stream.set_data(data)
+    for key, value in entries.items():
+        stream[NameObject(f"/{key}")] = value
+    return stream
+
+
+def _template_resources(logo_kb: int, font_kb: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    side = max(8, int((logo_kb * 1024 / 3) ** 0.5))
+    return {
+        "logo": zlib.compress(rng.randbytes(side * side * 3)),
+        "side": side,
+        "font": rng.randbytes(font_kb * 1024),
+        "icc": rng.randbytes(3 * 1024),
+    }
+
+
+def _make_pdf(path: str, template: dict, index: int) -> None:
+    writer = PdfWriter()
+    page = writer.add_blank_page(612, 792)
+
+    icc = writer._add_object(_stream(template["icc"], N=NumberObject(3), Alternate=NameObject("/DeviceRGB")))
+    logo = _stream(
+        template["logo"],
+        Type=NameObject("/XObject"),
+        Subtype=NameObject("/Image"),
+        Width=NumberObject(template["side"]),
+        Height=NumberObject(template["side"]),
+        ColorSpace=ArrayObject([NameObject("/ICCBased"), icc]),
+        BitsPerComponent=NumberObject(8),
+        Filter=NameObject("/FlateDecode"),
+    )
+    font_file = _stream(template["font"], Length1=NumberObject(len(template["font"])))
+    descriptor = DictionaryObject({
+        NameObject("/Type"): NameObject("/FontDescriptor"),
+        NameObject("/FontName"): NameObject("/TemplateSans"),
+        NameObject("/FontFile2"): writer._add_object(font_file),
+    })
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/TrueType"),
+        NameObject("/BaseFont"): NameObject("/TemplateSans"),
+        NameObject("/FontDescriptor"): writer._add_object(descriptor),
+    })
+    page[NameObject("/Resources")] = DictionaryObject({
+        NameObject("/XObject"): DictionaryObject({NameObject("/Logo"): writer._add_object(logo)}),
+        NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)}),
+    })
+    content = f"q 120 0 0 120 40 640 cm /Logo Do Q BT /F1 12 Tf 40 600 Td (Document {index}) Tj ET"
+    page[NameObject("/Contents")] = writer._add_object(_stream(content.encode("ascii")))
+    with open(path, "wb") as handle:
+        writer.write(handle)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="2,10,50")
+    parser.add_argument("--logo-kb", type=int, default=256)
+    parser.add_argument("--font-kb", type=int, default=128)
+    args = parser.parse_args()
+
+    sizes = [int(value) for value in args.sizes.split(",") if value.strip()]
+    template = _template_resources(args.logo_kb, args.font_kb, seed=1)
+    with tempfile.TemporaryDirectory() as workdir:
+        sources = []
+        for index in range(max(sizes)):
+            path = os.path.join(workdir, f"export-{index}.pdf")
+            _make_pdf(path, template, index)
+            sources.append(path)
+
+        print(f"{'files':>5} {'dedupe':>6} {'seconds':>8} {'output MB':>10} {'duplicates':>10} {'ratio':>6}")
+        for count in sizes:
+            for dedupe in (False, True):
+                output_path = os.path.join(workdir, f"merged-{count}-{int(dedupe)}.pdf")
+                started = time.perf_counter()
+                result = merge_documents(sources[:count], output_path, dedupe=dedupe)
+                elapsed = time.perf_counter() - started
+                stats = result.get("dedup", {})
+                print(
+                    f"{count:>5} {'on' if dedupe else 'off':>6} {elapsed:>8.2f} "
+                    f"{os.path.getsize(output_path) / (1024 * 1024):>10.2f} "
+                    f"{stats.get('duplicates', 0):>10} {stats.get('ratio', 0.0):>6.2f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
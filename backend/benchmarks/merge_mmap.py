@@ -0,0 +1,105 @@
+"""Compare peak RSS and wall time of merge_documents with and without mmap.
+
+Run from the backend directory:
+
+    python -m benchmarks.merge_mmap [--sizes 1,10,50] [--page-kb 256]
+
+Every case runs in a fresh interpreter so ru_maxrss reflects that case only.
+Peak RSS also counts file pages touched through the mapping, so the Python
+heap peak (tracemalloc, measured in a second pass) is reported as well; that
+is where the BytesIO copy made by ``PdfReader(path)`` shows up.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, NameObject
+
+PAGES_PER_FILE = 4
+
+
+def _make_pdf(path: str, page_kb: int) -> None:
+    writer = PdfWriter()
+    alphabet = string.ascii_letters + string.digits
+    for _ in range(PAGES_PER_FILE):
+        page = writer.add_blank_page(612, 792)
+        # Incompressible text keeps the file size close to page_kb per page.
+        text = "".join(random.choices(alphabet, k=page_kb * 1024))
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 8 Tf 10 10 Td ({text}) Tj ET".encode("ascii"))
+        page[NameObject("/Contents")] = writer._add_object(content)
+    with open(path, "wb") as handle:
+        writer.write(handle)
+
+
+def _run_case(mode: str, paths: list[str], output_path: str) -> None:
+    from app.tools.pdf.operations import merge_documents
+
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    merge_documents(paths, output_path, use_mmap=mode == "mmap")
+    elapsed = time.perf_counter() - started
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    tracemalloc.start()
+    merge_documents(paths, output_path, use_mmap=mode == "mmap")
+    _, heap_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(json.dumps({
+        "seconds": elapsed,
+        "peak_rss_kb": peak,
+        "baseline_rss_kb": baseline,
+        "heap_peak_kb": heap_peak // 1024,
+    }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="1,10,50")
+    parser.add_argument("--page-kb", type=int, default=256)
+    parser.add_argument("--case", nargs="+", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        mode, output_path, *paths = args.case
+        _run_case(mode, paths, output_path)
+        return
+
+    sizes = [int(value) for value in args.sizes.split(",") if value.strip()]
+    with tempfile.TemporaryDirectory() as workdir:
+        sources = []
+        for index in range(max(sizes)):
+            path = os.path.join(workdir, f"input-{index}.pdf")
+            _make_pdf(path, args.page_kb)
+            sources.append(path)
+        input_mb = os.path.getsize(sources[0]) / (1024 * 1024)
+
+        print(f"{'files':>5} {'input MB':>9} {'mode':>6} {'seconds':>8} {'peak RSS MB':>12} {'heap peak MB':>13}")
+        for count in sizes:
+            for mode in ("path", "mmap"):
+                output_path = os.path.join(workdir, f"merged-{mode}-{count}.pdf")
+                completed = subprocess.run(
+                    [sys.executable, "-m", "benchmarks.merge_mmap", "--case", mode, output_path, *sources[:count]],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                )
+                result = json.loads(completed.stdout.strip().splitlines()[-1])
+                print(
+                    f"{count:>5} {input_mb * count:>9.1f} {mode:>6} {result['seconds']:>8.2f} "
+                    f"{result['peak_rss_kb'] / 1024:>12.1f} {result['heap_peak_kb'] / 1024:>13.1f}"
+                )
+
+
+if __name__ == "__main__":
+    main()
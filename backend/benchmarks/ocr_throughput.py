@@ -0,0 +1,90 @@
+"""Measure OCR throughput on a generated corpus of scanned pages.
+
+Run from the backend directory:
+
+    python -m benchmarks.ocr_throughput [--pages 16] [--workers 1,2,4] [--dpi 300]
+
+Every page is a rendered image of a few paragraphs of text with no text
+layer, which is what a flatbed scanner or a phone scan produces. For each
+worker count the whole corpus is OCRed once and pages per second, both in
+total and per worker process, are reported. Requires pypdfium2, pytesseract
+and the tesseract binary.
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from PIL import Image, ImageDraw, ImageFont
+
+from app.tools.pdf.engine import PdfEngine
+from app.tools.pdf.ocr import OCR_PAGE_TIMEOUT_SECONDS, ocr_available, run_ocr
+
+WORDS = (
+    "invoice payment total amount due account number customer reference date "
+    "order delivery address quantity price tax subtotal balance contract terms "
+    "signature report summary section table figure results page document"
+).split()
+
+
+def _scan(index: int, dpi: int, rng: random.Random) -> Image.Image:
+    width, height = int(8.5 * dpi), int(11 * dpi)
+    image = Image.new("L", (width, height), 255)
+    draw = ImageDraw.Draw(image)
+    size = max(12, dpi // 6)
+    try:
+        font = ImageFont.load_default(size=size)
+    except TypeError:
+        font = ImageFont.load_default()
+    margin = dpi
+    draw.text((margin, margin), f"Document page {index + 1}", fill=0, font=font)
+    y = margin + size * 3
+    while y < height - margin:
+        line = " ".join(rng.choice(WORDS) for _ in range(10))
+        draw.text((margin, y), line, fill=0, font=font)
+        y += int(size * 1.6)
+    return image
+
+
+def _make_corpus(path: str, pages: int, dpi: int) -> None:
+    rng = random.Random(1)
+    images = [_scan(index, dpi, rng) for index in range(pages)]
+    images[0].save(path, save_all=True, append_images=images[1:], resolution=dpi)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--pages", type=int, default=16)
+    parser.add_argument("--workers", default=f"1,2,{os.cpu_count() or 1}")
+    parser.add_argument("--dpi", type=int, default=300)
+    args = parser.parse_args()
+
+    if not ocr_available():
+        print("OCR is not available: install pypdfium2, pytesseract and tesseract.")
+        return
+
+    worker_counts = sorted({int(value) for value in args.workers.split(",") if value.strip()})
+    with tempfile.TemporaryDirectory() as workdir:
+        source = os.path.join(workdir, "scanned.pdf")
+        _make_corpus(source, args.pages, args.dpi)
+
+        print(f"{'workers':>7} {'seconds':>8} {'pages/s':>8} {'pages/s/core':>12}")
+        for workers in worker_counts:
+            engine = PdfEngine(mode="process", workers=workers, timeout=OCR_PAGE_TIMEOUT_SECONDS)
+            try:
+                # Start the pool outside the timed run.
+                engine.run_blocking(os.getpid)
+                output_path = os.path.join(workdir, f"ocr-{workers}.pdf")
+                started = time.perf_counter()
+                result = run_ocr(source, output_path, dpi=args.dpi, engine=engine)
+                elapsed = time.perf_counter() - started
+            finally:
+                engine.shutdown()
+            rate = result["ocr_pages"] / elapsed
+            print(f"{workers:>7} {elapsed:>8.2f} {rate:>8.2f} {rate / workers:>12.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,9 @@ ALTER TABLE public.users
     ADD COLUMN IF NOT EXISTS delete_requested_at TIMESTAMPTZ,
     ADD COLUMN IF NOT EXISTS deleted_at TIMESTAMPTZ;
 
+CREATE INDEX IF NOT EXISTS users_delete_requested_at_idx
+    ON public.users(delete_requested_at) WHERE delete_requested_at IS NOT NULL;
+
 CREATE TABLE IF NOT EXISTS public.plans (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     slug TEXT UNIQUE NOT NULL,
@@ -69,6 +72,31 @@ CREATE INDEX IF NOT EXISTS usage_anon_key_idx ON public.usage(anon_key);
 CREATE INDEX IF NOT EXISTS usage_user_tool_idx ON public.usage(user_id, tool);
 CREATE INDEX IF NOT EXISTS usage_period_end_idx ON public.usage(period_end);
 
+-- One counter per owner, tool and day; the quota upsert relies on these.
+-- One-off migration for databases created before the indexes existed: rows
+-- duplicated by the old read-modify-write path are folded into one (keeping
+-- the highest count) first. Run this file with autocommit (psql's default):
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block. If a
+-- build fails it leaves an INVALID index behind; drop it and run again.
+DELETE FROM public.usage AS duplicate
+USING public.usage AS kept
+WHERE duplicate.user_id IS NOT NULL
+  AND duplicate.user_id = kept.user_id
+  AND duplicate.tool = kept.tool
+  AND duplicate.period_start = kept.period_start
+  AND (duplicate.used, duplicate.id::text) < (kept.used, kept.id::text);
+DELETE FROM public.usage AS duplicate
+USING public.usage AS kept
+WHERE duplicate.anon_key IS NOT NULL
+  AND duplicate.anon_key = kept.anon_key
+  AND duplicate.tool = kept.tool
+  AND duplicate.period_start = kept.period_start
+  AND (duplicate.used, duplicate.id::text) < (kept.used, kept.id::text);
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS usage_user_tool_period_key
+    ON public.usage(user_id, tool, period_start) WHERE user_id IS NOT NULL;
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS usage_anon_tool_period_key
+    ON public.usage(anon_key, tool, period_start) WHERE anon_key IS NOT NULL;
+
 CREATE TABLE IF NOT EXISTS public.files (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     user_id UUID NOT NULL REFERENCES public.users(id) ON DELETE CASCADE,
@@ -80,3 +108,31 @@ CREATE TABLE IF NOT EXISTS public.files (
 
 CREATE INDEX IF NOT EXISTS files_user_id_idx ON public.files(user_id);
 CREATE INDEX IF NOT EXISTS files_tool_idx ON public.files(tool);
+
+CREATE TABLE IF NOT EXISTS public.pdf_jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    user_id UUID REFERENCES public.users(id) ON DELETE CASCADE,
+    tool TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'queued',
+    progress INTEGER NOT NULL DEFAULT 0,
+    params JSONB NOT NULL DEFAULT '{}'::jsonb,
+    input_paths JSONB NOT NULL DEFAULT '[]'::jsonb,
+    output_name TEXT NOT NULL,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMPTZ,
+    finished_at TIMESTAMPTZ,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS pdf_jobs_user_id_idx ON public.pdf_jobs(user_id);
+CREATE INDEX IF NOT EXISTS pdf_jobs_status_created_idx ON public.pdf_jobs(status, created_at);
+
+-- Last completed run of each cluster-wide cleanup task (app.core.scheduler).
+CREATE TABLE IF NOT EXISTS public.scheduler_runs (
+    name TEXT PRIMARY KEY,
+    finished_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    removed INTEGER NOT NULL DEFAULT 0,
+    duration_ms INTEGER NOT NULL DEFAULT 0
+);
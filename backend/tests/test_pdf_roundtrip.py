@@ -0,0 +1,69 @@
+"""Outputs of merge and compress must reopen and every image must decode.
+
+Deduplication and image recompression work on pypdf writer internals
+(``_objects``, ``_replace_object``, stream ``_data``). pypdf is pinned for
+that; these tests are what catches an upgrade that changes how the writer
+stores or writes objects.
+"""
+
+import os
+
+import pytest
+from PIL import Image
+from pypdf import PdfReader
+
+from app.tools.pdf.operations import compress_document, compress_to_target, merge_documents
+
+
+def _photo(size: int, seed: int) -> Image.Image:
+	# Noise does not compress, so recompression has something to win.
+	return Image.effect_noise((size, size), 60 + seed).convert("RGB")
+
+
+@pytest.fixture
+def source_pdf(tmp_path) -> str:
+	path = str(tmp_path / "source.pdf")
+	pages = [_photo(1600, seed) for seed in range(3)]
+	# 300 dpi, so the balanced level downsamples them.
+	pages[0].save(path, "PDF", save_all=True, append_images=pages[1:], resolution=300, quality=95)
+	return path
+
+
+def _assert_images_decode(path: str) -> int:
+	reader = PdfReader(path)
+	count = 0
+	for page in reader.pages:
+		for image in page.images:
+			image.image.load()
+			count += 1
+	assert count > 0
+	return count
+
+
+def test_merge_deduplicates_and_reopens(source_pdf, tmp_path):
+	output = str(tmp_path / "merged.pdf")
+	result = merge_documents([source_pdf, source_pdf], output, use_mmap=False, dedupe=True)
+
+	assert result["pages"] == 6
+	assert result["dedup"]["bytes_saved"] > 0
+	assert len(PdfReader(output).pages) == 6
+	assert _assert_images_decode(output) == 6
+	# The second copy's images are shared with the first, not written again.
+	assert os.path.getsize(output) < 1.5 * os.path.getsize(source_pdf)
+
+
+@pytest.mark.parametrize("level", ["balanced", "strong"])
+def test_compress_recompresses_images_and_reopens(source_pdf, tmp_path, level):
+	output = str(tmp_path / f"{level}.pdf")
+	result = compress_document(source_pdf, output, level=level, use_mmap=False)
+
+	assert result["pages"] == 3
+	assert os.path.getsize(output) < os.path.getsize(source_pdf)
+	assert _assert_images_decode(output) == 3
+
+
+def test_compress_to_target_reopens(source_pdf, tmp_path):
+	output = str(tmp_path / "target.pdf")
+	compress_to_target(source_pdf, output, target_bytes=os.path.getsize(source_pdf) // 4, use_mmap=False)
+
+	assert _assert_images_decode(output) == 3
@@ -0,0 +1,28 @@
+"""Standalone PDF job worker.
+
+Run from the backend directory so ``app`` is importable:
+
+    python -m workers.pdf_jobs
+
+Set ``PDF_JOB_WORKERS_INLINE=0`` on the web processes when dedicated workers
+are deployed so the two can be scaled independently.
+"""
+
+import logging
+import signal
+import threading
+
+from app.db.session import SessionLocal
+from app.tools.pdf.jobs import run_worker
+
+
+def main() -> None:
+    logging.basicConfig(level=logging.INFO)
+    stop_event = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop_event.set())
+    signal.signal(signal.SIGINT, lambda *_: stop_event.set())
+    run_worker(SessionLocal, in_process=True, stop_event=stop_event)
+
+
+if __name__ == "__main__":
+    main()